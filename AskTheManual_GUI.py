@@ -4,13 +4,27 @@ import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 from pathlib import Path
 import threading
-import re
+import time
+from collections import OrderedDict
 from PIL import Image, ImageTk
 from unified_extraction_review import PdfProcessor
+from review_images import ImagePrefetcher, ThumbnailLoader, THUMBNAIL_SIZE
+from document_manifest import load_document, apply_insertions, write_document
+from pipeline_metrics import ProgressRate, record_span, start_metrics_server
+
+# Max. PhotoImages, die das Karussell im Speicher hält
+PHOTO_CACHE_SIZE = 12
+# Ab so vielen Bildern startet die Review direkt in der Rasteransicht
+GRID_VIEW_THRESHOLD = 150
+GRID_PAD = 8
+GRID_CELL_W = THUMBNAIL_SIZE + 2 * GRID_PAD
+GRID_CELL_H = THUMBNAIL_SIZE + 2 * GRID_PAD + 20
 
 # Try import AI module
 try:
-    from image_to_information import enrich_file
+    from image_to_information import enrich_file, OPENAI_API_KEY
+    from vision_backends import make_backend, VISION_BACKENDS
+    from enrichment_planner import estimate_enrichment, format_estimate
     AI_AVAILABLE = True
 except ImportError:
     AI_AVAILABLE = False
@@ -36,19 +50,60 @@ class ReviewApp(tb.Window):
         self.current_image_index = 0
         self.deleted_indices = set()
         self.decided_indices = set()
-        self.cached_images = {} # index -> ImageTk
+        self.cached_images = OrderedDict() # index -> ImageTk (LRU, max PHOTO_CACHE_SIZE)
+        self.prefetcher = None
+        
+        # Grid review state
+        self.thumb_loader = None
+        self.grid_selected = set()
+        self.grid_anchor = None
+        self.grid_photos = {} # index -> ImageTk, only for the visible rows
+        self.grid_cols = 1
+        self._grid_render_pending = False
         
         # Data for Step 2
         self.final_image_paths = [] # List of (relative_path, absolute_path) for Step 2
         self.manual_descriptions = {} # path -> description text
         self.current_step2_index = 0
-        
+        self._review_started = None
+
+        # Spans/Zähler der Pipeline als Prometheus-Text (http://127.0.0.1:9464/metrics)
+        start_metrics_server()
         self.create_start_screen()
 
     def clear_window(self):
         for widget in self.winfo_children():
             widget.destroy()
 
+    def progress_updater(self, bar, label, unit=None):
+        """
+        Returns a progress_callback(current, total, message) for worker threads that turns the
+        bar determinate and shows rate and ETA. Without unit, the message's first word is the
+        unit; a new unit or total (e.g. pages -> images) starts a new measurement.
+        """
+        state = {"tracker": None, "last": time.perf_counter()}
+
+        def callback(current, total, message):
+            now = time.perf_counter()
+            name = unit or (message.split() or ["items"])[0]
+            tracker = state["tracker"]
+            if tracker is None or tracker.unit != name or tracker.total != total:
+                tracker = state["tracker"] = ProgressRate(total, name, started=state["last"])
+            tracker.update(current, now)
+            state["last"] = now
+            text = tracker.format()
+
+            def _update():
+                if not bar.winfo_exists():
+                    return
+                if str(bar.cget("mode")) != "determinate":
+                    bar.stop()
+                    bar.config(mode="determinate")
+                bar.config(maximum=max(1, total), value=current)
+                label.config(text=text)
+            self.after(0, _update)
+        return callback
+
     # --- SCREEN 1: START ---
     def create_start_screen(self):
         self.clear_window()
@@ -73,6 +128,11 @@ class ReviewApp(tb.Window):
         
         tb.Button(file_frame, text="Refresh", command=self.refresh_files, bootstyle="outline").pack(side=LEFT, padx=5)
 
+        # Tables/OCR only run on pages the pre-scan flags, unless forced here
+        self.force_full_var = tk.BooleanVar(value=False)
+        tb.Checkbutton(container, text="Force full pipeline (table structure + OCR on every page)",
+                       variable=self.force_full_var, bootstyle="round-toggle").pack(pady=5)
+
         self.start_btn = tb.Button(container, text="Start Processing", command=self.start_processing, bootstyle="success", width=20)
         self.start_btn.pack(pady=40)
         
@@ -103,20 +163,30 @@ class ReviewApp(tb.Window):
         self.progress_bar.start(10)
         self.error_label.config(text="")
         
-        threading.Thread(target=self.run_processing_thread, args=(filename,), daemon=True).start()
+        force_full = self.force_full_var.get()
+        threading.Thread(target=self.run_processing_thread, args=(filename, force_full), daemon=True).start()
 
-    def run_processing_thread(self, filename):
+    def run_processing_thread(self, filename, force_full=False):
+        self.close_review_loaders()
         try:
-            self.processor = PdfProcessor(filename)
-            self.temp_dir, self.image_count = self.processor.process_phase_1()
+            self.processor = PdfProcessor(filename, force_full_pipeline=force_full)
+            progress = self.progress_updater(self.progress_bar, self.progress_label)
+            self.temp_dir, self.image_count = self.processor.process_phase_1(progress_callback=progress)
+            self._review_started = time.perf_counter()
             
             # Reset state
             self.current_image_index = 1
-            self.deleted_indices = set()
+            # Obvious junk is pre-marked by the classifier; the user can still override it
+            self.deleted_indices = set(self.processor.suggested_deletions)
             self.decided_indices = set()
-            self.cached_images = {}
+            self.cached_images = OrderedDict()
+            self.grid_selected = set()
+            self.grid_anchor = None
             
-            self.after(0, self.show_review_screen)
+            if self.image_count > GRID_VIEW_THRESHOLD:
+                self.after(0, self.show_grid_review_screen)
+            else:
+                self.after(0, self.show_review_screen)
         except Exception as e:
             self.after(0, lambda: self.show_error(str(e)))
 
@@ -144,6 +214,8 @@ class ReviewApp(tb.Window):
         tb.Label(top_bar, text=f"Reviewing: {self.processor.pdf_filename}", font=("Helvetica", 14, "bold")).pack(side=LEFT)
         self.counter_label = tb.Label(top_bar, text=f"Image {self.current_image_index} of {self.image_count}", font=("Helvetica", 14))
         self.counter_label.pack(side=RIGHT)
+        tb.Button(top_bar, text="Grid View (G)", command=self.show_grid_review_screen, bootstyle="outline").pack(side=RIGHT, padx=20)
+        tb.Button(top_bar, text="Next Uncertain (U)", command=self.jump_to_next_uncertain, bootstyle="outline-warning").pack(side=RIGHT)
 
         # Image Display
         self.image_container = tb.Frame(main_frame, bootstyle="secondary", padding=10)
@@ -180,19 +252,52 @@ class ReviewApp(tb.Window):
         self.bind("<Right>", lambda e: self.next_image())
         self.bind("k", lambda e: self.mark_keep())
         self.bind("d", lambda e: self.mark_delete())
+        self.bind("g", lambda e: self.show_grid_review_screen())
+        self.bind("u", lambda e: self.jump_to_next_uncertain())
 
+        if self.prefetcher is None:
+            self.prefetcher = ImagePrefetcher(
+                self.temp_dir,
+                on_ready=lambda idx: self.after(0, self.on_image_decoded, idx),
+            )
+
+        self.update_image_display()
+
+    def close_review_loaders(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        if self.thumb_loader is not None:
+            self.thumb_loader.close()
+            self.thumb_loader = None
+        self.cached_images = OrderedDict()
+        self.grid_photos = {}
+
+    def on_image_decoded(self, idx):
+        # Called on the main thread once the background decoder has the image ready
+        if idx != self.current_image_index or idx in self.cached_images:
+            return
+        if getattr(self, "image_label", None) is None or not self.image_label.winfo_exists():
+            return
         self.update_image_display()
 
     def unbind_all_keys(self):
         # Unbind common keys to prevent conflict between screens
-        for k in ["<Left>", "<Right>", "<Up>", "<Down>", "k", "d"]:
+        for k in ["<Left>", "<Right>", "<Up>", "<Down>", "k", "d", "g", "c", "u", "<Control-a>",
+                  "<MouseWheel>", "<Button-4>", "<Button-5>"]:
             self.unbind(k)
 
     def update_image_display(self):
         idx = self.current_image_index
-        self.counter_label.config(text=f"Image {idx} of {self.image_count}")
+        score = self.processor.junk_scores.get(idx)
+        score_text = f"  |  junk score {score:.2f}" if score is not None else ""
+        self.counter_label.config(text=f"Image {idx} of {self.image_count}{score_text}")
         
-        if idx in self.deleted_indices:
+        if idx in self.deleted_indices and idx not in self.decided_indices:
+            self.status_label.config(text="AUTO: LIKELY JUNK (K to keep)", bootstyle="inverse-warning")
+            self.btn_delete.config(bootstyle="danger")
+            self.btn_keep.config(bootstyle="outline-success")
+        elif idx in self.deleted_indices:
             self.status_label.config(text="MARKED FOR DELETION", bootstyle="inverse-danger")
             self.btn_delete.config(bootstyle="danger")
             self.btn_keep.config(bootstyle="outline-success")
@@ -205,20 +310,25 @@ class ReviewApp(tb.Window):
             self.btn_delete.config(bootstyle="outline-danger")
             self.btn_keep.config(bootstyle="outline-success")
 
-        if idx not in self.cached_images:
-            try:
-                img_path = self.temp_dir / f"bild_{idx}.png"
-                pil_img = Image.open(img_path)
-                display_width, display_height = 1000, 600
-                ratio = min(display_width/pil_img.width, display_height/pil_img.height)
-                new_size = (int(pil_img.width * ratio), int(pil_img.height * ratio))
-                pil_img = pil_img.resize(new_size, Image.Resampling.LANCZOS)
-                self.cached_images[idx] = ImageTk.PhotoImage(pil_img)
-            except Exception as e:
-                print(f"Error loading image {idx}: {e}")
+        self.prefetcher.request(idx, self.image_count)
+
+        if idx in self.cached_images:
+            self.cached_images.move_to_end(idx)
+        else:
+            pil_img = self.prefetcher.get(idx)
+            if pil_img is None:
+                error = self.prefetcher.error(idx)
+                if error is not None:
+                    self.image_label.config(image="", text=f"Error loading image: {error}", fg="white")
+                    return
+                # Decoder is still busy; on_image_decoded refreshes the view
+                self.image_label.config(image="", text="Loading...", fg="white")
                 return
+            self.cached_images[idx] = ImageTk.PhotoImage(pil_img)
+            while len(self.cached_images) > PHOTO_CACHE_SIZE:
+                self.cached_images.popitem(last=False)
 
-        self.image_label.config(image=self.cached_images[idx])
+        self.image_label.config(image=self.cached_images[idx], text="")
 
     def prev_image(self):
         if self.current_image_index > 1:
@@ -241,6 +351,22 @@ class ReviewApp(tb.Window):
         self.decided_indices.add(self.current_image_index)
         self.next_image_auto()
 
+    def next_uncertain_index(self, start):
+        """Next undecided image after start that the classifier could not settle (wraps around)."""
+        uncertain = [i for i in self.processor.uncertain_indices if i not in self.decided_indices]
+        if not uncertain:
+            return None
+        later = [i for i in uncertain if i > start]
+        return later[0] if later else uncertain[0]
+
+    def jump_to_next_uncertain(self):
+        idx = self.next_uncertain_index(self.current_image_index)
+        if idx is None:
+            messagebox.showinfo("Review", "No undecided uncertain images left.")
+            return
+        self.current_image_index = idx
+        self.update_image_display()
+
     def next_image_auto(self):
         if self.current_image_index < self.image_count:
             self.current_image_index += 1
@@ -248,6 +374,216 @@ class ReviewApp(tb.Window):
         else:
             self.update_image_display()
 
+    # --- SCREEN 2b: REVIEW IMAGES (Grid / contact sheet) ---
+    def show_grid_review_screen(self):
+        self.clear_window()
+
+        if self.image_count == 0:
+            self.show_no_images_screen()
+            return
+
+        main_frame = tb.Frame(self, padding=20)
+        main_frame.pack(fill=BOTH, expand=YES)
+
+        top_bar = tb.Frame(main_frame)
+        top_bar.pack(fill=X, pady=(0, 10))
+        tb.Label(top_bar, text=f"Reviewing: {self.processor.pdf_filename}", font=("Helvetica", 14, "bold")).pack(side=LEFT)
+        self.grid_counter_label = tb.Label(top_bar, text="", font=("Helvetica", 12))
+        self.grid_counter_label.pack(side=RIGHT)
+
+        tb.Label(main_frame, text="Click = select, Ctrl+Click = toggle, Shift+Click = range, Double-Click = open",
+                 font=("Helvetica", 10)).pack(anchor=W)
+
+        canvas_frame = tb.Frame(main_frame)
+        canvas_frame.pack(fill=BOTH, expand=YES, pady=10)
+        self.grid_canvas = tk.Canvas(canvas_frame, bg="#444", highlightthickness=0)
+        scrollbar = tb.Scrollbar(canvas_frame, orient=VERTICAL, command=self.grid_canvas.yview)
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            self.schedule_grid_render()
+
+        self.grid_canvas.configure(yscrollcommand=on_scroll)
+        scrollbar.pack(side=RIGHT, fill=Y)
+        self.grid_canvas.pack(side=LEFT, fill=BOTH, expand=YES)
+
+        bottom_bar = tb.Frame(main_frame, padding=(0, 10, 0, 0))
+        bottom_bar.pack(fill=X, side=BOTTOM)
+        btn_frame = tb.Frame(bottom_bar)
+        btn_frame.pack(anchor=CENTER)
+        tb.Button(btn_frame, text="Carousel (C)", command=self.open_carousel_from_grid, bootstyle="outline").pack(side=LEFT, padx=10)
+        tb.Button(btn_frame, text="Next Uncertain (U)", command=self.grid_select_next_uncertain, bootstyle="outline-warning").pack(side=LEFT, padx=10)
+        tb.Button(btn_frame, text="Select All (Ctrl+A)", command=self.grid_select_all, bootstyle="outline").pack(side=LEFT, padx=10)
+        tb.Button(btn_frame, text="Keep Selected (K)", command=lambda: self.grid_mark(delete=False), bootstyle="success", width=18).pack(side=LEFT, padx=10)
+        tb.Button(btn_frame, text="Delete Selected (D)", command=lambda: self.grid_mark(delete=True), bootstyle="danger", width=18).pack(side=LEFT, padx=10)
+        tb.Button(main_frame, text="Finish & Save", command=self.finish_process_step1, bootstyle="primary").pack(side=BOTTOM, pady=10)
+
+        # Bindings
+        self.unbind_all_keys()
+        self.grid_canvas.bind("<Configure>", lambda e: self.schedule_grid_render())
+        self.grid_canvas.bind("<Button-1>", lambda e: self.on_grid_click(e, "single"))
+        self.grid_canvas.bind("<Control-Button-1>", lambda e: self.on_grid_click(e, "toggle"))
+        self.grid_canvas.bind("<Shift-Button-1>", lambda e: self.on_grid_click(e, "range"))
+        self.grid_canvas.bind("<Double-Button-1>", self.on_grid_double_click)
+        self.bind("<MouseWheel>", lambda e: self.grid_canvas.yview_scroll(int(-e.delta / 120) or (-1 if e.delta > 0 else 1), "units"))
+        self.bind("<Button-4>", lambda e: self.grid_canvas.yview_scroll(-1, "units"))
+        self.bind("<Button-5>", lambda e: self.grid_canvas.yview_scroll(1, "units"))
+        self.bind("k", lambda e: self.grid_mark(delete=False))
+        self.bind("d", lambda e: self.grid_mark(delete=True))
+        self.bind("c", lambda e: self.open_carousel_from_grid())
+        self.bind("u", lambda e: self.grid_select_next_uncertain())
+        self.bind("<Control-a>", lambda e: self.grid_select_all())
+
+        if self.thumb_loader is None:
+            self.thumb_loader = ThumbnailLoader(
+                self.temp_dir,
+                on_ready=lambda idx: self.after(0, self.schedule_grid_render),
+            )
+
+        self.grid_photos = {}
+        self.update_grid_counter()
+        self.schedule_grid_render()
+
+    def schedule_grid_render(self):
+        # Coalesce scroll events and thumbnail callbacks into one redraw
+        if not self._grid_render_pending:
+            self._grid_render_pending = True
+            self.after(30, self.render_grid)
+
+    def render_grid(self):
+        self._grid_render_pending = False
+        canvas = getattr(self, "grid_canvas", None)
+        if canvas is None or not canvas.winfo_exists():
+            return
+
+        cols = max(1, canvas.winfo_width() // GRID_CELL_W)
+        rows = (self.image_count + cols - 1) // cols
+        self.grid_cols = cols
+        region = (0, 0, cols * GRID_CELL_W, rows * GRID_CELL_H)
+        if tuple(int(float(v)) for v in (canvas.cget("scrollregion") or "0 0 0 0").split()) != region:
+            canvas.configure(scrollregion=region)
+
+        # Only the rows inside the viewport are drawn and get thumbnails
+        top = canvas.canvasy(0)
+        first_row = int(top // GRID_CELL_H)
+        last_row = int((top + canvas.winfo_height()) // GRID_CELL_H)
+        first_idx = first_row * cols + 1
+        last_idx = min(self.image_count, (last_row + 1) * cols)
+        visible = range(first_idx, last_idx + 1)
+
+        canvas.delete("cell")
+        photos = {}
+        for idx in visible:
+            row, col = divmod(idx - 1, cols)
+            x0, y0 = col * GRID_CELL_W, row * GRID_CELL_H
+
+            if idx in self.deleted_indices and idx not in self.decided_indices:
+                color, status = "#f0ad4e", "AUTO"
+            elif idx in self.deleted_indices:
+                color, status = "#d9534f", "DELETE"
+            elif idx in self.decided_indices:
+                color, status = "#5cb85c", "KEEP"
+            else:
+                color, status = "#888", ""
+            selected = idx in self.grid_selected
+            canvas.create_rectangle(x0 + 2, y0 + 2, x0 + GRID_CELL_W - 2, y0 + GRID_CELL_H - 2,
+                                    outline="#5bc0de" if selected else color, width=4 if selected else 2, tags="cell")
+
+            photo = self.grid_photos.get(idx)
+            if photo is None:
+                pil_img = self.thumb_loader.get(idx)
+                if pil_img is not None:
+                    photo = ImageTk.PhotoImage(pil_img)
+            center_x, center_y = x0 + GRID_CELL_W / 2, y0 + GRID_PAD + THUMBNAIL_SIZE / 2
+            if photo is not None:
+                photos[idx] = photo
+                canvas.create_image(center_x, center_y, image=photo, tags="cell")
+            else:
+                text = "Error" if self.thumb_loader.error(idx) is not None else "..."
+                canvas.create_text(center_x, center_y, text=text, fill="white", tags="cell")
+            canvas.create_text(center_x, y0 + GRID_CELL_H - 14, text=f"{idx} {status}".strip(), fill=color, tags="cell")
+
+        # Drop PhotoImages of rows that scrolled out of view
+        self.grid_photos = photos
+
+        # Visible cells first, then one row below as look-ahead
+        ahead = range(last_idx + 1, min(self.image_count, last_idx + cols) + 1)
+        self.thumb_loader.request([i for i in list(visible) + list(ahead) if i not in photos])
+
+    def grid_index_at(self, x, y):
+        canvas = self.grid_canvas
+        col = int(canvas.canvasx(x) // GRID_CELL_W)
+        row = int(canvas.canvasy(y) // GRID_CELL_H)
+        if col >= self.grid_cols or row < 0:
+            return None
+        idx = row * self.grid_cols + col + 1
+        return idx if 1 <= idx <= self.image_count else None
+
+    def on_grid_click(self, event, mode):
+        idx = self.grid_index_at(event.x, event.y)
+        if idx is None:
+            return
+        if mode == "toggle":
+            self.grid_selected ^= {idx}
+            self.grid_anchor = idx
+        elif mode == "range" and self.grid_anchor is not None:
+            low, high = sorted((self.grid_anchor, idx))
+            self.grid_selected = set(range(low, high + 1))
+        else:
+            self.grid_selected = {idx}
+            self.grid_anchor = idx
+        self.update_grid_counter()
+        self.schedule_grid_render()
+
+    def on_grid_double_click(self, event):
+        idx = self.grid_index_at(event.x, event.y)
+        if idx is not None:
+            self.current_image_index = idx
+            self.show_review_screen()
+
+    def grid_select_all(self):
+        self.grid_selected = set(range(1, self.image_count + 1))
+        self.update_grid_counter()
+        self.schedule_grid_render()
+
+    def grid_mark(self, delete):
+        # Same bookkeeping as the carousel, so process_phase_2 sees no difference
+        for idx in self.grid_selected:
+            if delete:
+                self.deleted_indices.add(idx)
+            else:
+                self.deleted_indices.discard(idx)
+            self.decided_indices.add(idx)
+        self.update_grid_counter()
+        self.schedule_grid_render()
+
+    def grid_select_next_uncertain(self):
+        start = self.grid_anchor if self.grid_anchor is not None else 0
+        idx = self.next_uncertain_index(start)
+        if idx is None:
+            messagebox.showinfo("Review", "No undecided uncertain images left.")
+            return
+        self.grid_selected = {idx}
+        self.grid_anchor = idx
+        # Scroll the row of the image into view
+        rows = (self.image_count + self.grid_cols - 1) // self.grid_cols
+        row = (idx - 1) // self.grid_cols
+        self.grid_canvas.yview_moveto(row / max(1, rows))
+        self.update_grid_counter()
+        self.schedule_grid_render()
+
+    def update_grid_counter(self):
+        self.grid_counter_label.config(
+            text=f"{len(self.grid_selected)} selected | {len(self.decided_indices)} of {self.image_count} reviewed | "
+                 f"{len(self.deleted_indices)} marked for deletion | "
+                 f"{len([i for i in self.processor.uncertain_indices if i not in self.decided_indices])} uncertain left"
+        )
+
+    def open_carousel_from_grid(self):
+        if self.grid_selected:
+            self.current_image_index = min(self.grid_selected)
+        self.show_review_screen()
+
     def finish_process_step1(self):
         # Run Phase 2 (Move files, create basic Markdown)
         loading = tb.Toplevel(self)
@@ -256,6 +592,11 @@ class ReviewApp(tb.Window):
         tb.Label(loading, text="Finalizing files...", padding=20).pack()
         loading.update()
         
+        self.close_review_loaders()
+        if self._review_started is not None:
+            record_span("review", time.perf_counter() - self._review_started, unit="images",
+                        items=self.image_count, deleted=len(self.deleted_indices))
+            self._review_started = None
         try:
             self.generated_md_path = self.processor.process_phase_2(list(self.deleted_indices))
             self.generated_md_path = Path(str(self.generated_md_path))
@@ -288,6 +629,30 @@ class ReviewApp(tb.Window):
         vision_btn.pack(pady=10)
         if not AI_AVAILABLE:
             vision_btn.config(state="disabled", text="Vision AI (Module missing)")
+
+        # One request per chapter: the chapter text is sent once instead of once per image
+        self.group_vision_var = tk.BooleanVar(value=True)
+        tb.Checkbutton(btn_frame, text="Group images per chapter (fewer requests)",
+                       variable=self.group_vision_var, bootstyle="round-toggle").pack(pady=5)
+
+        # OpenAI or local Ollama (air-gapped sites); both use the same prompt and output format
+        backend_frame = tb.Frame(btn_frame)
+        backend_frame.pack(pady=5)
+        tb.Label(backend_frame, text="Vision backend:").pack(side=LEFT, padx=5)
+        self.vision_backend_combo = tb.Combobox(backend_frame, values=list(VISION_BACKENDS) if AI_AVAILABLE else [],
+                                                state="readonly", width=10)
+        if AI_AVAILABLE:
+            self.vision_backend_combo.set("openai")
+        self.vision_backend_combo.pack(side=LEFT)
+
+        # Dry-run estimate (images, tokens, cost, time) - measured in a thread, nothing is sent
+        self.estimate_label = tb.Label(btn_frame, text="", font=("Helvetica", 10), bootstyle="secondary",
+                                       wraplength=600, justify="center")
+        self.estimate_label.pack(pady=5)
+        if AI_AVAILABLE:
+            self.group_vision_var.trace_add("write", lambda *args: self.update_enrichment_estimate())
+            self.vision_backend_combo.bind("<<ComboboxSelected>>", lambda e: self.update_enrichment_estimate())
+            self.update_enrichment_estimate()
         
         # Human Description Button
         tb.Button(btn_frame, text="Human Description (Manual)", command=self.prep_human_review, bootstyle="warning", width=25).pack(pady=10)
@@ -295,19 +660,51 @@ class ReviewApp(tb.Window):
         # Skip to Step 3
         tb.Button(container, text="Skip to Step 3 (Indexing)", command=self.show_step3_screen, bootstyle="secondary").pack(pady=40)
 
+    def update_enrichment_estimate(self):
+        backend_name = self.vision_backend_combo.get() or "openai"
+        group_by_chapter = self.group_vision_var.get()
+        md_path = self.generated_md_path
+        self.estimate_label.config(text="Estimating cost and time...")
+        # Newer requests win if the user toggles quickly
+        self._estimate_request = request_id = getattr(self, "_estimate_request", 0) + 1
+
+        def worker():
+            try:
+                text = "Estimate: " + format_estimate(
+                    estimate_enrichment(md_path, backend_name, group_by_chapter=group_by_chapter))
+            except Exception as e:
+                text = f"Estimate not available: {e}"
+
+            def _show():
+                if request_id == self._estimate_request and self.estimate_label.winfo_exists():
+                    self.estimate_label.config(text=text)
+            self.after(0, _show)
+
+        threading.Thread(target=worker, daemon=True).start()
+
     # --- VISION AI FLOW ---
     def run_vision_ai(self):
+        group_by_chapter = self.group_vision_var.get()
+        backend_name = self.vision_backend_combo.get() or "openai"
         self.clear_window()
         container = tb.Frame(self, padding=20)
         container.pack(fill=BOTH, expand=YES)
         
         tb.Label(container, text="Running Vision AI...", font=("Helvetica", 24)).pack(pady=50)
+
+        pb = tb.Progressbar(container, mode='indeterminate', bootstyle="info", length=400)
+        pb.pack(pady=5)
+        pb.start(10)
+        rate_label = tb.Label(container, text="", font=("Helvetica", 10))
+        rate_label.pack(pady=5)
+        progress = self.progress_updater(pb, rate_label, unit="images")
         
         log_text = tk.Text(container, height=15, width=80)
         log_text.pack(pady=20)
         log_text.insert(END, "Starting AI enrichment process...\nPlease wait, this can take a while depending on file size.\n")
         
         def update_log(current, total, message):
+            progress(current, total, message)
             def _update():
                 log_text.insert(END, f"[{current}/{total}] {message}\n")
                 log_text.see(END)
@@ -316,7 +713,9 @@ class ReviewApp(tb.Window):
         def run_ai_thread():
             try:
                 # We assume a valid API key is in the script or ENV
-                new_file = enrich_file(self.generated_md_path, progress_callback=update_log)
+                backend = make_backend(backend_name, api_key=OPENAI_API_KEY)
+                new_file = enrich_file(self.generated_md_path, progress_callback=update_log,
+                                       group_by_chapter=group_by_chapter, backend=backend)
                 self.final_md_path = Path(new_file)
                 
                 self.after(0, lambda: messagebox.showinfo("Done", f"Enrichment Complete!\nSaved to: {new_file}"))
@@ -337,13 +736,11 @@ class ReviewApp(tb.Window):
             messagebox.showerror("Error", "Markdown file not found.")
             return
 
-        with open(md_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            
+        _, manifest = load_document(md_path)
         base_dir = md_path.parent
-        matches = re.findall(r"!\[.*?\]\((.*?)\)", content)
         
-        for rel_path in matches:
+        for image in manifest["images"]:
+            rel_path = image["path"]
             abs_path = base_dir / rel_path
             if abs_path.exists():
                 self.final_image_paths.append((rel_path, abs_path))
@@ -422,25 +819,20 @@ class ReviewApp(tb.Window):
     def finish_human_review(self):
         try:
             md_path = self.generated_md_path
-            with open(md_path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
+            md_bytes, manifest = load_document(md_path)
             
-            new_lines = []
-            for line in lines:
-                new_lines.append(line)
-                match = re.search(r"!\[.*?\]\((.*?)\)", line)
-                if match:
-                    rel_path = match.group(1)
-                    if rel_path in self.manual_descriptions:
-                        desc = self.manual_descriptions[rel_path]
-                        new_lines.append(f"> Image description: {desc}\n\n")
+            insertions = []
+            for image in manifest["images"]:
+                if image["path"] in self.manual_descriptions:
+                    desc = self.manual_descriptions[image["path"]]
+                    insertions.append((image["insert_at"], f"> Image description: {desc}\n\n"))
 
             # Save as enriched file to match Vision AI behavior
             new_filename = md_path.stem.replace("_mapped", "") + "_mapped_enriched.md"
             output_path = md_path.parent / new_filename
             
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.writelines(new_lines)
+            enriched_bytes, enriched_manifest = apply_insertions(md_bytes, manifest, insertions)
+            write_document(output_path, enriched_bytes, enriched_manifest)
             
             self.final_md_path = output_path
             messagebox.showinfo("Success", f"Descriptions saved to:\n{output_path.name}")
@@ -495,15 +887,24 @@ class ReviewApp(tb.Window):
         pb = tb.Progressbar(container, mode='indeterminate', bootstyle="primary", length=400)
         pb.pack(pady=20)
         pb.start(10)
+        rate_label = tb.Label(container, text="Loading embedding model...", font=("Helvetica", 10))
+        rate_label.pack(pady=5)
+        progress = self.progress_updater(pb, rate_label, unit="chunks")
         
         def index_thread():
             try:
                 # We use default index path for now as requested
                 # Ensure we pass string path
                 target_file = str(self.final_md_path) if self.final_md_path else str(self.generated_md_path)
-                update_or_create_vector_index(target_file)
+                snapshot_id = update_or_create_vector_index(target_file, progress_callback=progress)
                 
-                self.after(0, lambda: messagebox.showinfo("Success", "Vector Index Updated Successfully!"))
+                if snapshot_id:
+                    self.after(0, lambda: messagebox.showinfo("Success", "Vector Index Updated Successfully!"))
+                else:
+                    # Ein Writer-Dienst oder ein paralleler Ingest hält den Index und übernimmt den Batch
+                    self.after(0, lambda: messagebox.showinfo(
+                        "Submitted", "Chunks submitted. Another ingest or the index writer service currently "
+                                     "holds the index and will publish them shortly."))
                 self.after(0, self.create_start_screen)
             except Exception as e:
                 self.after(0, lambda: messagebox.showerror("Error", str(e)))
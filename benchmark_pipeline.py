@@ -0,0 +1,290 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+from pathlib import Path
+from synthetic_manuals import manual_spec, write_pdf, write_markdown
+from pipeline_metrics import span
+from memory_profiling import MemoryProfiler, current_rss, format_report as format_memory_report, write_report, \
+    PSUTIL_AVAILABLE
+
+# End-to-End-Benchmark der Ingestion: synthetisches Handbuch -> Phase 1 -> Phase 2 -> KI-Anreicherung
+# (gegen den Stub-Server) -> Vektorindex. Ergebnisse als JSON, Vergleich mit einer gespeicherten Baseline.
+STAGES = ("phase_1", "phase_2", "enrich", "index")
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+REGRESSION_THRESHOLD = 0.15 # 15 % langsamer / mehr Speicher als die Baseline gilt als Regression
+RSS_SAMPLE_INTERVAL = 0.02
+
+
+class PeakRssSampler:
+    """
+    Peak resident memory while a stage runs. With psutil a thread samples the RSS;
+    without it the process high-water mark (ru_maxrss) is used, which never goes down.
+    """
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+class StageSkipped(Exception):
+    pass
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_stage(name, func, unit):
+    """Runs func() -> work amount; returns the stage record (wall time, peak RSS, throughput)."""
+    print(f"--- Benchmark: {name} ---")
+    try:
+        # Span: ordnet die Stufe auch im Speicherprofil (--memory-profile) zu
+        with PeakRssSampler() as sampler, span(f"benchmark.{name}"):
+            start = time.perf_counter()
+            amount = func()
+            wall_s = time.perf_counter() - start
+    except StageSkipped as e:
+        print(f"Übersprungen: {e}")
+        return {"status": "skipped", "reason": str(e)}
+    return {
+        "status": "ok",
+        "wall_s": round(wall_s, 4),
+        "peak_rss_mb": round(sampler.peak / 2**20, 1),
+        "amount": amount,
+        "unit": unit,
+        "throughput": round(amount / wall_s, 2) if wall_s else None,
+    }
+
+
+def run_once(workdir, corpus, stages, stub_delay=0.0, backend_name="openai"):
+    """One pass over all stages in workdir (extracted_data/ is relative, so we chdir there)."""
+    name = "synthetic_manual"
+    spec = manual_spec(**corpus)
+    pdf_path = workdir / f"{name}.pdf"
+    pdf_stats = write_pdf(pdf_path, spec)
+    results, state = {}, {}
+
+    # Fallback-Eingabe für enrich/index, falls Phase 1/2 (docling) hier nicht laufen
+    md_path, md_stats = write_markdown(workdir / "generated", name, spec)
+    state["md_path"] = md_path
+
+    def phase_1():
+        try:
+            from unified_extraction_review import PdfProcessor
+        except ImportError as e:
+            raise StageSkipped(f"docling nicht verfügbar ({e})")
+        processor = PdfProcessor(str(pdf_path), auto_classify=False)
+        processor.process_phase_1()
+        state["processor"] = processor
+        return pdf_stats["pages"]
+
+    def phase_2():
+        processor = state.get("processor")
+        if processor is None:
+            raise StageSkipped("Phase 1 wurde nicht ausgeführt")
+        state["md_path"] = processor.process_phase_2(set())
+        return processor.image_count
+
+    def enrich():
+        from stub_servers import StubServer
+        from vision_backends import OpenAIVisionBackend, OllamaVisionBackend
+        from image_to_information import enrich_file
+        with StubServer(delay=stub_delay) as stub:
+            if backend_name == "ollama":
+                backend = OllamaVisionBackend(url=f"{stub.base_url}/api/chat")
+            else:
+                backend = OpenAIVisionBackend(api_key="stub", url=f"{stub.base_url}/v1/chat/completions")
+            state["enriched_path"] = enrich_file(state["md_path"], backend=backend)
+        return md_stats["images"] if "processor" not in state else state["processor"].image_count
+
+    def index():
+        try:
+            from vector_transformer import update_or_create_vector_index
+        except ImportError as e:
+            raise StageSkipped(f"LangChain/FAISS nicht verfügbar ({e})")
+        source = state.get("enriched_path") or state["md_path"]
+        index_path = workdir / "faiss_index"
+        if index_path.exists():
+            shutil.rmtree(index_path)
+        update_or_create_vector_index(str(source), index_path=str(index_path))
+        return len(Path(source).read_text(encoding="utf-8"))
+
+    stage_funcs = {"phase_1": (phase_1, "pages"), "phase_2": (phase_2, "images"),
+                   "enrich": (enrich, "images"), "index": (index, "chars")}
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for stage in stages:
+            func, unit = stage_funcs[stage]
+            results[stage] = run_stage(stage, func, unit)
+    finally:
+        os.chdir(previous_cwd)
+    return results, pdf_stats
+
+
+def summarize_runs(runs):
+    """Median wall time / throughput and maximum peak RSS over repeated runs per stage."""
+    summary = {}
+    for stage in runs[0]:
+        records = [run[stage] for run in runs if run[stage]["status"] == "ok"]
+        if not records:
+            summary[stage] = runs[0][stage]
+            continue
+        summary[stage] = {
+            "status": "ok",
+            "wall_s": round(statistics.median(r["wall_s"] for r in records), 4),
+            "wall_s_runs": [r["wall_s"] for r in records],
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in records),
+            "amount": records[0]["amount"],
+            "unit": records[0]["unit"],
+            "throughput": round(statistics.median(r["throughput"] or 0 for r in records), 2),
+        }
+    return summary
+
+
+def run_benchmark(corpus, stages=STAGES, repeat=1, stub_delay=0.0, backend_name="openai", keep_workdir=False):
+    runs, pdf_stats = [], None
+    for n in range(repeat):
+        workdir = Path(tempfile.mkdtemp(prefix="atm_bench_"))
+        try:
+            result, pdf_stats = run_once(workdir.resolve(), corpus, stages, stub_delay, backend_name)
+            runs.append(result)
+        finally:
+            if keep_workdir:
+                print(f"Arbeitsordner: {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "rss_source": "psutil" if PSUTIL_AVAILABLE else "ru_maxrss",
+            "repeat": repeat,
+            "backend": backend_name,
+            "stub_delay_s": stub_delay,
+        },
+        "corpus": dict(corpus, **{f"pdf_{k}": v for k, v in (pdf_stats or {}).items()}),
+        "stages": summarize_runs(runs),
+    }
+
+
+def compare_to_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Returns a list of regression messages (empty = no regression)."""
+    if baseline.get("corpus") != results.get("corpus"):
+        print("WARNUNG: Baseline wurde mit einem anderen Korpus erstellt, Vergleich nur bedingt aussagekräftig.")
+    regressions = []
+    for stage, current in results["stages"].items():
+        reference = baseline.get("stages", {}).get(stage)
+        if current.get("status") != "ok" or not reference or reference.get("status") != "ok":
+            continue
+        for key in ("wall_s", "peak_rss_mb"):
+            old, new = reference[key], current[key]
+            change = (new - old) / old if old else 0.0
+            marker = "REGRESSION" if change > threshold else "ok"
+            print(f"{stage:8s} {key:12s} {old:>10} -> {new:>10} ({change:+.1%}) {marker}")
+            if change > threshold:
+                regressions.append(f"{stage}.{key}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def format_results(results):
+    lines = [f"Korpus: {results['corpus']}"]
+    for stage, record in results["stages"].items():
+        if record["status"] != "ok":
+            lines.append(f"{stage:8s} übersprungen ({record.get('reason')})")
+            continue
+        lines.append(f"{stage:8s} {record['wall_s']:8.3f} s  {record['peak_rss_mb']:8.1f} MB  "
+                     f"{record['throughput']} {record['unit']}/s")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="End-to-end ingestion benchmark on a synthetic manual")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--headings-per-page", type=int, default=2)
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--tables-every", type=int, default=5, help="one table every N pages (0 = none)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage; the median is reported")
+    parser.add_argument("--backend", choices=["openai", "ollama"], default="openai",
+                        help="request format used against the stub vision server")
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="simulated seconds per vision request")
+    parser.add_argument("--out", default=RESULTS_FILE)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--keep-workdir", action="store_true")
+    parser.add_argument("--memory-profile", nargs="?", const="benchmark_memory.json", metavar="REPORT",
+                        help="also profile memory per stage (tracemalloc + RSS; slows the run down)")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    corpus = {"pages": args.pages, "headings_per_page": args.headings_per_page,
+              "images_per_page": args.images_per_page, "tables_every": args.tables_every, "seed": args.seed}
+    if args.memory_profile:
+        with MemoryProfiler() as profiler:
+            results = run_benchmark(corpus, stages, args.repeat, args.stub_delay, args.backend, args.keep_workdir)
+        memory_report = profiler.report()
+        print(format_memory_report(memory_report))
+        write_report(memory_report, args.memory_profile)
+        # Zeiten unter tracemalloc sind nicht mit einer Baseline ohne Profil vergleichbar
+        results["meta"]["memory_profile"] = args.memory_profile
+        results["memory"] = {key: memory_report[key] for key in ("peak_rss_mb", "peak_rss_stage",
+                                                                 "peak_python_mb", "peak_python_stage")}
+    else:
+        results = run_benchmark(corpus, stages, args.repeat, args.stub_delay, args.backend, args.keep_workdir)
+    print(format_results(results))
+    Path(args.out).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Ergebnisse gespeichert: {args.out}")
+
+    if args.memory_profile:
+        print("Kein Baseline-Vergleich: Zeiten unter tracemalloc sind nicht mit normalen Läufen vergleichbar.")
+    elif args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Baseline gespeichert: {args.baseline}")
+    elif Path(args.baseline).exists():
+        regressions = compare_to_baseline(results, json.loads(Path(args.baseline).read_text(encoding="utf-8")),
+                                          args.threshold)
+        if regressions:
+            print("Regressionen:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print("Keine Regression gegenüber der Baseline.")
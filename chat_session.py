@@ -0,0 +1,178 @@
+import json
+import time
+import hashlib
+import requests
+from ollama_settings import OLLAMA_URL, MODEL_NAME, OLLAMA_NUM_CTX, OLLAMA_KEEP_ALIVE
+from document_manifest import estimate_tokens
+from retrieval import retrieve, build_context, build_image_lookup, parse_cited_chunks, resolve_images, chunk_header
+from pipeline_metrics import span, record_span, count
+
+# Mehrrunden-Chat: Ollama gibt nach jeder Antwort "context" (die Token der bisherigen Unterhaltung)
+# zurück. Wird er beim nächsten Request mitgeschickt, muss nur die neue Runde vorverarbeitet
+# werden. Bereits gesendete Kontextabschnitte werden nicht erneut geschickt.
+HISTORY_TOKEN_BUDGET = int(OLLAMA_NUM_CTX * 0.75) # darüber wird der Verlauf verdichtet
+CONDENSED_TURNS = 3            # so viele letzte Runden bleiben nach dem Verdichten erhalten
+CONDENSED_ANSWER_CHARS = 400
+REQUEST_TIMEOUT = (10, 120)
+
+SYSTEM_PROMPT = (
+    "Du bist der Wiki-Experte für verschiedene Software-Systeme. Nutze den KONTEXT.\n"
+    "Der Kontext besteht aus nummerierten Abschnitten [1], [2], ...; in Folgefragen kommen neue "
+    "Abschnitte hinzu, die bisherigen gelten weiter.\n"
+    "Nenne am Ende jeder Antwort in einer eigenen Zeile 'QUELLEN:' und die Nummern der Abschnitte, "
+    "die du verwendet hast (z.B. 'QUELLEN: 1, 3'). Schreibe keine Bildpfade ab."
+)
+
+
+def _chunk_key(doc):
+    return hashlib.sha1(f"{chunk_header(doc)}\n{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+class ChatSession:
+    """
+    Conversation state of one chat (kept in st.session_state). Holds no index or model,
+    only numbers, texts and the Ollama context, so the vector DB is passed per call.
+    """
+
+    def __init__(self, model=MODEL_NAME, url=OLLAMA_URL, k=5, history_budget=HISTORY_TOKEN_BUDGET):
+        self.model = model
+        self.url = url
+        self.k = k
+        self.history_budget = history_budget
+        self.reset()
+
+    def reset(self):
+        """Starts a new conversation; model, url, k and history_budget stay."""
+        self.ollama_context = None  # Token-IDs der bisherigen Unterhaltung (von Ollama)
+        self.chunk_numbers = {}     # chunk key -> Nummer (bleibt für die ganze Unterhaltung stabil)
+        self.chunk_images = {}      # Nummer -> Bildpfade
+        self.sent_chunks = set()    # Nummern, die im aktuellen Ollama-Kontext schon stehen
+        self.turns = []             # {"question", "answer", "stats"}
+        self.condensed = 0
+        self.last_turn = None
+
+    def retrieval_query(self, question):
+        # Folgefragen ("und wie lösche ich das?") allein finden wenig, daher mit der Vorfrage suchen
+        if self.turns:
+            return f"{self.turns[-1]['question']} {question}"
+        return question
+
+    def _condense(self):
+        """Drops the Ollama context; the last turns go into the next prompt as short text instead."""
+        self.ollama_context = None
+        self.sent_chunks = set()
+        self.condensed += 1
+
+    def _history_text(self):
+        lines = []
+        for turn in self.turns[-CONDENSED_TURNS:]:
+            answer = turn["answer"]
+            if len(answer) > CONDENSED_ANSWER_CHARS:
+                answer = answer[:CONDENSED_ANSWER_CHARS].rstrip() + " ..."
+            lines.append(f"F: {turn['question']}\nA: {answer}")
+        return "\n".join(lines)
+
+    def build_prompt(self, question, docs):
+        """Returns (prompt, numbers of the retrieved docs, numbers that are sent new)."""
+        numbers = []
+        for doc in docs:
+            key = _chunk_key(doc)
+            if key not in self.chunk_numbers:
+                self.chunk_numbers[key] = len(self.chunk_numbers) + 1
+            numbers.append(self.chunk_numbers[key])
+        self.chunk_images.update(build_image_lookup(docs, numbers))
+
+        new = [(n, doc) for n, doc in zip(numbers, docs) if n not in self.sent_chunks]
+        new_context = build_context([doc for _, doc in new], [n for n, _ in new])
+
+        if self.ollama_context is not None:
+            prompt = ""
+            if new:
+                prompt += f"NEUER KONTEXT:\n{new_context}\n\n"
+            prompt += f"FOLGEFRAGE: {question}"
+            # Gesamter Verlauf liegt im Ollama-Kontext; zu lang -> verdichten und neu aufsetzen
+            if len(self.ollama_context) + estimate_tokens(prompt) <= self.history_budget:
+                return prompt, numbers, [n for n, _ in new]
+            self._condense()
+            new = list(zip(numbers, docs))
+            new_context = build_context(docs, numbers)
+
+        prompt = SYSTEM_PROMPT + "\n\n"
+        if self.turns:
+            prompt += f"BISHERIGER VERLAUF (gekürzt):\n{self._history_text()}\n\n"
+        prompt += f"KONTEXT:\n{new_context}\n\nFRAGE: {question}"
+        return prompt, numbers, [n for n, _ in new]
+
+    def ask_stream(self, vector_db, question, embeddings=None):
+        """
+        Yields the answer text piece by piece while Ollama generates it. When the generator
+        is exhausted, self.last_turn holds {"answer", "images", "sources", "stats"}.
+        """
+        embeddings = embeddings or vector_db.embeddings
+        started = time.perf_counter()
+        with span("query.retrieve", k=self.k):
+            docs, timings = retrieve(vector_db, embeddings, self.retrieval_query(question), k=self.k)
+        prompt, numbers, new_numbers = self.build_prompt(question, docs)
+
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {"num_ctx": OLLAMA_NUM_CTX},
+        }
+        if self.ollama_context is not None:
+            payload["context"] = self.ollama_context
+
+        pieces, final, first_token_at = [], {}, None
+        generate_started = time.perf_counter()
+        with requests.post(self.url, json=payload, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                piece = data.get("response", "")
+                if piece:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    pieces.append(piece)
+                    yield piece
+                if data.get("done"):
+                    final = data
+                    break
+        finished = time.perf_counter()
+        # Nachträglich erfasst: ein with-Block um die yields hielte den Span-Stack des Threads offen
+        record_span("query.generate", finished - generate_started, unit="tokens", items=final.get("eval_count"),
+                    ttft_s=round((first_token_at or finished) - generate_started, 4))
+        count("prompt_tokens", final.get("prompt_eval_count") or 0)
+
+        self.ollama_context = final.get("context") or None
+        self.sent_chunks.update(new_numbers)
+        raw_answer = "".join(pieces)
+        answer, cited = parse_cited_chunks(raw_answer, set(numbers))
+        # Ohne Quellenangabe: Bilder des besten Treffers zeigen
+        images = resolve_images(self.chunk_images, cited or numbers[:1])
+
+        stats = {
+            "embed_s": timings["embed_s"],
+            "search_s": timings["search_s"],
+            "ttft_s": (first_token_at or finished) - generate_started,
+            "generate_s": finished - generate_started,
+            "total_s": finished - started,
+            "prompt_eval_count": final.get("prompt_eval_count"),
+            "eval_count": final.get("eval_count"),
+            "new_chunks": len(new_numbers),
+            "context_tokens": len(self.ollama_context or []),
+            "condensed": self.condensed,
+        }
+        sources = [{"number": n, "header": chunk_header(doc), "content": doc.page_content,
+                    "images": self.chunk_images.get(n, []), "cited": n in cited, "new": n in new_numbers}
+                   for n, doc in zip(numbers, docs)]
+        self.turns.append({"question": question, "answer": answer, "stats": stats})
+        self.last_turn = {"answer": answer, "images": images, "sources": sources, "stats": stats}
+
+    def ask(self, vector_db, question, embeddings=None):
+        for _ in self.ask_stream(vector_db, question, embeddings):
+            pass
+        return self.last_turn
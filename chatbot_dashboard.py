@@ -1,17 +1,20 @@
 import streamlit as st
 import os
-import re
-import requests
+import time
 from pathlib import Path
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from chat_session import ChatSession
+from pipeline_metrics import start_metrics_server, DASHBOARD_METRICS_PORT
+# LangChain, FAISS und das Embedding-Modell lädt dashboard_startup im Hintergrund (kein Import hier)
+from dashboard_startup import ResourceLoader, STARTUP_PHASES
 
 # --- KONFIGURATION ---
-SERVER_IP = "127.0.0.1" 
-OLLAMA_URL = f"http://{SERVER_IP}:11434/api/generate"
-MODEL_NAME = "qwen2.5:7b"
+# Ollama-Host und Modell liegen in ollama_settings.py (auch von der lokalen Bildanalyse genutzt)
+from ollama_settings import OLLAMA_URL, MODEL_NAME
 INDEX_PATH = "faiss_index"
 IMAGE_BASE_DIR = Path("extracted_data") # Basis-Ordner deiner Daten
+STARTUP_POLL_S = 0.5 # so oft prüft die Seite während des Aufwärmens, ob alles geladen ist
+PHASE_LABELS = {"imports": "Bibliotheken importieren", "embeddings": "Embedding-Modell laden",
+                "index": "FAISS-Index laden", "warmup": "Testanfrage"}
 
 # --- UI SETUP ---
 st.set_page_config(page_title="Handbuch KI Chatbot", page_icon="🤖", layout="wide")
@@ -26,69 +29,66 @@ st.markdown("""
 
 st.title("🤖 Handbuch Chatbot")
 
-# --- RESSOURCEN LADEN ---
+# Prometheus-Text unter http://127.0.0.1:9465/metrics (einmal pro Prozess, nicht pro Rerun)
 @st.cache_resource
-def load_resources():
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-    vector_db = FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-    return vector_db
+def metrics_endpoint():
+    return start_metrics_server(DASHBOARD_METRICS_PORT)
 
-vector_db = load_resources()
+metrics_endpoint()
 
-# --- LOGIK FUNKTION ---
-def ask_local_professor(query):
-    docs = vector_db.similarity_search(query, k=5)
-    
-    context = ""
-    source_chunks = []
-    for doc in docs:
-        header = doc.metadata.get('Header 2') or doc.metadata.get('Header 1') or "Allgemein"
-        context += f"\n---\nKAPITEL: {header}\n{doc.page_content}\n"
-        source_chunks.append({"header": header, "content": doc.page_content})
+# --- RESSOURCEN LADEN (im Hintergrund) ---
+# Embedding-Backend: "torch" (Referenz) oder "onnx" (int8, schneller auf CPU-Servern), siehe embedding_backends.py;
+# None = EMBEDDING_BACKEND. Ein Loader pro Prozess, alle Sitzungen fragen denselben ab.
+@st.cache_resource
+def load_resources(embedding_backend=None):
+    return ResourceLoader(INDEX_PATH, embedding_backend).start()
 
-    system_prompt = (
-        "Du bist der Wiki-Experte für verschiedene Software-Systeme. Nutze den KONTEXT.\n"
-        "WICHTIG FÜR BILDER:\n"
-        "1. Bilder liegen jetzt in Unterordnern, z.B. images/turbomed/diagramm_1.png.\n"
-        "2. Identifiziere ALLE Bildpfade im Kontext, die zu deiner Antwort passen.\n"
-        "3. Nenne am Ende deiner Antwort UNBEDINGT die vollständigen Pfade unter 'BILD_REFERENZ:'.\n"
-        "4. Nutze exakt den Pfad, der im Kontext steht (inklusive Software-Ordner)."
-    )
-    
-    payload = {
-        "model": MODEL_NAME,
-        "prompt": f"{system_prompt}\n\nKONTEXT:\n{context}\n\nFRAGE: {query}",
-        "stream": False 
-    }
+loader = load_resources()
+if loader.error:
+    st.error(f"Index/Modell konnte nicht geladen werden: {loader.error}")
+    if st.button("🔄 Erneut versuchen"):
+        load_resources.clear()
+        st.rerun()
+    st.stop()
+if not loader.ready:
+    done = sum(1 for phase in STARTUP_PHASES if phase in loader.timings)
+    st.info(f"⏳ Der Chatbot wärmt sich auf: {PHASE_LABELS.get(loader.phase, 'Start')} ... ({loader.elapsed:.0f} s)")
+    st.progress(done / len(STARTUP_PHASES))
+    st.chat_input("Frage zum Handbuch...", disabled=True)
+    time.sleep(STARTUP_POLL_S)
+    st.rerun()
+# Neue Index-Versionen (GUI/Batch-Job) lädt der IndexManager im Hintergrund; jede Anfrage least die
+# aktuelle Version, laufende Antworten enden auf der alten
+index = loader.index
 
-    try:
-        response = requests.post(OLLAMA_URL, json=payload, timeout=45)
-        response.raise_for_status()
-        answer = response.json()['response']
-        
-        # VERBESSERTER REGEX: Findet Pfade wie images/turbomed/diagramm_1.png
-        # Er sucht nach: (optional images/) + (beliebiger Ordnername/) + diagramm_X.png
-        raw_images = re.findall(r"(?:images/)?[\w-]+/diagramm_\d+\.png", answer)
-        
-        # Falls die KI den Pfad unvollständig nennt (z.B. nur "turbomed/diagramm_1.png")
-        clean_images = []
-        for img in raw_images:
-            if not img.startswith("images/"):
-                img = f"images/{img}"
-            clean_images.append(img)
-            
-        clean_answer = answer.split("BILD_REFERENZ:")[0].strip()
-        return clean_answer, list(set(clean_images)), source_chunks
-    except Exception as e:
-        return f"Fehler bei der Verbindung zu Ollama: {e}", [], []
+# --- CHAT-SITZUNG (pro Browser-Tab) ---
+# Hält den Ollama-Kontext der Unterhaltung, damit Folgefragen nicht alles neu vorverarbeiten
+if "chat_session" not in st.session_state:
+    st.session_state.chat_session = ChatSession(model=MODEL_NAME, url=OLLAMA_URL, k=5)
+chat_session = st.session_state.chat_session
 
 # --- SIDEBAR: QUELLEN-CHECK ---
 with st.sidebar:
     st.header("🔍 Quellen-Inspektor")
     st.info("Hier siehst du die Textabschnitte, die die KI gerade als Basis nutzt.")
+    st.caption(f"Start: {loader.format_timings()}")
+    if index.current:
+        st.caption(f"Index geladen {time.strftime('%H:%M:%S', time.localtime(index.current.loaded_at))}, "
+                   f"{len(index.vector_db.index_to_docstore_id)} Abschnitte, {index.reloads}× neu geladen")
+    if st.button("🧹 Neuer Chat"):
+        chat_session.reset()
+        st.session_state.messages = []
+        st.session_state.pop("last_sources", None)
+        st.rerun()
     if "last_sources" in st.session_state:
+        if chat_session.last_turn:
+            t = chat_session.last_turn["stats"]
+            st.caption(f"Embedding {t['embed_s'] * 1000:.0f} ms | Suche {t['search_s'] * 1000:.0f} ms | "
+                       f"erstes Token {t['ttft_s']:.1f} s | gesamt {t['total_s']:.1f} s | "
+                       f"Prefill {t['prompt_eval_count'] or 0} Token, {t['new_chunks']} neue Abschnitte")
         for src in st.session_state.last_sources:
-            st.markdown(f"**Kapitel: {src['header']}**")
+            marker = " ✅" if src.get("cited") else ""
+            st.markdown(f"**[{src.get('number', '?')}] Kapitel: {src['header']}**{marker}")
             st.markdown(f"<div class='source-box'>{src['content']}</div>", unsafe_allow_html=True)
     else:
         st.write("Noch keine Anfrage gestellt.")
@@ -113,25 +113,31 @@ if prompt := st.chat_input("Frage zum Handbuch..."):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        with st.spinner("Professor durchsucht das Handbuch..."):
-            answer, images, sources = ask_local_professor(prompt)
-            st.session_state.last_sources = sources # Für die Sidebar speichern
+        try:
+            # Antwort erscheint Token für Token; die QUELLEN-Zeile wird nach dem Rerun ausgeblendet
+            with index.lease() as vector_db:
+                st.write_stream(chat_session.ask_stream(vector_db, prompt))
+            turn = chat_session.last_turn
+            answer, images, sources = turn["answer"], turn["images"], turn["sources"]
+        except Exception as e:
+            answer, images, sources = f"Fehler bei der Verbindung zu Ollama: {e}", [], []
             st.markdown(answer)
-            
-            if images:
-                # Bilder in Spalten anzeigen, falls es mehrere sind
-                cols = st.columns(min(len(images), 2)) 
-                for idx, img in enumerate(images):
-                    full_path = IMAGE_BASE_DIR / img
-                    if full_path.exists():
-                        cols[idx % 2].image(str(full_path), caption=f"Referenz: {img}")
-                    else:
-                        st.error(f"Pfad-Fehler: {full_path} nicht gefunden!")
-            
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": answer, 
-                "images": images
-            })
-            # Sidebar aktualisieren (Rerun auslösen)
-            st.rerun()
\ No newline at end of file
+        st.session_state.last_sources = sources # Für die Sidebar speichern
+        
+        if images:
+            # Bilder in Spalten anzeigen, falls es mehrere sind
+            cols = st.columns(min(len(images), 2)) 
+            for idx, img in enumerate(images):
+                full_path = IMAGE_BASE_DIR / img
+                if full_path.exists():
+                    cols[idx % 2].image(str(full_path), caption=f"Referenz: {img}")
+                else:
+                    st.error(f"Pfad-Fehler: {full_path} nicht gefunden!")
+        
+        st.session_state.messages.append({
+            "role": "assistant", 
+            "content": answer, 
+            "images": images
+        })
+        # Sidebar aktualisieren (Rerun auslösen)
+        st.rerun()
\ No newline at end of file
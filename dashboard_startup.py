@@ -0,0 +1,115 @@
+import time
+import threading
+from pipeline_metrics import record_span
+from index_manager import IndexManager
+
+# Kaltstart des Chatbot-Dashboards: LangChain/FAISS/Embedding-Modell werden in einem Hintergrund-Thread
+# importiert und geladen, die Seite rendert sofort einen "Aufwärmen"-Zustand. Jede Phase wird als Span
+# "startup.<phase>" erfasst (:9465/metrics, optional ATM_METRICS_FILE) und im Dashboard angezeigt.
+# Teure Artefakte (Modell-Download, ONNX-Export) entstehen vorab mit "python dashboard_startup.py",
+# beim Start selbst wird nichts exportiert - so bleibt der Kaltstart begrenzt.
+STARTUP_PHASES = ("imports", "embeddings", "index", "warmup")
+WARMUP_QUERY = "Wie starte ich das Programm?"
+
+
+class ResourceLoader:
+    """
+    Loads embeddings and the FAISS index in a daemon thread. The dashboard polls phase,
+    ready and error on every rerun; timings holds the seconds of each finished phase.
+    When ready, index is a started IndexManager (hot reload of new index versions).
+    """
+
+    def __init__(self, index_path="faiss_index", embedding_backend=None):
+        self.index_path = index_path
+        self.embedding_backend = embedding_backend
+        self.phase = None
+        self.timings = {}
+        self.index = None
+        self.error = None
+        self.started = time.perf_counter()
+        self.finished = None
+        self._thread = threading.Thread(target=self._run, name="dashboard-startup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        return self.index is not None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def _phase(self, name, func):
+        self.phase = name
+        start = time.perf_counter()
+        error = None
+        try:
+            return func()
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.timings[name] = round(duration, 3)
+            record_span(f"startup.{name}", duration, error=error)
+
+    def _run(self):
+        try:
+            def imports():
+                import langchain_community.vectorstores # FAISS/numpy hier, damit "index" nur das Lesen misst
+                import embedding_backends
+                return embedding_backends
+
+            backends = self._phase("imports", imports)
+            backend = self.embedding_backend or backends.EMBEDDING_BACKEND
+            # export_missing=False: fehlt das ONNX-Modell, lieber sofort ein Fehler als ein minutenlanger Export
+            embeddings = self._phase("embeddings", lambda: backends.load_embeddings(backend, export_missing=False))
+            index = self._phase("index", lambda: IndexManager(self.index_path, embeddings).load())
+            # Erste Anfrage nicht mit Lazy-Init von Tokenizer/Session/FAISS-Seiten bezahlen
+            self._phase("warmup", lambda: index.vector_db.similarity_search(WARMUP_QUERY, k=1))
+            self.index = index.start()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.finished = time.perf_counter()
+            record_span("startup.total", self.elapsed, error=self.error and "startup")
+            print(f"Dashboard-Start: {self.format_timings()}")
+
+    def format_timings(self):
+        parts = [f"{name} {self.timings[name]:.1f} s" for name in STARTUP_PHASES if name in self.timings]
+        return " | ".join(parts + [f"gesamt {self.elapsed:.1f} s"])
+
+
+def prebuild(index_path="faiss_index", embedding_backend=None):
+    """
+    Creates everything the dashboard would otherwise build on its first start (model download,
+    ONNX export) and does one timed cold load, so the startup phases can be checked up front.
+    """
+    import embedding_backends
+    backend = embedding_backend or embedding_backends.EMBEDDING_BACKEND
+    if backend == "onnx":
+        model_file = embedding_backends.ONNX_MODEL_DIR / embedding_backends.ONNX_MODEL_FILE
+        if not model_file.exists():
+            embedding_backends.export_onnx_model()
+    else:
+        embedding_backends.load_embeddings(backend) # lädt das Modell in den Hugging-Face-Cache
+    loader = ResourceLoader(index_path, backend).start()
+    loader._thread.join()
+    return loader
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description="Prebuild the dashboard's artifacts and time its cold start")
+    parser.add_argument("--index", default="faiss_index")
+    parser.add_argument("--embedding-backend", choices=["torch", "onnx"])
+    args = parser.parse_args()
+
+    loader = prebuild(args.index, args.embedding_backend)
+    if loader.error:
+        print(f"Start fehlgeschlagen: {loader.error}")
+        sys.exit(1)
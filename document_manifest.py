@@ -0,0 +1,354 @@
+import re
+import json
+import bisect
+import hashlib
+from pathlib import Path
+
+# Gleiche Muster wie bisher in den einzelnen Stufen (H1 bis H3, Markdown-Bildlinks)
+HEADING_PATTERN = re.compile(r"^(#{1,3})\s+(.*)$")
+IMAGE_PATTERN = re.compile(r"!\[(.*?)\]\((.*?)\)")
+IMAGE_PLACEHOLDER = "<!-- image -->"
+DEFAULT_SECTION_TITLE = "Allgemein"
+MANIFEST_VERSION = 2 # 2: Platzhalter in Überschriften werden mitgezählt
+
+# Kontextfenster um ein Bild: grobe Token-Schätzung (ca. 4 Zeichen pro Token)
+CONTEXT_TOKEN_BUDGET = 350
+CHARS_PER_TOKEN = 4
+
+
+def manifest_path(md_path):
+    """Sidecar location of the manifest: foo_mapped.md -> foo_mapped.manifest.json"""
+    return Path(md_path).with_suffix(".manifest.json")
+
+
+def _fingerprint(md_bytes):
+    return {"size": len(md_bytes), "sha1": hashlib.sha1(md_bytes).hexdigest()}
+
+
+def build_manifest(md_text):
+    """
+    Parses the markdown ONCE and returns a JSON-serialisable manifest:
+
+    sections: {"id", "level", "title", "start", "end"}          (id 0 = text before the first heading)
+    blocks:   one per non-empty line, {"id", "type", "section", "start", "end", ...}
+              type "heading" | "text" | "image" | "placeholder"
+    images:   {"id", "path", "alt", "block", "section", "start", "end", "insert_at"}
+    placeholders: {"id", "block", "start", "end"}                  (docling "<!-- image -->" markers)
+
+    All offsets are byte offsets into the UTF-8 encoded markdown; "end" is exclusive.
+    insert_at is the end of the line that holds the image (where descriptions go).
+    """
+    md_bytes = md_text.encode("utf-8")
+    sections = [{"id": 0, "level": 0, "title": DEFAULT_SECTION_TITLE, "start": 0, "end": len(md_bytes)}]
+    blocks, images, placeholders = [], [], []
+    offset = 0
+
+    for line in md_text.splitlines(keepends=True):
+        line_bytes = line.encode("utf-8")
+        line_start, line_end = offset, offset + len(line_bytes)
+        offset = line_end
+        if not line.strip():
+            continue
+
+        # Platzhalter auf jeder Zeile erfassen (auch in Überschriften): Bild N gehört zu Platzhalter N
+        markers = []
+        pos = line.find(IMAGE_PLACEHOLDER)
+        while pos >= 0:
+            markers.append(line_start + len(line[:pos].encode("utf-8")))
+            pos = line.find(IMAGE_PLACEHOLDER, pos + len(IMAGE_PLACEHOLDER))
+        clean = line.replace(IMAGE_PLACEHOLDER, "")
+
+        heading_match = HEADING_PATTERN.match(line)
+        links = list(IMAGE_PATTERN.finditer(line))
+        section_id = len(sections) - 1
+        if heading_match:
+            title = heading_match.group(2).replace(IMAGE_PLACEHOLDER, "").strip()
+            sections[-1]["end"] = line_start
+            sections.append({
+                "id": len(sections),
+                "level": len(heading_match.group(1)),
+                "title": title,
+                "start": line_start,
+                "end": len(md_bytes),
+            })
+            blocks.append({"id": len(blocks), "type": "heading", "section": len(sections) - 1,
+                           "start": line_start, "end": line_end, "text": title})
+        elif links:
+            # Text neben dem Bildlink bleibt als Kontext erhalten
+            block = {"id": len(blocks), "type": "image", "section": section_id,
+                     "start": line_start, "end": line_end,
+                     "text": IMAGE_PATTERN.sub("", clean).strip()}
+            blocks.append(block)
+            for link in links:
+                prefix_len = len(line[:link.start()].encode("utf-8"))
+                link_len = len(link.group(0).encode("utf-8"))
+                images.append({
+                    "id": len(images) + 1,
+                    "path": link.group(2),
+                    "alt": link.group(1),
+                    "block": block["id"],
+                    "section": section_id,
+                    "start": line_start + prefix_len,
+                    "end": line_start + prefix_len + link_len,
+                    "insert_at": line_end,
+                })
+        elif markers:
+            blocks.append({"id": len(blocks), "type": "placeholder", "section": section_id,
+                           "start": line_start, "end": line_end, "text": clean.strip()})
+        else:
+            blocks.append({"id": len(blocks), "type": "text", "section": section_id,
+                           "start": line_start, "end": line_end, "text": line.strip()})
+
+        for byte_pos in markers:
+            placeholders.append({"id": len(placeholders) + 1, "block": blocks[-1]["id"],
+                                 "start": byte_pos, "end": byte_pos + len(IMAGE_PLACEHOLDER)})
+
+    return {
+        "version": MANIFEST_VERSION,
+        "source": _fingerprint(md_bytes),
+        "sections": sections,
+        "blocks": blocks,
+        "images": images,
+        "placeholders": placeholders,
+    }
+
+
+def write_manifest(md_path, manifest):
+    with open(manifest_path(md_path), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def write_document(md_path, md_bytes, manifest):
+    """Writes the markdown together with its (already computed) manifest."""
+    with open(md_path, "wb") as f:
+        f.write(md_bytes)
+    write_manifest(md_path, manifest)
+
+
+def load_document(md_path):
+    """
+    Returns (md_bytes, manifest) for a markdown file. The sidecar manifest is used
+    when it matches the file; otherwise (older files, edited by hand) it is built
+    once and written next to the markdown.
+    """
+    md_path = Path(md_path)
+    md_bytes = md_path.read_bytes()
+    sidecar = manifest_path(md_path)
+    if sidecar.exists():
+        try:
+            with open(sidecar, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION and manifest.get("source") == _fingerprint(md_bytes):
+                return md_bytes, manifest
+        except (OSError, ValueError):
+            pass
+
+    manifest = build_manifest(md_bytes.decode("utf-8"))
+    write_manifest(md_path, manifest)
+    return md_bytes, manifest
+
+
+def section_text(manifest, section_id):
+    """Clean chapter text (no image links) of one section, one line per block."""
+    return "\n".join(
+        b["text"] for b in manifest["blocks"]
+        if b["section"] == section_id and b["type"] in ("text", "image") and b["text"]
+    ).strip()
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _context_text(block):
+    return block["text"] if block["type"] in ("text", "image") else ""
+
+
+def context_window(manifest, block_id, max_tokens=CONTEXT_TOKEN_BUDGET):
+    """
+    Block ids of the text around one block (e.g. an image line), in document order.
+
+    The window grows alternately backwards and forwards from the block, stays inside
+    its section and stops in a direction as soon as the next block (plus the line break
+    that joins it) no longer fits into max_tokens. Text on the block itself always comes first.
+    """
+    blocks = manifest["blocks"]
+    anchor = blocks[block_id]
+    selected, used_chars = [], 0 # Zeichen des zusammengefügten Textes, wie in window_text
+    max_chars = max_tokens * CHARS_PER_TOKEN
+
+    own = _context_text(anchor)
+    if own:
+        selected.append(block_id)
+        used_chars += len(own)
+
+    # Anleitungstext steht meist VOR dem Screenshot, daher beginnt das Fenster rückwärts
+    cursors = {-1: block_id - 1, 1: block_id + 1}
+    open_directions = [-1, 1]
+    while open_directions:
+        for direction in list(open_directions):
+            pos = cursors[direction]
+            # leere Blöcke (Bildzeilen ohne Text, Platzhalter) überspringen
+            while 0 <= pos < len(blocks) and blocks[pos]["section"] == anchor["section"] \
+                    and not _context_text(blocks[pos]):
+                pos += direction
+            if not (0 <= pos < len(blocks)) or blocks[pos]["section"] != anchor["section"]:
+                open_directions.remove(direction)
+                continue
+            cost = len(_context_text(blocks[pos])) + (1 if selected else 0)
+            if used_chars + cost > max_chars and selected:
+                open_directions.remove(direction)
+                continue
+            selected.append(pos)
+            used_chars += cost
+            cursors[direction] = pos + direction
+    return sorted(selected)
+
+
+def window_text(manifest, block_ids, max_tokens=None, anchor=None):
+    """
+    Text of the given blocks in document order, at most max_tokens. If it is longer, the block
+    farthest from the anchor block is shortened (or dropped) first: blocks before the anchor keep
+    their end, blocks after it their beginning, so the text next to the image survives.
+    Without an anchor the first block counts as anchor, i.e. the end of the text is cut.
+    """
+    parts = [(i, _context_text(manifest["blocks"][i])) for i in sorted(set(block_ids))]
+    parts = [(i, text) for i, text in parts if text]
+    if max_tokens is not None and parts:
+        anchor = parts[0][0] if anchor is None else anchor
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        excess = sum(len(text) for _, text in parts) + len(parts) - 1 - max_chars
+        while excess > 0:
+            # bei gleichem Abstand zuerst den Block nach dem Bild kürzen
+            far = max(range(len(parts)), key=lambda k: (abs(parts[k][0] - anchor), parts[k][0] > anchor))
+            block_id, text = parts[far]
+            if len(parts) > 1 and excess >= len(text) + 1:
+                del parts[far]
+                excess -= len(text) + 1
+                continue
+            parts[far] = (block_id, text[excess:].lstrip() if block_id < anchor else text[:-excess].rstrip())
+            excess = 0
+    return "\n".join(text for _, text in parts).strip()
+
+
+def image_context(manifest, image, max_tokens=CONTEXT_TOKEN_BUDGET):
+    """Bounded context for one manifest image, taken from the blocks around its position."""
+    return window_text(manifest, context_window(manifest, image["block"], max_tokens), max_tokens, image["block"])
+
+
+def _is_safe_insertion(md_bytes, offset, snippet_manifest, text):
+    at_line_start = offset == 0 or md_bytes[offset - 1:offset] == b"\n"
+    return (at_line_start and text.endswith("\n") and len(snippet_manifest["sections"]) == 1
+            and not snippet_manifest["images"] and not snippet_manifest["placeholders"])
+
+
+def apply_insertions(md_bytes, manifest, insertions):
+    """
+    Inserts text at byte offsets and returns (new_bytes, new_manifest).
+
+    insertions: list of (offset, text). Plain text inserted at line boundaries
+    (e.g. image descriptions) only shifts the existing entries; anything that would
+    change the document structure falls back to a full rebuild.
+    """
+    insertions = sorted(insertions, key=lambda ins: ins[0])
+    parts, prev = [], 0
+    for offset, text in insertions:
+        parts.append(md_bytes[prev:offset])
+        parts.append(text.encode("utf-8"))
+        prev = offset
+    parts.append(md_bytes[prev:])
+    new_bytes = b"".join(parts)
+
+    snippets = [build_manifest(text) for _, text in insertions]
+    if not all(_is_safe_insertion(md_bytes, off, snip, text)
+               for (off, text), snip in zip(insertions, snippets)):
+        return new_bytes, build_manifest(new_bytes.decode("utf-8"))
+
+    offsets = [off for off, _ in insertions]
+    inserted_before = [0] # inserted_before[i] = Bytes der ersten i Einfügungen
+    for _, text in insertions:
+        inserted_before.append(inserted_before[-1] + len(text.encode("utf-8")))
+    section_starts = [sec["start"] for sec in manifest["sections"][1:]]
+
+    def shift(pos, include_equal=True):
+        # Summe aller Einfügungen vor (bzw. an) pos
+        return inserted_before[(bisect.bisect_right if include_equal else bisect.bisect_left)(offsets, pos)]
+
+    def section_at(pos):
+        # Text direkt vor einer Überschrift gehört noch zum vorherigen Kapitel
+        index = bisect.bisect_left(section_starts, pos)
+        return manifest["sections"][index]["id"] if index else 0
+
+    new_sections = []
+    for sec in manifest["sections"]:
+        sec = dict(sec)
+        if sec["id"] != 0:
+            sec["start"] += shift(sec["start"])
+        sec["end"] += shift(sec["end"])
+        new_sections.append(sec)
+
+    new_blocks = []
+    for b in manifest["blocks"]:
+        b = dict(b)
+        delta = shift(b["start"])
+        b["start"] += delta
+        b["end"] += delta
+        b["_old_id"] = b["id"]
+        new_blocks.append(b)
+
+    for i, ((offset, _), snip) in enumerate(zip(insertions, snippets)):
+        # Alle früheren Einfügungen (sortiert) liegen im neuen Text vor dieser
+        base = offset + inserted_before[i]
+        owner = section_at(offset)
+        for b in snip["blocks"]:
+            new_blocks.append({"id": None, "type": b["type"], "section": owner,
+                               "start": base + b["start"], "end": base + b["end"], "text": b["text"],
+                               "_old_id": None})
+
+    new_blocks.sort(key=lambda b: b["start"])
+    id_map = {}
+    for new_id, b in enumerate(new_blocks):
+        if b["_old_id"] is not None:
+            id_map[b["_old_id"]] = new_id
+        b["id"] = new_id
+        del b["_old_id"]
+
+    new_images = []
+    for img in manifest["images"]:
+        img = dict(img)
+        delta = shift(img["start"])
+        img["start"] += delta
+        img["end"] += delta
+        # insert_at liegt genau an der Einfügestelle; neue Beschreibungen kommen danach
+        img["insert_at"] += shift(img["insert_at"], include_equal=False)
+        img["block"] = id_map[img["block"]]
+        new_images.append(img)
+
+    new_placeholders = []
+    for ph in manifest["placeholders"]:
+        ph = dict(ph)
+        delta = shift(ph["start"])
+        ph["start"] += delta
+        ph["end"] += delta
+        ph["block"] = id_map[ph["block"]]
+        new_placeholders.append(ph)
+
+    return new_bytes, {
+        "version": MANIFEST_VERSION,
+        "source": _fingerprint(new_bytes),
+        "sections": new_sections,
+        "blocks": new_blocks,
+        "images": new_images,
+        "placeholders": new_placeholders,
+    }
+
+
+def replace_spans(md_bytes, replacements):
+    """Replaces (start, end, text) byte spans in one pass; spans must not overlap."""
+    parts, prev = [], 0
+    for start, end, text in sorted(replacements, key=lambda r: r[0]):
+        parts.append(md_bytes[prev:start])
+        parts.append(text.encode("utf-8"))
+        prev = end
+    parts.append(md_bytes[prev:])
+    return b"".join(parts)
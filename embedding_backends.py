@@ -0,0 +1,216 @@
+import json
+import math
+import time
+import platform
+from pathlib import Path
+from langchain_core.embeddings import Embeddings
+
+try:
+    import numpy as np
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Embedding-Backends für Indexierung und Chat:
+# "torch": sentence-transformers über HuggingFaceEmbeddings (Referenz, lädt PyTorch)
+# "onnx":  dasselbe Modell als ONNX-Export mit int8-Gewichten (dynamische Quantisierung) in onnxruntime,
+#          für CPU-Server ohne GPU: kleiner, schneller geladen, schneller pro Batch
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDING_BACKEND = "torch"
+ONNX_MODEL_DIR = Path("onnx_models") / "paraphrase-multilingual-MiniLM-L12-v2-int8"
+ONNX_MODEL_FILE = "model_quantized.onnx"
+ONNX_INFO_FILE = "export_info.json"
+ONNX_MAX_SEQ_LENGTH = 128 # wie sentence-transformers: längere Texte werden abgeschnitten
+ONNX_BATCH_SIZE = 32
+ONNX_THREADS = 0          # 0 = onnxruntime wählt (physische Kerne)
+# Vektoren des ONNX-Modells müssen so nah an der Referenz liegen, sonst passen Index und Anfragen
+# nicht mehr zusammen (ein mit "torch" gebauter Index wird ggf. mit "onnx" abgefragt)
+MIN_COSINE = 0.98
+VERIFY_TEXTS = [
+    "Wie richte ich einen neuen Drucker ein?",
+    "Klicken Sie auf 'Speichern', um die Änderungen zu übernehmen.",
+    "Das Passwort muss mindestens zwölf Zeichen lang sein und eine Ziffer enthalten.",
+    "Unter Einstellungen > Benutzer können neue Konten angelegt werden.",
+    "Die Exportfunktion erzeugt eine CSV-Datei mit allen markierten Einträgen.",
+    "[KI-ANALYSE] Der Screenshot zeigt den Dialog 'Neue Vorlage' mit den Feldern Name und Kategorie.",
+    "How do I change the language of the user interface?",
+    "Fehlercode 0x80070005: Zugriff verweigert. Prüfen Sie die Berechtigungen des Dienstkontos.",
+]
+
+
+def _cpu_flags():
+    try:
+        for line in Path("/proc/cpuinfo").read_text().splitlines():
+            if line.startswith("flags"):
+                return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def quantization_target():
+    """Instruction set the int8 kernels are quantized for (export on the target server)."""
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    flags = _cpu_flags()
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def export_onnx_model(model_dir=ONNX_MODEL_DIR, model_name=EMBEDDING_MODEL_NAME):
+    """Exports the model to ONNX (optimum), quantizes it to int8 and stores the tokenizer next to it."""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    model_dir = Path(model_dir)
+    fp32_dir = model_dir / "fp32"
+    print(f"Exportiere {model_name} nach ONNX ...")
+    start = time.perf_counter()
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(fp32_dir)
+    target = quantization_target()
+    config = getattr(AutoQuantizationConfig, target)(is_static=False, per_channel=False)
+    ORTQuantizer.from_pretrained(fp32_dir).quantize(save_dir=model_dir, quantization_config=config)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+
+    info = {
+        "model_name": model_name,
+        "quantization": f"int8 dynamic, {target}",
+        "export_s": round(time.perf_counter() - start, 1),
+        "fp32_mb": round((fp32_dir / "model.onnx").stat().st_size / 2**20, 1),
+        "int8_mb": round((model_dir / ONNX_MODEL_FILE).stat().st_size / 2**20, 1),
+    }
+    (model_dir / ONNX_INFO_FILE).write_text(json.dumps(info, indent=2), encoding="utf-8")
+    print(f"ONNX-Modell gespeichert: {model_dir} ({info['fp32_mb']} MB -> {info['int8_mb']} MB)")
+    return model_dir
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    LangChain embeddings on the quantized ONNX model: same tokenizer, truncation and mean
+    pooling as sentence-transformers, so vectors match the torch backend within MIN_COSINE.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, batch_size=ONNX_BATCH_SIZE, threads=ONNX_THREADS,
+                 max_seq_length=ONNX_MAX_SEQ_LENGTH, export_missing=True):
+        if not ONNX_AVAILABLE:
+            raise ImportError("Backend 'onnx' braucht onnxruntime: pip install optimum[onnxruntime]")
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir)
+        if not (model_dir / ONNX_MODEL_FILE).exists():
+            if not export_missing:
+                raise FileNotFoundError(f"Kein ONNX-Modell unter '{model_dir}' (python embedding_backends.py export)")
+            print(f"Kein ONNX-Modell unter '{model_dir}' - wird einmalig exportiert.")
+            export_onnx_model(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_dir / ONNX_MODEL_FILE), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        # tokenizer / max_seq_length wie beim sentence-transformers-Client (für den Token-Splitter)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = max_seq_length
+        self.batch_size = batch_size
+
+    def _embed(self, texts):
+        vectors = [None] * len(texts)
+        # Ähnlich lange Texte in einen Batch: weniger Padding, das sonst mitgerechnet wird
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self.tokenizer([texts[i] for i in batch], padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors="np")
+            feed = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+                feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+            hidden = self.session.run(None, feed)[0] # last_hidden_state: (batch, tokens, dim)
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            for i, vector in zip(batch, pooled):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts))
+
+    def embed_query(self, text):
+        return self._embed([text])[0]
+
+
+def load_embeddings(backend=None, export_missing=True):
+    """
+    backend: "torch" (reference) or "onnx"; default EMBEDDING_BACKEND.
+    export_missing=False raises instead of exporting a missing ONNX model.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    if backend == "onnx":
+        return OnnxEmbeddings(export_missing=export_missing)
+    raise ValueError(f"Unknown embedding backend '{backend}' (torch|onnx)")
+
+
+def cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def verify_backend(backend="onnx", texts=None, min_cosine=MIN_COSINE):
+    """
+    Embeds the same texts with the torch reference and the given backend; passes if every
+    pair of vectors has at least min_cosine. Also reports load time and texts/s of both.
+    """
+    texts = texts or VERIFY_TEXTS
+    result = {"backend": backend, "texts": len(texts), "min_cosine_required": min_cosine}
+    vectors = {}
+    for name in ("torch", backend):
+        start = time.perf_counter()
+        embeddings = load_embeddings(name)
+        load_s = time.perf_counter() - start
+        embeddings.embed_documents(texts[:2]) # Warm-up
+        start = time.perf_counter()
+        vectors[name] = embeddings.embed_documents(texts)
+        embed_s = time.perf_counter() - start
+        result[name] = {"load_s": round(load_s, 2), "texts_per_s": round(len(texts) / embed_s, 1) if embed_s else None}
+    cosines = [cosine(a, b) for a, b in zip(vectors["torch"], vectors[backend])]
+    result["min_cosine"] = round(min(cosines), 5)
+    result["mean_cosine"] = round(sum(cosines) / len(cosines), 5)
+    result["passed"] = result["min_cosine"] >= min_cosine
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description="Export and verify the quantized ONNX embedding backend")
+    parser.add_argument("command", choices=["export", "verify"])
+    parser.add_argument("--md", help="verify: sample text lines of this markdown file instead of the built-in texts")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--min-cosine", type=float, default=MIN_COSINE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx_model()
+    texts = None
+    if args.md:
+        from vector_transformer import sample_probe_sentences
+        texts = sample_probe_sentences(Path(args.md).read_text(encoding="utf-8"), count=args.samples)
+    report = verify_backend("onnx", texts, args.min_cosine)
+    print(json.dumps(report, indent=2))
+    info_path = ONNX_MODEL_DIR / ONNX_INFO_FILE
+    if info_path.exists():
+        info = json.loads(info_path.read_text(encoding="utf-8"))
+        info["verification"] = report
+        info_path.write_text(json.dumps(info, indent=2), encoding="utf-8")
+    if not report["passed"]:
+        print(f"ONNX-Vektoren weichen zu stark ab (min. Kosinus {report['min_cosine']} < {args.min_cosine}).")
+        sys.exit(1)
@@ -0,0 +1,117 @@
+import sys
+import math
+from pathlib import Path
+from document_manifest import load_document, window_text, estimate_tokens, CONTEXT_TOKEN_BUDGET
+from vision_payload import estimate_payload_tokens
+from vision_backends import make_backend
+from image_to_information import plan_image_jobs, plan_vision_groups, build_vision_prompt, build_group_prompt
+
+# Optional: exakte Token-Zählung, sonst grobe Schätzung (ca. 4 Zeichen pro Token)
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Annahmen für die Hochrechnung (Preise in USD pro 1 Mio. Tokens, Stand der Modellwahl)
+BACKEND_PROFILES = {
+    "openai": {
+        "price_input_per_m": 0.05,
+        "price_output_per_m": 0.40,
+        "request_overhead_s": 3.0,      # Upload + Warteschlange + Prefill
+        "output_tokens_per_s": 60.0,
+    },
+    "ollama": {
+        "price_input_per_m": 0.0,
+        "price_output_per_m": 0.0,
+        "request_overhead_s": 8.0,      # Bild-Encoder + Prefill auf lokaler GPU
+        "output_tokens_per_s": 25.0,
+    },
+}
+OUTPUT_TOKENS_PER_IMAGE = 300   # typische Länge einer Analyse im vorgegebenen Format
+BATCH_DISCOUNT = 0.5            # Batch API kostet die Hälfte (siehe vision_batch.py)
+
+
+def count_tokens(text):
+    if TIKTOKEN_AVAILABLE:
+        try:
+            return len(tiktoken.get_encoding("o200k_base").encode(text))
+        except Exception:
+            pass
+    return estimate_tokens(text)
+
+
+def estimate_enrichment(md_path, backend_name="openai", group_by_chapter=False, concurrency=None,
+                        context_tokens=CONTEXT_TOKEN_BUDGET):
+    """
+    Dry run of enrich_file: no request is sent, images are only measured (header read).
+    Returns a dict with images, requests, prompt/image/output tokens, cost (USD) and
+    projected wall-clock seconds at the given concurrency (default: the backend's max_workers).
+    """
+    md_path = Path(md_path)
+    backend = make_backend(backend_name) # nur für die Eckdaten, es wird nichts gesendet
+    profile = BACKEND_PROFILES[backend_name]
+    if concurrency is None:
+        concurrency = backend.max_workers
+
+    _, manifest = load_document(md_path)
+    jobs, missing = plan_image_jobs(manifest, md_path.parent, context_tokens)
+    groups = plan_vision_groups(jobs, group_by_chapter, backend.max_images_per_request)
+
+    prompt_tokens = image_tokens = output_tokens = 0
+    request_seconds = []
+    for group in groups:
+        if len(group) > 1:
+            shared_context = window_text(manifest, [b for job in group for b in job["context_blocks"]])
+            prompt = build_group_prompt(group[0]["heading"], shared_context, len(group))
+            prompt += "".join(f"BILD {n}:" for n in range(1, len(group) + 1))
+        else:
+            prompt = build_vision_prompt(group[0]["heading"], group[0]["context"])
+        prompt_tokens += count_tokens(prompt)
+        image_tokens += sum(estimate_payload_tokens(job["path"]) for job in group)
+        group_output = OUTPUT_TOKENS_PER_IMAGE * len(group)
+        output_tokens += group_output
+        request_seconds.append(profile["request_overhead_s"] + group_output / profile["output_tokens_per_s"])
+
+    input_tokens = prompt_tokens + image_tokens
+    cost = (input_tokens * profile["price_input_per_m"] + output_tokens * profile["price_output_per_m"]) / 1e6
+    # Requests laufen in Wellen zu je 'concurrency' Stück
+    concurrency = max(1, concurrency)
+    waves = math.ceil(len(request_seconds) / concurrency) if request_seconds else 0
+    avg_seconds = sum(request_seconds) / len(request_seconds) if request_seconds else 0.0
+
+    return {
+        "backend": backend_name,
+        "images": len(jobs),
+        "missing_images": len(missing),
+        "requests": len(groups),
+        "prompt_tokens": prompt_tokens,
+        "image_tokens": image_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": round(cost, 4),
+        "batch_cost_usd": round(cost * BATCH_DISCOUNT, 4),
+        "concurrency": concurrency,
+        "wall_seconds": round(waves * avg_seconds, 1),
+        "exact_tokens": TIKTOKEN_AVAILABLE,
+    }
+
+
+def format_estimate(estimate):
+    seconds = estimate["wall_seconds"]
+    duration = f"{seconds:.0f} s" if seconds < 90 else f"{seconds / 60:.0f} min"
+    approx = "" if estimate["exact_tokens"] else "~"
+    text = (f"{estimate['images']} images in {estimate['requests']} requests | "
+            f"{approx}{estimate['prompt_tokens'] + estimate['image_tokens']:,} input tokens "
+            f"({estimate['image_tokens']:,} image) | ")
+    if estimate["cost_usd"]:
+        text += f"≈ ${estimate['cost_usd']:.2f} (batch ${estimate['batch_cost_usd']:.2f}) | "
+    text += f"≈ {duration} at {estimate['concurrency']} parallel"
+    return text
+
+
+if __name__ == "__main__":
+    md_file = sys.argv[1] if len(sys.argv) > 1 else "extracted_data/documentname_mapped.md"
+    for name in BACKEND_PROFILES:
+        for grouped in (False, True):
+            estimate = estimate_enrichment(md_file, name, group_by_chapter=grouped)
+            print(f"{name:7s} {'grouped' if grouped else 'single '}: {format_estimate(estimate)}")
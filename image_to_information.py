@@ -1,58 +1,33 @@
 import os
 import re
-import base64
-import requests
 import json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from document_manifest import (load_document, apply_insertions, write_document, context_window, window_text,
+                               CONTEXT_TOKEN_BUDGET)
+from vision_payload import prepare_image_payload, PayloadStats
+from vision_backends import OpenAIVisionBackend, OPENAI_VISION_MODEL, MAX_IMAGES_PER_REQUEST
+from vision_resilience import ResilientBackend, is_retryable
+from pipeline_metrics import span
 
 # Konfiguration
 OPENAI_API_KEY = "Your_API_KEY"
+VISION_MODEL = OPENAI_VISION_MODEL
+GROUP_MARKER = re.compile(r"^=+\s*BILD\s+(\d+)\s*=+\s*$", re.MULTILINE)
 
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
-def get_chapter_contexts(lines):
+def get_image_contexts(manifest, max_tokens=CONTEXT_TOKEN_BUDGET):
     """
-    Extrahiert den reinen Textinhalt für jedes Kapitel (Überschrift).
-    Bilder-Links werden entfernt, um Rauschen im Kontext zu vermeiden.
+    Kontext pro Bild: die Textblöcke rund um die Bildposition (statt des ganzen Kapitels),
+    begrenzt auf max_tokens. Returns {image id: (block ids, text)}.
     """
     contexts = {}
-    current_h = "Allgemein"
-    current_text = []
-
-    for line in lines:
-        # Prüfung auf Überschrift (H1 bis H3)
-        heading_match = re.match(r"^#{1,3}\s+(.*)$", line)
-        if heading_match:
-            # Speichere alten Kontext ab
-            contexts[current_h] = "\n".join(current_text).strip()
-            # Neuer Kapitel-Name
-            current_h = heading_match.group(1).strip()
-            current_text = []
-        else:
-            # Entferne Bild-Links aus dem Kontext-Text
-            clean_line = re.sub(r"!\[.*?\]\(.*?\)", "", line).strip()
-            if clean_line:
-                current_text.append(clean_line)
-    
-    # Letztes Kapitel sichern
-    contexts[current_h] = "\n".join(current_text).strip()
+    for image in manifest["images"]:
+        block_ids = context_window(manifest, image["block"], max_tokens)
+        contexts[image["id"]] = (block_ids, window_text(manifest, block_ids, max_tokens, image["block"]))
     return contexts
 
-def get_vision_description(image_path, heading, context_text, api_key=None):
-    key_to_use = api_key if api_key else OPENAI_API_KEY
-    if not key_to_use or key_to_use == "Your_API_KEY":
-        raise ValueError("Missing OpenAI API Key")
-
-    base64_image = encode_image(image_path)
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {key_to_use}"
-    }
-
-    prompt = (
+def build_vision_prompt(heading, context_text):
+    return (
         f"Du bist ein Senior Technical Author für Software-Handbücher.\n"
         f"Kapitel: {heading}\n"
         f"Kontext (Handlungsanweisung): {context_text}\n\n"
@@ -69,89 +44,263 @@ def get_vision_description(image_path, heading, context_text, api_key=None):
         "Soll-Konfiguration: [Feldname]: [Wert] (Priorität: Text-Anweisung)"
     )
 
-    payload = {
-        "model": "gpt-5-nano-2025-08-07", # Updated to a widely available vision model
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{base64_image}"}
-                    }
-                ]
-            }
-        ]
-    }
-
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-    if response.status_code != 200:
-         raise Exception(f"API Error: {response.text}")
-         
-    return response.json()['choices'][0]['message']['content']
-
-def enrich_file(md_path, api_key=None, progress_callback=None):
+def build_group_prompt(heading, context_text, image_count):
+    """Same analysis as build_vision_prompt, but for several screenshots sharing one context."""
+    return (
+        build_vision_prompt(heading, context_text)
+        + f"\n\nDu erhältst {image_count} Screenshots aus diesem Kapitel, jeweils angekündigt mit 'BILD <n>'.\n"
+        "Analysiere JEDEN Screenshot einzeln im obigen Format. Beginne jeden Abschnitt mit einer eigenen Zeile\n"
+        "'=== BILD <n> ===' (n = Nummer des Screenshots) und lasse keinen Screenshot aus."
+    )
+
+def image_content_parts(image_payload):
+    return [
+        {
+            "type": "image_url",
+            "image_url": {"url": part["url"], "detail": part["detail"]}
+        }
+        for part in image_payload["parts"]
+    ]
+
+def build_request_body(content):
+    """OpenAI request body (also used for the batch export and the prompt preview)."""
+    return OpenAIVisionBackend(model=VISION_MODEL).build_request_body(content)
+
+def default_backend(api_key=None):
+    return OpenAIVisionBackend(api_key=api_key if api_key else OPENAI_API_KEY, model=VISION_MODEL)
+
+def post_vision_request(content, api_key=None, backend=None, image_count=1):
+    """Sends one vision request with the given user content and returns the answer text."""
+    backend = backend or default_backend(api_key)
+    if not isinstance(backend, ResilientBackend):
+        backend = ResilientBackend(backend)
+    with span("vision.request", unit="images", backend=backend.name) as attrs:
+        answer = backend.describe(content)
+        attrs["items"] = image_count # nur erfolgreiche Requests zählen als verarbeitete Bilder
+        return answer
+
+def _prepare_for(backend, image_path):
+    if backend is not None and backend.image_format:
+        return prepare_image_payload(image_path, image_format=backend.image_format)
+    return prepare_image_payload(image_path)
+
+def get_vision_description(image_path, heading, context_text, api_key=None, payload_stats=None, backend=None):
+    # Verkleinert/kachelt das Bild und kodiert es kompakt statt das 2x-PNG roh zu schicken
+    image_payload = _prepare_for(backend, image_path)
+    if payload_stats is not None:
+        payload_stats.add(image_payload)
+
+    job = {"heading": heading, "context": context_text}
+    return post_vision_request(build_single_content(job, image_payload), api_key, backend)
+
+def split_group_response(answer, image_count):
+    """Splits a grouped answer at the '=== BILD <n> ===' markers -> {n: text} (n is 1-based)."""
+    descriptions = {}
+    markers = list(GROUP_MARKER.finditer(answer))
+    for i, marker in enumerate(markers):
+        n = int(marker.group(1))
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(answer)
+        text = answer[marker.end():end].strip()
+        if 1 <= n <= image_count and text and n not in descriptions:
+            descriptions[n] = text
+    return descriptions
+
+def get_group_vision_descriptions(image_paths, heading, context_text, api_key=None, payload_stats=None,
+                                  backend=None):
+    """
+    Describes several images of one chapter in ONE request; the chapter context is sent once.
+    Returns {n: description} for the images the model answered (n is 1-based).
+    """
+    content = [{"type": "text", "text": build_group_prompt(heading, context_text, len(image_paths))}]
+    for n, image_path in enumerate(image_paths, 1):
+        image_payload = _prepare_for(backend, image_path)
+        if payload_stats is not None:
+            payload_stats.add(image_payload)
+        content.append({"type": "text", "text": f"BILD {n}:"})
+        content.extend(image_content_parts(image_payload))
+
+    answer = post_vision_request(content, api_key, backend, image_count=len(image_paths))
+    return split_group_response(answer, len(image_paths))
+
+def plan_image_jobs(manifest, image_base_dir, context_tokens=CONTEXT_TOKEN_BUDGET):
+    """
+    One job per manifest image whose file exists: image, path, section, heading and context window.
+    Returns (jobs, missing images).
+    """
+    image_contexts = get_image_contexts(manifest, context_tokens)
+    section_titles = {s["id"]: s["title"] for s in manifest["sections"]}
+    jobs, missing = [], []
+    for image in manifest["images"]:
+        full_img_path = Path(image_base_dir) / image["path"]
+        if not full_img_path.exists():
+            missing.append(image)
+            continue
+        block_ids, context_text = image_contexts[image["id"]]
+        jobs.append({
+            "image": image,
+            "path": full_img_path,
+            "section": image["section"],
+            "heading": section_titles[image["section"]],
+            # Nur der Text rund um das Bild, nicht das ganze Kapitel
+            "context": context_text,
+            "context_blocks": block_ids,
+        })
+    return jobs, missing
+
+def build_single_content(job, image_payload):
+    """User message content of a single-image request (prompt + image parts)."""
+    prompt = build_vision_prompt(job["heading"], job["context"])
+    return [{"type": "text", "text": prompt}] + image_content_parts(image_payload)
+
+def plan_vision_groups(jobs, group_by_chapter, max_images=MAX_IMAGES_PER_REQUEST):
+    """Cuts the image jobs into request groups: one per image, or per chapter (max. max_images)."""
+    if not group_by_chapter:
+        return [[job] for job in jobs]
+    groups = []
+    for job in jobs:
+        if groups and groups[-1][0]["section"] == job["section"] and len(groups[-1]) < max_images:
+            groups[-1].append(job)
+        else:
+            groups.append([job])
+    return groups
+
+def describe_group(group, manifest, backend, payload_stats):
+    """
+    Runs the request(s) for one group -> ({image id: description}, deferred jobs, request count).
+    Jobs that failed with a transient error (timeout, 429, 5xx) are returned as deferred
+    instead of being marked as failed, so the run can retry them at the end.
+    """
+    descriptions = {}
+    deferred = []
+    request_count = 0
+    pending = group
+    if len(group) > 1:
+        request_count += 1
+        names = ", ".join(job["image"]["path"] for job in group)
+        try:
+            # Gemeinsamer Kontext = Vereinigung der Fenster, jeder Block nur einmal
+            shared_context = window_text(manifest, [b for job in group for b in job["context_blocks"]])
+            answers = get_group_vision_descriptions(
+                [job["path"] for job in group], group[0]["heading"], shared_context,
+                payload_stats=payload_stats, backend=backend
+            )
+            for n, job in enumerate(group, 1):
+                if n in answers:
+                    descriptions[job["image"]["id"]] = f"KI-ANALYSE: {answers[n].strip()}"
+            pending = [job for job in group if job["image"]["id"] not in descriptions]
+        except Exception as e:
+            print(f"Fehler bei Sammelanfrage ({names}): {e}")
+            if is_retryable(e):
+                # Backend hat gerade Probleme -> nicht sofort mit Einzelanfragen nachlegen
+                return descriptions, list(group), request_count
+
+    # Einzelanfragen (auch als Fallback für Bilder, die in der Sammelantwort fehlen)
+    for job in pending:
+        request_count += 1
+        try:
+            description = get_vision_description(job["path"], job["heading"], job["context"],
+                                                 payload_stats=payload_stats, backend=backend)
+            descriptions[job["image"]["id"]] = f"KI-ANALYSE: {description.strip()}"
+        except Exception as e:
+            print(f"Fehler bei {job['image']['path']}: {e}")
+            if is_retryable(e):
+                deferred.append(job)
+            else:
+                descriptions[job["image"]["id"]] = f"KI-ANALYSE fehlgeschlagen: {str(e)}"
+    return descriptions, deferred, request_count
+
+def enrich_file(md_path, api_key=None, progress_callback=None, group_by_chapter=False,
+                context_tokens=CONTEXT_TOKEN_BUDGET, backend=None, metrics=None):
     """
     Reads the markdown file, analyzes images, and appends the analysis.
     Returns the path to the new file.
-    progress_callback: function(current, total, message)
+    progress_callback: function(current, total, message), called from the calling thread as requests finish
+    group_by_chapter: send the images of a chapter together in one request with the
+                      shared chapter context instead of repeating it per image.
+    context_tokens: size of the text window around each image that is sent as context.
+    backend: VisionBackend (default: OpenAI with api_key); its max_workers requests run in parallel.
+             Requests get retries with backoff and a circuit breaker (vision_resilience).
+    metrics: optional ResilienceMetrics that collects failure/retry counters of this run.
     """
     input_path = Path(md_path)
     if not input_path.exists():
         raise FileNotFoundError(f"{md_path} not found")
+    backend = backend or default_backend(api_key)
+    if not isinstance(backend, ResilientBackend):
+        backend = ResilientBackend(backend, metrics=metrics)
+    metrics = backend.metrics
 
-    with open(input_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+    # Struktur kommt aus dem Manifest der Extraktion, kein zeilenweises Regex-Parsing
+    md_bytes, manifest = load_document(input_path)
 
-    # Schritt 1: Gesamten Kapitel-Kontext vorab berechnen
-    chapter_contexts = get_chapter_contexts(lines)
-    
-    enriched_content = []
-    current_heading = "Allgemein"
     image_base_dir = input_path.parent 
-    
-    # Pre-count images for progress
-    total_images = sum(1 for line in lines if re.search(r"!\[.*?\]\((.*?)\)", line))
+    total_images = len(manifest["images"])
+    request_count = 0
+    payload_stats = PayloadStats()
+    descriptions = {} # image id -> Text der Analyse (oder Fehlermeldung)
+
+    # Schritt 1: Kontextfenster um jedes Bild vorab berechnen
+    jobs, missing = plan_image_jobs(manifest, image_base_dir, context_tokens)
     processed_images = 0
-    
-    # Schritt 2: Dokument verarbeiten und Bilder analysieren
-    for line in lines:
-        heading_match = re.match(r"^(#{1,3})\s+(.*)$", line)
-        if heading_match:
-            current_heading = heading_match.group(2).strip()
-        
-        enriched_content.append(line)
-        
-        img_match = re.search(r"!\[.*?\]\((.*?)\)", line)
-        if img_match:
-            processed_images += 1
-            img_rel_path = img_match.group(1)
-            full_img_path = image_base_dir / img_rel_path
-            
-            if full_img_path.exists():
-                msg = f"Analyzing {processed_images}/{total_images}: {img_rel_path}..."
-                print(msg)
-                if progress_callback:
-                    progress_callback(processed_images, total_images, msg)
-                
-                # Hol den sauberen Text für dieses Kapitel
-                context = chapter_contexts.get(current_heading, "")
-                
-                try:
-                    description = get_vision_description(full_img_path, current_heading, context, api_key)
-                    enriched_content.append(f"\n> [KI-ANALYSE: {description.strip()}]\n\n")
-                except Exception as e:
-                    print(f"Fehler bei {img_rel_path}: {e}")
-                    enriched_content.append(f"\n> [KI-ANALYSE fehlgeschlagen: {str(e)}]\n\n")
-            else:
-               if progress_callback:
-                    progress_callback(processed_images, total_images, f"Skipping missing: {img_rel_path}")
+    for image in missing:
+        processed_images += 1
+        if progress_callback:
+            progress_callback(processed_images, total_images, f"Skipping missing: {image['path']}")
+
+    # Schritt 2: Bilder analysieren (einzeln oder kapitelweise gebündelt), parallel je nach Backend
+    groups = plan_vision_groups(jobs, group_by_chapter, backend.max_images_per_request)
+    print(f"Backend: {backend.name}, {len(groups)} Anfragen, {backend.max_workers} parallel")
+    deferred = []
+    with ThreadPoolExecutor(max_workers=max(1, backend.max_workers)) as pool:
+        futures = {pool.submit(describe_group, group, manifest, backend, payload_stats): group for group in groups}
+        for future in as_completed(futures):
+            group = futures[future]
+            group_descriptions, group_deferred, group_requests = future.result()
+            descriptions.update(group_descriptions)
+            deferred.extend(group_deferred)
+            request_count += group_requests
+
+            processed_images += len(group)
+            names = ", ".join(job["image"]["path"] for job in group)
+            msg = f"Analyzed {processed_images}/{total_images}: {names}"
+            print(msg)
+            if progress_callback:
+                progress_callback(processed_images, total_images, msg)
+
+    # Schritt 3: vorübergehend fehlgeschlagene Bilder am Ende nochmal einzeln versuchen
+    if deferred:
+        metrics.add("deferred", len(deferred))
+        msg = f"Retrying {len(deferred)} images that failed with transient errors..."
+        print(msg)
+        if progress_callback:
+            progress_callback(total_images, total_images, msg)
+    for job in deferred:
+        request_count += 1
+        try:
+            description = get_vision_description(job["path"], job["heading"], job["context"],
+                                                 payload_stats=payload_stats, backend=backend)
+            descriptions[job["image"]["id"]] = f"KI-ANALYSE: {description.strip()}"
+            metrics.add("recovered")
+        except Exception as e:
+            print(f"Fehler bei {job['image']['path']} (Nachhol-Runde): {e}")
+            descriptions[job["image"]["id"]] = f"KI-ANALYSE fehlgeschlagen: {str(e)}"
+    metrics.add("final_failures", sum(1 for text in descriptions.values() if text.startswith("KI-ANALYSE fehlgeschlagen")))
 
+    # Ergebnis direkt hinter der jeweiligen Bildzeile einfügen
+    insertions = [
+        (job["image"]["insert_at"], f"\n> [{descriptions[job['image']['id']]}]\n\n")
+        for job in jobs
+    ]
+    enriched_bytes, enriched_manifest = apply_insertions(md_bytes, manifest, insertions)
     output_path = input_path.parent / f"{input_path.stem}_enriched.md"
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.writelines(enriched_content)
+    write_document(output_path, enriched_bytes, enriched_manifest)
     
+    print(f"Requests: {request_count} für {len(jobs)} Bilder")
+    print(f"Upload: {payload_stats.summary()}")
+    print(f"Fehler/Retries: {metrics.summary()}")
+    if progress_callback:
+        progress_callback(total_images, total_images, f"Requests: {request_count} | Upload: {payload_stats.summary()}")
+        progress_callback(total_images, total_images, f"Errors/Retries: {metrics.summary()}")
     print(f"--- Enrichment abgeschlossen: {output_path} ---")
     return str(output_path)
 
@@ -0,0 +1,151 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from pipeline_metrics import span, count
+from index_snapshots import INDEX_FILES, current_snapshot, load_index
+
+# Hot Reload des FAISS-Index im laufenden Dashboard: ein Watcher-Thread erkennt eine neue Index-Version
+# (GUI oder Batch-Job haben neu indexiert), lädt sie im Hintergrund und tauscht sie atomar aus.
+# Anfragen holen sich per lease() die aktuelle Version; laufende Anfragen beenden ihre Antwort auf der
+# alten Version, die erst danach freigegeben wird (bei CPython sofort, sobald die letzte Referenz fällt).
+# Version = id des veröffentlichten Snapshots (index_snapshots.py), bei alten Indizes ohne Snapshots
+# die Änderungszeit der Index-Dateien.
+INDEX_POLL_S = 10      # Sekunden zwischen zwei Versionsprüfungen
+
+
+def index_version(index_path):
+    """Published snapshot id, for legacy folders (mtime_ns, size) of the files; None if incomplete."""
+    snapshot_id = current_snapshot(index_path)
+    if snapshot_id:
+        return f"snapshot:{snapshot_id}"
+    parts = []
+    for name in INDEX_FILES:
+        try:
+            stat = os.stat(Path(index_path) / name)
+        except OSError:
+            return None
+        parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+    return "|".join(parts)
+
+
+class LoadedIndex:
+    def __init__(self, version, vector_db):
+        self.version = version
+        self.vector_db = vector_db
+        self.loaded_at = time.time()
+        self.leases = 0
+
+
+class IndexManager:
+    """
+    Owns the loaded FAISS index of one process. lease() yields the current vector store for
+    one query; a background thread polls index_version() and swaps in a new version. Legacy
+    folders must be stable for two polls (save_local writes the two files one after the other).
+    """
+
+    def __init__(self, index_path, embeddings, poll_interval=INDEX_POLL_S):
+        self.index_path = index_path
+        self.embeddings = embeddings # Modell bleibt geladen, nur der Index wird neu gelesen
+        self.poll_interval = poll_interval
+        self.current = None
+        self.retired = []      # ersetzte Versionen, die noch Leases haben
+        self.reloads = 0
+        self.last_error = None
+        self._seen = None      # zuletzt gesehene, noch nicht geladene Version
+        self._failed = None    # Version, deren Laden fehlschlug (nicht endlos wiederholen)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load(self, version):
+        with span("index.load"):
+            vector_db = load_index(self.index_path, self.embeddings)
+        return LoadedIndex(version, vector_db)
+
+    def load(self):
+        """Synchronous first load; raises if there is no index."""
+        version = index_version(self.index_path)
+        if version is None:
+            raise FileNotFoundError(f"Kein vollständiger Index unter '{self.index_path}'")
+        self._swap(self._load(version))
+        return self
+
+    @property
+    def vector_db(self):
+        return self.current.vector_db if self.current else None
+
+    @property
+    def version(self):
+        return self.current.version if self.current else None
+
+    @contextmanager
+    def lease(self):
+        """Pins the current version for the duration of one query (including the streamed answer)."""
+        with self._lock:
+            entry = self.current
+            entry.leases += 1
+        try:
+            yield entry.vector_db
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                if entry is not self.current and entry.leases == 0:
+                    self._release(entry)
+
+    def _swap(self, entry):
+        with self._lock:
+            old, self.current = self.current, entry
+            if old is not None:
+                if old.leases:
+                    self.retired.append(old)
+                else:
+                    self._release(old)
+
+    def _release(self, entry):
+        # unter self._lock aufgerufen
+        if entry in self.retired:
+            self.retired.remove(entry)
+        entry.vector_db = None
+        count("index.released")
+
+    def check(self):
+        """One poll: reloads if a new version has been seen twice in a row. Returns True on swap."""
+        version = index_version(self.index_path)
+        if version is None or version == self.version or version == self._failed:
+            self._seen = None
+            return False
+        if version != self._seen and not version.startswith("snapshot:"):
+            self._seen = version # erst beim nächsten Poll laden, falls noch geschrieben wird
+            return False
+        try:
+            entry = self._load(version)
+        except Exception as e:
+            self._failed, self.last_error = version, f"{type(e).__name__}: {e}"
+            print(f"Neuer Index konnte nicht geladen werden, alte Version bleibt aktiv: {self.last_error}")
+            return False
+        # Hat sich der Index während des Ladens erneut geändert, gilt die geladene Version trotzdem;
+        # die neuere wird beim nächsten Poll erkannt
+        self._swap(entry)
+        self._seen, self.last_error = None, None
+        self.reloads += 1
+        count("index.reloads")
+        print(f"Index neu geladen ({self.index_path}, {len(entry.vector_db.index_to_docstore_id)} Chunks)")
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="index-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import uuid
+from pathlib import Path
+
+# Versionierte Index-Snapshots: jeder Indexierungslauf schreibt einen neuen, danach unveränderlichen Ordner
+# <index_path>/snapshots/<id>/ (index.faiss, index.pkl, manifest.json) und veröffentlicht ihn, indem die
+# Datei <index_path>/CURRENT atomar (os.replace) auf die neue id zeigt. Leser sehen so immer einen
+# vollständigen Stand; ein Absturz beim Speichern hinterlässt nur einen unfertigen .tmp-Ordner.
+# Dateien mit gleichem Inhalt wie in einem älteren Snapshot werden per Hardlink geteilt.
+# Alte Indizes ohne CURRENT (index.faiss direkt im Ordner) werden weiter gelesen und beim nächsten
+# Schreiben zum ersten Snapshot.
+SNAPSHOT_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+INDEX_FILES = ("index.faiss", "index.pkl")
+SNAPSHOT_KEEP = 5        # so viele Snapshots bleiben für ein Rollback erhalten
+STALE_TMP_S = 3600       # unfertige Snapshots (abgebrochene Läufe) werden nach einer Stunde entfernt
+
+
+def fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return # Windows: Ordner lassen sich nicht öffnen
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomic(path, text):
+    """Writes a small text file via tmp file + fsync + os.replace."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path.parent)
+
+
+def current_snapshot(index_path):
+    try:
+        return (Path(index_path) / CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def list_snapshots(index_path):
+    """Published snapshot ids, oldest first (ids start with a timestamp)."""
+    root = Path(index_path) / SNAPSHOT_DIR
+    if not root.is_dir():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith(".")
+                  and (p / MANIFEST_FILE).exists())
+
+
+def read_manifest(index_path, snapshot_id):
+    return json.loads((Path(index_path) / SNAPSHOT_DIR / snapshot_id / MANIFEST_FILE).read_text(encoding="utf-8"))
+
+
+def resolve_index_dir(index_path):
+    """Folder to load with FAISS.load_local: the current snapshot, the legacy flat folder, or None."""
+    snapshot_id = current_snapshot(index_path)
+    if snapshot_id:
+        return Path(index_path) / SNAPSHOT_DIR / snapshot_id
+    if all((Path(index_path) / name).exists() for name in INDEX_FILES):
+        return Path(index_path)
+    return None
+
+
+def load_index(index_path, embeddings):
+    """Loads the published index (snapshot or legacy layout); FileNotFoundError if there is none."""
+    from langchain_community.vectorstores import FAISS
+    folder = resolve_index_dir(index_path)
+    if folder is None:
+        raise FileNotFoundError(f"Kein Index unter '{index_path}'")
+    return FAISS.load_local(str(folder), embeddings, allow_dangerous_deserialization=True)
+
+
+def _dedupe(folder, index_path, hashes):
+    """Replaces files whose content already exists in a kept snapshot by a hardlink to it."""
+    known = {}
+    for snapshot_id in list_snapshots(index_path):
+        try:
+            files = read_manifest(index_path, snapshot_id)["files"]
+        except (OSError, ValueError, KeyError):
+            continue
+        for name, info in files.items():
+            known.setdefault(info["sha256"], Path(index_path) / SNAPSHOT_DIR / snapshot_id / name)
+    shared = []
+    for name, digest in hashes.items():
+        source = known.get(digest)
+        if source is None or not source.exists():
+            continue
+        link = folder / f".{name}.link"
+        try:
+            os.link(source, link)
+        except OSError:
+            continue # Dateisystem ohne Hardlinks: Kopie bleibt
+        os.replace(link, folder / name)
+        shared.append(name)
+    return shared
+
+
+def publish_snapshot(vector_db, index_path, keep=SNAPSHOT_KEEP, source=None, batches=None):
+    """
+    Saves vector_db as a new snapshot and points CURRENT at it. Returns the snapshot id.
+    Only the CURRENT swap is visible to readers; everything before happens in a tmp folder.
+    batches: ids of all ingest batches contained in the index (see ingest_writer.py).
+    """
+    root = Path(index_path) / SNAPSHOT_DIR
+    root.mkdir(parents=True, exist_ok=True)
+    parent = current_snapshot(index_path)
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    snapshot_id = f"{stamp}-{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:6]}"
+    tmp = root / f".tmp-{snapshot_id}"
+    vector_db.save_local(str(tmp))
+
+    hashes = {name: _sha256(tmp / name) for name in INDEX_FILES}
+    shared = _dedupe(tmp, index_path, hashes)
+    manifest = {
+        "id": snapshot_id,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "parent": parent,
+        "source": str(source) if source else None,
+        "chunks": len(vector_db.index_to_docstore_id),
+        "files": {name: {"sha256": hashes[name], "bytes": (tmp / name).stat().st_size, "shared": name in shared}
+                  for name in INDEX_FILES},
+        "batches": sorted(batches or []),
+    }
+    (tmp / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    for name in INDEX_FILES + (MANIFEST_FILE,):
+        with open(tmp / name, "rb") as f:
+            os.fsync(f.fileno())
+    fsync_dir(tmp)
+    os.replace(tmp, root / snapshot_id)
+    fsync_dir(root)
+
+    write_atomic(Path(index_path) / CURRENT_FILE, snapshot_id)
+    prune_snapshots(index_path, keep)
+    return snapshot_id
+
+
+def prune_snapshots(index_path, keep=SNAPSHOT_KEEP):
+    """Removes all but the newest keep snapshots (never the current one) and stale tmp folders."""
+    root = Path(index_path) / SNAPSHOT_DIR
+    current = current_snapshot(index_path)
+    removed = []
+    for snapshot_id in list_snapshots(index_path)[:-keep] if keep > 0 else []:
+        if snapshot_id != current:
+            shutil.rmtree(root / snapshot_id, ignore_errors=True) # geteilte Dateien leben im Hardlink weiter
+            removed.append(snapshot_id)
+    if root.is_dir():
+        for tmp in root.glob(".tmp-*"):
+            if time.time() - tmp.stat().st_mtime > STALE_TMP_S:
+                shutil.rmtree(tmp, ignore_errors=True)
+    return removed
+
+
+def rollback(index_path, snapshot_id=None):
+    """Points CURRENT at snapshot_id, by default at the snapshot before the current one."""
+    snapshots = list_snapshots(index_path)
+    if snapshot_id is None:
+        current = current_snapshot(index_path)
+        older = [s for s in snapshots if current is None or s < current]
+        if not older:
+            raise ValueError("Kein älterer Snapshot vorhanden")
+        snapshot_id = older[-1]
+    if snapshot_id not in snapshots:
+        raise ValueError(f"Snapshot '{snapshot_id}' nicht gefunden")
+    write_atomic(Path(index_path) / CURRENT_FILE, snapshot_id)
+    return snapshot_id
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(description="List, roll back and prune index snapshots")
+    parser.add_argument("command", choices=["list", "rollback", "prune"])
+    parser.add_argument("snapshot", nargs="?", help="rollback: target snapshot id (default: the previous one)")
+    parser.add_argument("--index", default="faiss_index")
+    parser.add_argument("--keep", type=int, default=SNAPSHOT_KEEP)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        current = current_snapshot(args.index)
+        for snapshot_id in list_snapshots(args.index):
+            manifest = read_manifest(args.index, snapshot_id)
+            size_mb = sum(f["bytes"] for f in manifest["files"].values()) / 2**20
+            shared = [name for name, f in manifest["files"].items() if f.get("shared")]
+            print(f"{'*' if snapshot_id == current else ' '} {snapshot_id}  {manifest['chunks']:>7} Chunks  "
+                  f"{size_mb:7.1f} MB  {manifest['source'] or ''}{'  geteilt: ' + ', '.join(shared) if shared else ''}")
+        if current is None and resolve_index_dir(args.index):
+            print("Alter Index ohne Snapshots (wird beim nächsten Indexieren übernommen)")
+    elif args.command == "rollback":
+        try:
+            print(f"CURRENT -> {rollback(args.index, args.snapshot)}")
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    else:
+        removed = prune_snapshots(args.index, args.keep)
+        print(f"Entfernt: {', '.join(removed) or 'nichts'}")
@@ -0,0 +1,290 @@
+import os
+import time
+import json
+import pickle
+import socket
+import hashlib
+import threading
+from pathlib import Path
+from pipeline_metrics import span, count
+from index_snapshots import current_snapshot, read_manifest, resolve_index_dir, publish_snapshot, fsync_dir
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    import msvcrt # Windows
+    FCNTL_AVAILABLE = False
+
+# Ein einziger Schreiber pro Index: Ingest-Worker (GUI, Batch-Jobs) berechnen Chunks und Vektoren selbst und
+# legen sie als Batch in ein dauerhaftes Log (<index_path>/ingest/pending/). Nur der Prozess, der
+# ingest/writer.lock hält, lädt den Index, fügt alle wartenden Batches in einem Gruppen-Commit hinzu und
+# veröffentlicht einen Snapshot. So geht kein Update verloren, und parallele Ingests warten nur auf das
+# Anhängen an den Index, nicht auf Parsing und Embedding der anderen.
+# Batch-ids sind ein Hash des Inhalts: ein erneut eingereichter, schon enthaltener Batch wird übersprungen.
+INGEST_DIR = "ingest"
+LOCK_FILE = "writer.lock"
+GROUP_WAIT_S = 0.5        # Dienst bzw. mehrere wartende Batches: kurz auf weitere warten (ein Snapshot für alle)
+GROUP_MAX_CHUNKS = 50000  # Obergrenze pro Gruppen-Commit
+WRITER_POLL_S = 1.0       # Dienst: Sekunden zwischen zwei Blicken ins Log
+
+
+def ingest_dirs(index_path):
+    root = Path(index_path) / INGEST_DIR
+    dirs = {name: root / name for name in ("tmp", "pending", "rejected")}
+    for folder in dirs.values():
+        folder.mkdir(parents=True, exist_ok=True)
+    return root, dirs
+
+
+def batch_id_for(texts, metadatas):
+    payload = json.dumps([texts, metadatas], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def submit_batch(index_path, texts, vectors, metadatas, source=None, batch_id=None):
+    """
+    Durably appends one batch to the ingest log: tmp file per worker, fsync, rename into pending.
+    Returns the batch id (content hash unless given).
+    """
+    _, dirs = ingest_dirs(index_path)
+    batch_id = batch_id or batch_id_for(texts, metadatas)
+    worker = f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+    batch = {"batch_id": batch_id, "source": str(source) if source else None, "worker": worker,
+             "created": time.time(), "texts": texts, "vectors": [list(map(float, v)) for v in vectors],
+             "metadatas": metadatas}
+    tmp = dirs["tmp"] / f"{worker}-{batch_id[:16]}.pkl"
+    with open(tmp, "wb") as f:
+        pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, dirs["pending"] / f"{time.time_ns()}-{batch_id[:16]}.pkl") # Name sortiert in Ankunftsreihenfolge
+    fsync_dir(dirs["pending"])
+    count("ingest.batches_submitted")
+    return batch_id
+
+
+def pending_batches(index_path):
+    _, dirs = ingest_dirs(index_path)
+    return sorted(dirs["pending"].glob("*.pkl"))
+
+
+def batch_status(index_path, batch_id):
+    """
+    "published" if the current snapshot contains the batch, "pending" while it waits in the log,
+    "rejected" if the writer moved it to rejected/ (unreadable or wrong dimension), else None.
+    """
+    snapshot_id = current_snapshot(index_path)
+    if snapshot_id and batch_id in read_manifest(index_path, snapshot_id).get("batches", []):
+        return "published"
+    _, dirs = ingest_dirs(index_path)
+    pattern = f"*-{batch_id[:16]}.pkl"
+    if any(dirs["pending"].glob(pattern)):
+        return "pending"
+    if any(dirs["rejected"].glob(pattern)):
+        return "rejected"
+    return None
+
+
+class WriterLock:
+    """Exclusive, non-blocking file lock (flock / msvcrt); released automatically if the process dies."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+
+    def acquire(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a+")
+        try:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if FCNTL_AVAILABLE:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+class IngestWriter:
+    """
+    Applies pending batches to the index in group commits; call only while holding the lock.
+    Keeps the loaded index between commits and reloads it if CURRENT was changed from outside
+    (rollback) or the index was created elsewhere.
+    """
+
+    def __init__(self, index_path, embeddings, group_max_chunks=GROUP_MAX_CHUNKS):
+        self.index_path = index_path
+        self.embeddings = embeddings
+        self.group_max_chunks = group_max_chunks
+        self.vector_db = None
+        self.snapshot_id = None
+        self.applied = set()
+        self.last_snapshot = None
+
+    def _load_current(self):
+        from langchain_community.vectorstores import FAISS
+        snapshot_id = current_snapshot(self.index_path)
+        if self.vector_db is not None and snapshot_id == self.snapshot_id:
+            return
+        folder = resolve_index_dir(self.index_path)
+        if folder is None:
+            self.vector_db, self.applied = None, set()
+        else:
+            with span("faiss.load"):
+                self.vector_db = FAISS.load_local(str(folder), self.embeddings, allow_dangerous_deserialization=True)
+            self.applied = set(read_manifest(self.index_path, snapshot_id).get("batches", [])) if snapshot_id else set()
+        self.snapshot_id = snapshot_id
+
+    def _read_group(self, paths):
+        _, dirs = ingest_dirs(self.index_path)
+        group, chunks = [], 0
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    batch = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError) as e:
+                print(f"Batch {path.name} nicht lesbar ({type(e).__name__}), verschoben nach rejected/")
+                os.replace(path, dirs["rejected"] / path.name)
+                continue
+            group.append((path, batch))
+            chunks += len(batch["texts"])
+            if chunks >= self.group_max_chunks:
+                break
+        return group
+
+    def commit_pending(self):
+        """One group commit of the waiting batches. Returns the published snapshot id or None."""
+        paths = pending_batches(self.index_path)
+        if not paths:
+            return None
+        group = self._read_group(paths)
+        if not group:
+            return None
+        _, dirs = ingest_dirs(self.index_path)
+        self._load_current()
+        dimension = self.vector_db.index.d if self.vector_db is not None else None
+
+        texts, vectors, metadatas, new_ids, sources = [], [], [], [], []
+        for path, batch in group:
+            if batch["batch_id"] in self.applied or batch["batch_id"] in new_ids:
+                count("ingest.batches_duplicate")
+                continue
+            dims = {len(v) for v in batch["vectors"]}
+            if dimension is None and len(dims) == 1:
+                dimension = next(iter(dims)) # neuer Index: der erste Batch legt die Dimension fest
+            if dims - {dimension}:
+                print(f"Batch {batch['batch_id'][:12]} passt nicht zur Index-Dimension {dimension}, verschoben nach rejected/")
+                os.replace(path, dirs["rejected"] / path.name)
+                continue
+            texts += batch["texts"]
+            vectors += batch["vectors"]
+            metadatas += batch["metadatas"]
+            new_ids.append(batch["batch_id"])
+            sources.append(batch["source"])
+
+        snapshot_id = None
+        if new_ids:
+            try:
+                with span("ingest.commit", unit="batches", items=len(new_ids), chunks=len(texts)):
+                    with span("faiss.add", unit="chunks", items=len(texts)):
+                        if self.vector_db is None:
+                            from langchain_community.vectorstores import FAISS
+                            self.vector_db = FAISS.from_embeddings(list(zip(texts, vectors)), self.embeddings,
+                                                                   metadatas=metadatas)
+                        else:
+                            self.vector_db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+                    with span("faiss.save"):
+                        source = sources[0] if len(set(sources)) == 1 else f"{len(new_ids)} Batches"
+                        snapshot_id = publish_snapshot(self.vector_db, self.index_path, source=source,
+                                                       batches=self.applied | set(new_ids))
+            except Exception:
+                self.vector_db = None # Stand im Speicher ist nicht veröffentlicht -> beim nächsten Mal neu laden
+                raise
+            self.snapshot_id, self.last_snapshot = snapshot_id, snapshot_id
+            self.applied |= set(new_ids)
+            print(f"Gruppen-Commit: {len(new_ids)} Batches, {len(texts)} Chunks -> Snapshot {snapshot_id}")
+        for path, _ in group:
+            if path.exists():
+                path.unlink() # erst nach dem Veröffentlichen: ein Absturz davor wiederholt nur den Commit
+        return snapshot_id
+
+    def drain(self, group_wait=GROUP_WAIT_S):
+        """Commits until the log is empty; waits group_wait only if other workers are already submitting."""
+        while pending := pending_batches(self.index_path):
+            if len(pending) > 1:
+                time.sleep(group_wait) # mehrere Einreicher: kurz sammeln, damit ein Snapshot für alle reicht
+            self.commit_pending()
+        return self.last_snapshot
+
+
+def drain(index_path, embeddings, group_wait=GROUP_WAIT_S):
+    """
+    Applies pending batches in this process if no writer holds the lock. Returns the current snapshot
+    id afterwards, or None if another writer (service or parallel drain) owns the index and will apply them.
+    """
+    lock = WriterLock(Path(index_path) / INGEST_DIR / LOCK_FILE)
+    snapshot_id = None
+    while pending_batches(index_path):
+        if not lock.acquire():
+            return snapshot_id
+        try:
+            # Nur Duplikate: nichts Neues veröffentlicht, der Index enthält die Batches aber schon
+            snapshot_id = IngestWriter(index_path, embeddings).drain(group_wait) or current_snapshot(index_path)
+        finally:
+            lock.release()
+        # Batches, die während der Freigabe ankamen, fände der andere Prozess nicht mehr -> erneut prüfen
+    return snapshot_id
+
+
+def run_service(index_path, embeddings, poll_interval=WRITER_POLL_S, group_wait=GROUP_WAIT_S):
+    """Long-running writer: holds the lock and commits whatever workers submit."""
+    lock = WriterLock(Path(index_path) / INGEST_DIR / LOCK_FILE)
+    if not lock.acquire():
+        raise RuntimeError(f"Für '{index_path}' läuft bereits ein Writer")
+    writer = IngestWriter(index_path, embeddings)
+    print(f"Ingest-Writer für '{index_path}' gestartet (Strg+C beendet)")
+    try:
+        while True:
+            if pending_batches(index_path):
+                time.sleep(group_wait)
+                try:
+                    writer.commit_pending()
+                except Exception as e:
+                    print(f"Gruppen-Commit fehlgeschlagen, wird wiederholt: {type(e).__name__}: {e}")
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lock.release()
+
+
+if __name__ == "__main__":
+    import argparse
+    from embedding_backends import load_embeddings
+    parser = argparse.ArgumentParser(description="Single writer that applies submitted chunk batches to the index")
+    parser.add_argument("--index", default="faiss_index")
+    parser.add_argument("--drain", action="store_true", help="apply what is pending and exit")
+    parser.add_argument("--embedding-backend", choices=["torch", "onnx"])
+    args = parser.parse_args()
+
+    # Die Vektoren kommen fertig von den Workern; das Modell braucht FAISS nur für spätere Suchanfragen
+    embeddings = load_embeddings(args.embedding_backend)
+    if args.drain:
+        print(f"Snapshot: {drain(args.index, embeddings)}")
+    else:
+        run_service(args.index, embeddings)
@@ -0,0 +1,90 @@
+import math
+
+# Ab diesem Score wird ein Bild automatisch zum Löschen vorgemerkt
+JUNK_THRESHOLD = 0.75
+# Unter diesem Score gilt ein Bild als sicher relevant
+KEEP_THRESHOLD = 0.3
+
+# Die Crops kommen mit images_scale = 2.0 aus docling, daher doppelte Pixelwerte
+TINY_SIDE_PX = 64        # Bullets, kleine Icons
+SMALL_SIDE_PX = 128      # Toolbar-Icons, Logos
+SEPARATOR_ASPECT = 8.0   # Trennlinien, Balken
+MARGIN_FRACTION = 0.08   # Kopf-/Fußzeilenbereich der Seite (Logos)
+
+
+def _entropy(img):
+    """Shannon entropy of the grayscale histogram in bits (0 = flat colour, 8 = noise)."""
+    histogram = img.convert("L").histogram()
+    total = float(sum(histogram)) or 1.0
+    return max(0.0, -sum((c / total) * math.log2(c / total) for c in histogram if c))
+
+
+def image_features(img, location=None):
+    """
+    Cheap features of one crop. location is the docling provenance as dict
+    {"page_no", "bbox": (l, t, r, b) top-left origin, "page_w", "page_h"} or None.
+    """
+    # Für Farbstatistik reicht eine kleine Version, das spart Zeit bei großen Screenshots
+    sample = img.copy()
+    sample.thumbnail((256, 256))
+    colors = sample.convert("RGB").getcolors(maxcolors=256)
+
+    features = {
+        "width": img.width,
+        "height": img.height,
+        "aspect": max(img.width, img.height) / max(1, min(img.width, img.height)),
+        "entropy": round(_entropy(sample), 3),
+        "colors": len(colors) if colors is not None else 257,
+        "page_area": None,
+        "in_margin": False,
+    }
+
+    if location and location.get("page_w") and location.get("page_h"):
+        l, t, r, b = location["bbox"]
+        page_w, page_h = location["page_w"], location["page_h"]
+        features["page_area"] = round(abs(r - l) * abs(b - t) / (page_w * page_h), 5)
+        features["in_margin"] = b < page_h * MARGIN_FRACTION or t > page_h * (1 - MARGIN_FRACTION)
+    return features
+
+
+def junk_score(features):
+    """Combines the features into a 0..1 score (1 = almost certainly decoration)."""
+    score = 0.0
+    short_side = min(features["width"], features["height"])
+    long_side = max(features["width"], features["height"])
+
+    if long_side < TINY_SIDE_PX:
+        score += 0.6
+    elif long_side < SMALL_SIDE_PX:
+        score += 0.35
+    if features["aspect"] >= SEPARATOR_ASPECT and short_side < SMALL_SIDE_PX:
+        score += 0.5
+    if features["entropy"] < 1.0:
+        score += 0.4
+    elif features["entropy"] < 2.5:
+        score += 0.2
+    if features["colors"] <= 16:
+        score += 0.2
+
+    page_area = features["page_area"]
+    if page_area is not None:
+        if page_area < 0.005:
+            score += 0.3
+        elif page_area > 0.15:
+            score -= 0.3
+    if features["in_margin"]:
+        score += 0.2
+
+    # Große, detailreiche Bilder sind praktisch immer Screenshots/Diagramme
+    if short_side > 400 and features["entropy"] > 4.0:
+        score -= 0.4
+
+    return round(min(1.0, max(0.0, score)), 3)
+
+
+def classify(score):
+    if score >= JUNK_THRESHOLD:
+        return "junk"
+    if score < KEEP_THRESHOLD:
+        return "keep"
+    return "uncertain"
@@ -0,0 +1,214 @@
+import json
+import time
+import random
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from chat_session import ChatSession
+from ollama_settings import OLLAMA_URL, MODEL_NAME, OLLAMA_NUM_PARALLEL
+from retrieval_evaluation import percentile, load_golden_set
+
+# Lasttest für den Frage-Antwort-Pfad des Dashboards (Retrieval + Ollama-Streaming), standardmäßig gegen
+# einen lokalen Stub mit simulierter Token-Rate. Jeder virtuelle Nutzer ist eine eigene ChatSession,
+# so wie ein Browser-Tab im Dashboard; alle teilen sich Index und Embedding-Modell im selben Prozess.
+STUB_PREFILL_TPS = 800   # Prompt-Token/s (Prefill) einer 7B-Q4-GPU, grobe Größenordnung
+STUB_DECODE_TPS = 40     # generierte Token/s pro Slot
+STUB_ANSWER_TOKENS = 150
+DEFAULT_QUESTIONS = [
+    "Wie richte ich einen neuen Drucker ein?",
+    "Wo ändere ich mein Passwort?",
+    "Wie exportiere ich eine Liste?",
+    "Welche Rechte braucht ein neuer Benutzer?",
+    "Wie lege ich eine neue Vorlage an?",
+]
+PHASES = ("embed_s", "search_s", "ttft_s", "generate_s", "total_s", "client_ttft_s", "queue_s")
+
+
+def load_questions(path=None):
+    if not path:
+        return list(DEFAULT_QUESTIONS)
+    if str(path).endswith((".json", ".jsonl")):
+        return [item["question"] for item in load_golden_set(path)]
+    return [line.strip() for line in Path(path).read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+class LoadTest:
+    """
+    Drives ChatSession.ask_stream with either a fixed number of concurrent users (closed loop)
+    or Poisson arrivals at a given rate (open loop). Latency in open-loop mode is measured from
+    the planned arrival time, so waiting for a free client thread counts as well.
+    """
+
+    def __init__(self, vector_db, url=OLLAMA_URL, model=MODEL_NAME, questions=None, k=5, turns_per_user=1,
+                 seed=0):
+        self.vector_db = vector_db
+        self.url = url
+        self.model = model
+        self.questions = questions or list(DEFAULT_QUESTIONS)
+        self.k = k
+        self.turns_per_user = turns_per_user
+        self.records = []
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _question(self):
+        with self._lock:
+            return self._random.choice(self.questions)
+
+    def _conversation(self, planned_at=None):
+        """One virtual user: turns_per_user questions in one ChatSession."""
+        session = ChatSession(model=self.model, url=self.url, k=self.k)
+        started = time.perf_counter()
+        queue_s = started - planned_at if planned_at is not None else 0.0
+        for turn in range(self.turns_per_user):
+            turn_start = planned_at if planned_at is not None and turn == 0 else time.perf_counter()
+            first_piece = None
+            try:
+                for _ in session.ask_stream(self.vector_db, self._question()):
+                    if first_piece is None:
+                        first_piece = time.perf_counter()
+            except Exception as e:
+                with self._lock:
+                    name = type(e).__name__
+                    self.errors[name] = self.errors.get(name, 0) + 1
+                    self.records.append({"ok": False, "turn": turn})
+                return
+            finished = time.perf_counter()
+            stats = session.last_turn["stats"]
+            record = {key: stats[key] for key in ("embed_s", "search_s", "ttft_s", "generate_s",
+                                                  "prompt_eval_count", "eval_count")}
+            record.update({
+                "ok": True,
+                "turn": turn,
+                "total_s": finished - turn_start,
+                "client_ttft_s": (first_piece or finished) - turn_start,
+                "queue_s": queue_s if turn == 0 else 0.0,
+                "finished_at": finished,
+            })
+            with self._lock:
+                self.records.append(record)
+
+    def run_closed(self, concurrency, duration=None, requests=None):
+        """concurrency users, each starting a new conversation as soon as the last one ends."""
+        deadline = time.perf_counter() + duration if duration else None
+        budget = {"left": requests}
+
+        def user():
+            while True:
+                with self._lock:
+                    if budget["left"] is not None:
+                        if budget["left"] <= 0:
+                            return
+                        budget["left"] -= 1
+                if deadline and time.perf_counter() >= deadline:
+                    return
+                self._conversation()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=user, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def run_open(self, rate, duration=None, requests=None, max_concurrency=256):
+        """Poisson arrivals with mean rate (conversations per second)."""
+        started = time.perf_counter()
+        planned, count = started, 0
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            while True:
+                planned += self._random.expovariate(rate)
+                if (duration and planned - started >= duration) or (requests is not None and count >= requests):
+                    break
+                wait = planned - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                pool.submit(self._conversation, planned)
+                count += 1
+        return time.perf_counter() - started
+
+    def report(self, wall_s):
+        ok = [r for r in self.records if r["ok"]]
+        total = len(self.records)
+        report = {
+            "requests": total,
+            "ok": len(ok),
+            "errors": dict(self.errors),
+            "error_rate": round((total - len(ok)) / total, 4) if total else None,
+            "wall_s": round(wall_s, 2),
+            "throughput_rps": round(len(ok) / wall_s, 3) if wall_s else None,
+            "tokens_per_s": round(sum(r["eval_count"] or 0 for r in ok) / wall_s, 1) if wall_s else None,
+        }
+        for phase in PHASES:
+            values = [r[phase] for r in ok if r.get(phase) is not None]
+            report[phase] = {f"p{q}": round(percentile(values, q), 4) if values else None for q in (50, 95, 99)}
+        return report
+
+
+def format_report(report):
+    lines = [f"Anfragen: {report['requests']} (ok {report['ok']}, Fehlerquote {report['error_rate']}, "
+             f"{report['errors'] or 'keine Fehler'})",
+             f"Durchsatz: {report['throughput_rps']} Antworten/s, {report['tokens_per_s']} Token/s "
+             f"in {report['wall_s']} s",
+             f"{'Phase':<14} {'p50':>9} {'p95':>9} {'p99':>9}"]
+    labels = {"embed_s": "Embedding", "search_s": "FAISS-Suche", "ttft_s": "Gen. 1. Token",
+              "generate_s": "Generierung", "client_ttft_s": "1. Token ges.", "total_s": "Gesamt",
+              "queue_s": "Warteschlange"}
+    for phase in PHASES:
+        values = report[phase]
+        cells = " ".join(f"{v * 1000:>7.0f}ms" if v is not None else f"{'-':>9}" for v in values.values())
+        lines.append(f"{labels[phase]:<14} {cells}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Load test for the chat path (retrieval + Ollama streaming)")
+    parser.add_argument("--index", default="faiss_index", help="FAISS index folder used by the dashboard")
+    parser.add_argument("--questions", help="text file (one question per line) or golden set JSON/JSONL")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed loop: simultaneous users")
+    parser.add_argument("--rate", type=float, help="open loop: Poisson arrivals per second (overrides --concurrency)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to generate load")
+    parser.add_argument("--requests", type=int, help="stop after this many conversations instead")
+    parser.add_argument("--turns", type=int, default=1, help="questions per conversation (follow-ups reuse context)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--url", help="real Ollama /api/generate URL; default: local stub server")
+    parser.add_argument("--prefill-tps", type=float, default=STUB_PREFILL_TPS)
+    parser.add_argument("--decode-tps", type=float, default=STUB_DECODE_TPS)
+    parser.add_argument("--answer-tokens", type=int, default=STUB_ANSWER_TOKENS)
+    parser.add_argument("--slots", type=int, default=OLLAMA_NUM_PARALLEL, help="stub: parallel generations")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub: share of 503 answers")
+    parser.add_argument("--out", help="write the report as JSON")
+    args = parser.parse_args()
+
+    from index_snapshots import load_index
+    from vector_transformer import load_embeddings
+    vector_db = load_index(args.index, load_embeddings())
+    questions = load_questions(args.questions)
+    duration = None if args.requests else args.duration
+
+    def run(url):
+        test = LoadTest(vector_db, url=url, questions=questions, k=args.k, turns_per_user=args.turns)
+        test._conversation() # Warm-up: Modell/Index laden zählt nicht zur Messung
+        test.records.clear()
+        test.errors.clear()
+        if args.rate:
+            wall_s = test.run_open(args.rate, duration, args.requests)
+        else:
+            wall_s = test.run_closed(args.concurrency, duration, args.requests)
+        return test.report(wall_s)
+
+    if args.url:
+        report = run(args.url)
+    else:
+        from stub_servers import StubServer
+        with StubServer(prefill_tps=args.prefill_tps, decode_tps=args.decode_tps, answer_tokens=args.answer_tokens,
+                        slots=args.slots, error_rate=args.error_rate) as stub:
+            report = run(f"{stub.base_url}/api/generate")
+            report["stub_max_in_flight"] = stub.max_in_flight
+    report["mode"] = f"open {args.rate}/s" if args.rate else f"closed {args.concurrency} users"
+    print(format_report(report))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
@@ -0,0 +1,271 @@
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from pathlib import Path
+from pipeline_metrics import metrics
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# Speicherprofil der Ingestion (opt-in): RSS und Python-Allokationen (tracemalloc) werden pro Stufe
+# erfasst. Die Stufen sind die Spans aus pipeline_metrics (docling.convert, images.save, embed, faiss.add ...).
+# Hinweis: Pixelpuffer von PIL und Speicher von torch/FAISS legt C-Code an - den sieht nur die RSS,
+# nicht tracemalloc. Die Differenz zwischen beiden zeigt, wie viel "außerhalb von Python" liegt.
+SAMPLE_INTERVAL = 0.05     # Sekunden zwischen zwei RSS-/tracemalloc-Proben
+TRACE_FRAMES = 8           # Tiefe der Tracebacks, um die Stelle im eigenen Code zu finden
+TOP_SITES = 15
+PEAK_SNAPSHOT_GROWTH = 1.05 # neuer Python-Höchststand ab +5 % über dem letzten Snapshot -> Snapshot
+PEAK_SNAPSHOT_MIN_BYTES = 8 * 2**20 # kleinere Zuwächse (z.B. beim Start einer Stufe) belegen keinen Snapshot
+PEAK_SNAPSHOT_MIN_GAP = 1.0 # ... höchstens einer pro Sekunde; ein zu früher wird nachgeholt (spätestens am Stufenende)
+REPO_DIR = str(Path(__file__).resolve().parent)
+
+
+def current_rss():
+    """Resident set size in bytes; without psutil the process high-water mark (ru_maxrss)."""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # Linux: KiB, macOS: Bytes
+
+
+def _mb(value):
+    return round(value / 2**20, 1)
+
+
+# Modul-Importe sind einmalig und keine Ursache für OOM; sie würden die Liste sonst anführen
+NOISE_FILTERS = [
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>", all_frames=True),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>", all_frames=True),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__), # die Proben des Profilers selbst
+    tracemalloc.Filter(False, "*/psutil/*"),
+]
+
+
+def top_sites(stats, limit=TOP_SITES):
+    """
+    Groups tracemalloc statistics (by traceback) by the allocating line and the innermost
+    frame in this repository, e.g. 'unified_extraction_review.py:251' for a crop list.
+    """
+    sites = {}
+    for stat in stats:
+        size = getattr(stat, "size_diff", stat.size)
+        frames = list(reversed(stat.traceback)) # tracemalloc: ältester Frame zuerst
+        alloc = f"{frames[0].filename}:{frames[0].lineno}" if frames else "?"
+        owner = next((f"{Path(f.filename).name}:{f.lineno}" for f in frames
+                      if f.filename.startswith(REPO_DIR) and f.filename != __file__), None)
+        key = (owner, alloc)
+        entry = sites.setdefault(key, {"repo_site": owner, "site": alloc, "size": 0, "count": 0})
+        entry["size"] += size
+        entry["count"] += getattr(stat, "count_diff", stat.count)
+    ordered = sorted(sites.values(), key=lambda e: e["size"], reverse=True)[:limit]
+    return [dict(e, size_mb=_mb(e.pop("size"))) for e in ordered]
+
+
+class MemoryProfiler:
+    """
+    Listener for pipeline_metrics spans. Samples RSS and traced Python memory in a thread and
+    attributes each sample to the most recently started open stage; takes tracemalloc snapshots
+    at stage boundaries and at new Python highs. Use as context manager, then report().
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, frames=TRACE_FRAMES):
+        self.interval = interval
+        self.frames = frames
+        self.stages = {}        # name -> Statistik
+        self.active = []        # offene Stufen in Startreihenfolge: (thread id, name)
+        self.peak_rss = 0
+        self.peak_rss_stage = None
+        self.peak_traced = 0
+        self.peak_traced_stage = None
+        self.peak_snapshot = None
+        self._stage_snapshots = {} # (thread id, name) -> (Start-Snapshot, RSS, Startzeit)
+        self._growth_snapshots = {} # name -> (Start, Ende) des ersten Aufrufs, ausgewertet erst in report()
+        self._last_peak_snapshot = float("-inf")
+        self._snapshot_traced = 0   # Python-Speicher beim letzten Höchststand-Snapshot
+        self._pending_peak = None   # Stufe eines Höchststands, dessen Snapshot noch aussteht
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_tracing = False
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_rss": 0, "peak_traced": 0,
+                                             "rss_growth": 0})
+
+    def _current_stage(self):
+        return self.active[-1][1] if self.active else "(außerhalb)"
+
+    # --- pipeline_metrics Listener ---
+    def span_started(self, name, depth):
+        key = (threading.get_ident(), name)
+        with self._lock:
+            self.active.append(key)
+            stage = self._stage(name)
+            stage["calls"] += 1
+            # Nur der erste Aufruf je Stufe bekommt Snapshots (vision.request läuft hundertfach)
+            take_snapshot = stage["calls"] == 1
+        snapshot = tracemalloc.take_snapshot() if take_snapshot else None
+        with self._lock:
+            self._stage_snapshots[key] = (snapshot, current_rss(), time.perf_counter())
+        self._sample()
+
+    def span_finished(self, name, depth):
+        self._sample(flush=True) # ein vorgemerkter Höchststand ist meist noch belegt, solange die Stufe läuft
+        key = (threading.get_ident(), name)
+        with self._lock:
+            start_snapshot, start_rss, started = self._stage_snapshots.pop(key, (None, 0, time.perf_counter()))
+        # Was die Stufe beim Ende noch hält (z.B. Crop-Liste, md_content), gegenüber dem Start;
+        # der Vergleich ist teuer und läuft daher erst in report()
+        end_snapshot = tracemalloc.take_snapshot() if start_snapshot is not None else None
+        with self._lock:
+            if key in self.active:
+                self.active.reverse()
+                self.active.remove(key)
+                self.active.reverse()
+            stage = self._stage(name)
+            stage["seconds"] += time.perf_counter() - started
+            stage["rss_growth"] = max(stage["rss_growth"], current_rss() - start_rss)
+            if end_snapshot is not None:
+                self._growth_snapshots[name] = (start_snapshot, end_snapshot)
+
+    # --- Proben ---
+    def _sample(self, flush=False, snapshots=True):
+        """
+        One probe. A new Python high clearly above the last snapshot (PEAK_SNAPSHOT_GROWTH and
+        PEAK_SNAPSHOT_MIN_BYTES) is marked pending and captured once PEAK_SNAPSHOT_MIN_GAP has
+        passed, or right away with flush.
+        """
+        rss = current_rss()
+        traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        take_snapshot = False
+        with self._lock:
+            name = self._current_stage()
+            stage = self._stage(name)
+            stage["peak_rss"] = max(stage["peak_rss"], rss)
+            stage["peak_traced"] = max(stage["peak_traced"], traced)
+            # RSS fällt nach einer Stufe selten zurück; Proben außerhalb von Stufen erben sonst deren Spitze
+            if rss > self.peak_rss and (self.active or self.peak_rss_stage is None):
+                self.peak_rss, self.peak_rss_stage = rss, name
+            if traced > self.peak_traced:
+                self.peak_traced, self.peak_traced_stage = traced, name
+                if snapshots and traced > max(self._snapshot_traced * PEAK_SNAPSHOT_GROWTH,
+                                              self._snapshot_traced + PEAK_SNAPSHOT_MIN_BYTES):
+                    self._pending_peak = name
+            now = time.perf_counter()
+            if self._pending_peak and (flush or now - self._last_peak_snapshot >= PEAK_SNAPSHOT_MIN_GAP):
+                # Nur solange der Höchststand noch gehalten wird, zeigt der Snapshot seine Allokationen
+                if traced * PEAK_SNAPSHOT_GROWTH >= self.peak_traced:
+                    take_snapshot, snapshot_stage = True, self._pending_peak
+                    self._last_peak_snapshot, self._snapshot_traced = now, traced
+                self._pending_peak = None
+        if take_snapshot:
+            snapshot = tracemalloc.take_snapshot()
+            with self._lock:
+                self.peak_snapshot = (snapshot_stage, traced, snapshot)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        metrics.listeners.append(self)
+        self._sample(snapshots=False) # Ausgangswert; ein Snapshot bei ~0 MB sagt nichts
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample(flush=True)
+        if self in metrics.listeners:
+            metrics.listeners.remove(self)
+        self._final_traced_peak = tracemalloc.get_traced_memory()[1]
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    def report(self):
+        peak_sites = []
+        peak_snapshot_stage = None
+        if self.peak_snapshot:
+            peak_snapshot_stage, _, snapshot = self.peak_snapshot
+            peak_sites = top_sites(snapshot.filter_traces(NOISE_FILTERS).statistics("traceback"))
+        growth_sites = {name: top_sites(end.filter_traces(NOISE_FILTERS).compare_to(
+                            start.filter_traces(NOISE_FILTERS), "traceback"), 5)
+                        for name, (start, end) in self._growth_snapshots.items()}
+        stages = {
+            name: {
+                "calls": s["calls"],
+                "seconds": round(s["seconds"], 3),
+                "peak_rss_mb": _mb(s["peak_rss"]),
+                "peak_python_mb": _mb(s["peak_traced"]),
+                "rss_growth_mb": _mb(s["rss_growth"]),
+                "growth_sites": growth_sites.get(name, []),
+            }
+            for name, s in self.stages.items()
+        }
+        return {
+            "rss_source": "psutil" if PSUTIL_AVAILABLE else "ru_maxrss",
+            "peak_rss_mb": _mb(self.peak_rss),
+            "peak_rss_stage": self.peak_rss_stage,
+            "peak_python_mb": _mb(max(self.peak_traced, getattr(self, "_final_traced_peak", 0))),
+            "peak_python_stage": self.peak_traced_stage,
+            "peak_sites_stage": peak_snapshot_stage,
+            "peak_sites": peak_sites,
+            "stages": dict(sorted(stages.items(), key=lambda item: item[1]["peak_rss_mb"], reverse=True)),
+        }
+
+
+def format_report(report):
+    lines = [f"Spitzen-RSS: {report['peak_rss_mb']} MB in Stufe '{report['peak_rss_stage']}' "
+             f"(Quelle: {report['rss_source']})",
+             f"Spitze Python-Allokationen: {report['peak_python_mb']} MB in Stufe '{report['peak_python_stage']}'",
+             "",
+             f"{'Stufe':<20} {'Aufrufe':>7} {'Sek.':>8} {'RSS max':>9} {'Python max':>11} {'RSS +':>8}"]
+    for name, s in report["stages"].items():
+        lines.append(f"{name:<20} {s['calls']:>7} {s['seconds']:>8.2f} {s['peak_rss_mb']:>7.1f}MB "
+                     f"{s['peak_python_mb']:>9.1f}MB {s['rss_growth_mb']:>6.1f}MB")
+    if report["peak_sites"]:
+        lines += ["", f"Top-Allokationen beim Python-Höchststand (Stufe '{report['peak_sites_stage']}'):"]
+        for site in report["peak_sites"]:
+            lines.append(f"  {site['size_mb']:>8.1f} MB  {site['repo_site'] or '-':<32} {site['site']}")
+    return "\n".join(lines)
+
+
+def write_report(report, path):
+    Path(path).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Speicherprofil gespeichert: {path}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Memory profile of the ingestion (phase 1 + 2, optional indexing)")
+    parser.add_argument("pdf", help="PDF to ingest; the review is skipped, pre-classified junk is dropped")
+    parser.add_argument("--index", action="store_true", help="also build the vector index from the markdown")
+    parser.add_argument("--index-path", default="faiss_index_memory_profile")
+    parser.add_argument("--force-full", action="store_true", help="tables + OCR on every page")
+    parser.add_argument("--out", default="memory_profile.json")
+    args = parser.parse_args()
+
+    from unified_extraction_review import PdfProcessor
+    with MemoryProfiler() as profiler:
+        processor = PdfProcessor(args.pdf, force_full_pipeline=args.force_full)
+        processor.process_phase_1()
+        md_path = processor.process_phase_2(processor.suggested_deletions)
+        if args.index:
+            from vector_transformer import update_or_create_vector_index
+            update_or_create_vector_index(str(md_path), index_path=args.index_path)
+    report = profiler.report()
+    print(format_report(report))
+    write_report(report, args.out)
@@ -0,0 +1,17 @@
+# Gemeinsame Ollama-Konfiguration für Chatbot-Dashboard und lokale Bildanalyse
+SERVER_IP = "127.0.0.1"
+OLLAMA_PORT = 11434
+OLLAMA_BASE_URL = f"http://{SERVER_IP}:{OLLAMA_PORT}"
+OLLAMA_URL = f"{OLLAMA_BASE_URL}/api/generate"
+OLLAMA_CHAT_URL = f"{OLLAMA_BASE_URL}/api/chat"
+
+MODEL_NAME = "qwen2.5:7b"           # Text-Modell für den Chatbot
+VISION_MODEL_NAME = "qwen2.5vl:7b"  # Multimodales Modell für die Bildanalyse
+
+# Sollte zu OLLAMA_NUM_PARALLEL des Servers passen; mehr Threads stehen dort nur in der Warteschlange
+OLLAMA_NUM_PARALLEL = 2
+
+# Kontextfenster und Vorhaltezeit für den Chat: das Modell bleibt geladen, damit der
+# zurückgegebene "context" (KV-Cache) der letzten Runde wiederverwendet werden kann
+OLLAMA_NUM_CTX = 8192
+OLLAMA_KEEP_ALIVE = "30m"
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Strukturierte Spans und Zähler für die ganze Pipeline (Konvertierung, Bilder, Review, Vision-Requests,
+# Splitting, Embedding, FAISS, Chat-Anfragen). Summen und Raten gibt es im Prometheus-Textformat unter
+# http://127.0.0.1:<port>/metrics. Jeden beendeten Span zusätzlich als JSONL-Zeile schreiben nur auf Wunsch:
+# ATM_METRICS_FILE=pipeline_metrics.jsonl; ab METRICS_MAX_BYTES wird die Datei nach <datei>.1 rotiert.
+METRICS_FILE = os.environ.get("ATM_METRICS_FILE") or None # None = keine JSONL-Ausgabe
+METRICS_MAX_BYTES = 20 * 2**20
+METRICS_PORT = 9464            # GUI / Ingestion
+DASHBOARD_METRICS_PORT = 9465  # Chatbot-Dashboard (eigener Prozess, eigener Port)
+RATE_WINDOW_S = 60             # Zeitfenster für die Raten (images/s, chunks/s, tokens/s)
+METRIC_PREFIX = "atm"
+
+
+class Metrics:
+    """Thread-safe registry of span statistics and counters, with an optional JSONL sink."""
+
+    def __init__(self, path=METRICS_FILE, rate_window=RATE_WINDOW_S, max_bytes=METRICS_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rate_window = rate_window
+        self.spans = {}     # name -> {"count", "sum", "max", "errors"}
+        self.counters = {}  # (name, stage) -> total; stage ist None bei einfachen Zählern
+        self._samples = {}  # (name, stage) -> deque[(zeit, wert)] für die Raten
+        self.listeners = [] # Objekte mit span_started(name) / span_finished(name), z.B. der Speicherprofiler
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock() # Dateizugriffe blockieren count() und die /metrics-Abfrage nicht
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def count(self, name, value=1, stage=None):
+        """Adds value to a counter; stage labels per-stage throughput (chunks of "embed" vs. "split")."""
+        key = (name, stage)
+        now = time.time()
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            samples = self._samples.setdefault(key, deque())
+            samples.append((now, value))
+            while samples and samples[0][0] < now - self.rate_window:
+                samples.popleft()
+
+    def rate(self, name, stage=None):
+        """Per-second rate of a counter over the last rate_window seconds."""
+        now = time.time()
+        with self._lock:
+            samples = [(t, v) for t, v in self._samples.get((name, stage), ()) if t >= now - self.rate_window]
+        if not samples:
+            return 0.0
+        elapsed = max(now - samples[0][0], 1.0)
+        return sum(v for _, v in samples) / elapsed
+
+    def record_span(self, name, duration_s, error=None, **attrs):
+        """
+        Records a finished span (also usable for durations measured elsewhere, e.g. the GUI review).
+        items of a unit are counted per stage: the same chunks pass split, embed and faiss.add, and
+        a sum over stages would count them several times.
+        """
+        unit, items = attrs.get("unit"), attrs.get("items")
+        if unit and items:
+            self.count(unit, items, stage=name)
+            attrs["rate"] = round(items / duration_s, 3) if duration_s else None
+        with self._lock:
+            stats = self.spans.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0, "errors": 0})
+            stats["count"] += 1
+            stats["sum"] += duration_s
+            stats["max"] = max(stats["max"], duration_s)
+            if error:
+                stats["errors"] += 1
+        if self.path:
+            event = {"ts": round(time.time(), 3), "span": name, "duration_s": round(duration_s, 6),
+                     "thread": threading.current_thread().name, **attrs}
+            if error:
+                event["error"] = error
+            self._write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+    def _write(self, line):
+        with self._file_lock:
+            try:
+                if self.max_bytes and os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, f"{self.path}.1")
+            except OSError:
+                pass # Datei existiert noch nicht
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass # Metriken dürfen die Pipeline nie aufhalten
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        Times the block. Yields the attribute dict: set attrs["items"] (with unit=...) inside
+        the block to count work done, e.g. span("faiss.add", unit="chunks").
+        """
+        stack = self._stack()
+        if stack:
+            attrs.setdefault("parent", stack[-1])
+        stack.append(name)
+        for listener in list(self.listeners):
+            listener.span_started(name, len(stack) - 1)
+        start, error = time.perf_counter(), None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            stack.pop()
+            for listener in list(self.listeners):
+                listener.span_finished(name, len(stack))
+            self.record_span(name, time.perf_counter() - start, error=error, **attrs)
+
+    def prometheus_text(self):
+        def metric_name(name):
+            return "".join(c if c.isalnum() else "_" for c in name)
+        with self._lock:
+            spans = {name: dict(stats) for name, stats in self.spans.items()}
+            counters = dict(self.counters)
+        lines = [f"# TYPE {METRIC_PREFIX}_stage_seconds summary"]
+        for name, stats in sorted(spans.items()):
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{name}"}} {stats["sum"]:.6f}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_stage_seconds_max gauge")
+        lines += [f'{METRIC_PREFIX}_stage_seconds_max{{stage="{n}"}} {s["max"]:.6f}' for n, s in sorted(spans.items())]
+        lines.append(f"# TYPE {METRIC_PREFIX}_stage_errors_total counter")
+        lines += [f'{METRIC_PREFIX}_stage_errors_total{{stage="{n}"}} {s["errors"]}' for n, s in sorted(spans.items())]
+        by_name = {}
+        for (name, stage), total in counters.items():
+            by_name.setdefault(name, []).append((stage, total))
+        for name, series in sorted(by_name.items()):
+            metric = f"{METRIC_PREFIX}_{metric_name(name)}"
+            series.sort(key=lambda item: item[0] or "")
+            labels = {stage: f'{{stage="{stage}"}}' if stage else "" for stage, _ in series}
+            lines.append(f"# TYPE {metric}_total counter")
+            lines += [f"{metric}_total{labels[stage]} {total}" for stage, total in series]
+            lines.append(f"# TYPE {metric}_per_second gauge")
+            lines += [f"{metric}_per_second{labels[stage]} {self.rate(name, stage):.3f}" for stage, _ in series]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+span = metrics.span
+count = metrics.count
+record_span = metrics.record_span
+
+_servers = {}
+
+
+def start_metrics_server(port=METRICS_PORT, registry=None):
+    """Serves /metrics (Prometheus text) in a daemon thread; once per port and process."""
+    if port is None or port in _servers:
+        return _servers.get(port)
+    registry = registry or metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    except OSError as e:
+        print(f"Metrik-Endpunkt auf Port {port} nicht gestartet: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _servers[port] = server
+    return server
+
+
+class ProgressRate:
+    """Rate and ETA of countable work (pages, images, chunks) for determinate progress bars."""
+
+    def __init__(self, total, unit="items", started=None):
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.started = started if started is not None else time.perf_counter()
+        self.updated = self.started
+
+    def update(self, done, now=None):
+        self.done = done
+        self.updated = now if now is not None else time.perf_counter()
+        return self
+
+    @property
+    def rate(self):
+        elapsed = self.updated - self.started
+        return self.done / elapsed if elapsed > 0 and self.done else 0.0
+
+    @property
+    def eta_s(self):
+        if not self.rate:
+            return None
+        return max(0.0, (self.total - self.done) / self.rate)
+
+    def format(self):
+        text = f"{self.done}/{self.total} {self.unit}"
+        if self.rate:
+            text += f" · {self.rate:.1f} {self.unit}/s"
+        if self.eta_s is not None and self.done < self.total:
+            minutes, seconds = divmod(int(self.eta_s + 0.5), 60)
+            text += f" · ETA {minutes}:{seconds:02d}"
+        return text
@@ -0,0 +1,74 @@
+import re
+import time
+from document_manifest import IMAGE_PATTERN, DEFAULT_SECTION_TITLE
+
+# Retrieval-Bausteine für den Chatbot: Bilder kommen aus den Chunk-Metadaten (beim Indexieren
+# extrahiert), die LLM nennt nur noch die Nummern der genutzten Kontextabschnitte.
+CITATION_PATTERN = re.compile(r"QUELLEN?[\s*:_]*:[\s*_]*([\d,;\s\[\]]*)", re.IGNORECASE)
+
+
+def chunk_header(doc):
+    return (doc.metadata.get('Header 3') or doc.metadata.get('Header 2')
+            or doc.metadata.get('Header 1') or DEFAULT_SECTION_TITLE)
+
+
+def chunk_images(doc):
+    """Image paths of one chunk; older indexes without metadata fall back to the chunk text."""
+    images = doc.metadata.get("images")
+    if images is None:
+        images = [m.group(2) for m in IMAGE_PATTERN.finditer(doc.page_content)]
+    return list(images)
+
+
+def retrieve(vector_db, embeddings, query, k=5):
+    """Embeds the query and searches the index. Returns (docs, {"embed_s", "search_s"})."""
+    start = time.perf_counter()
+    query_vector = embeddings.embed_query(query)
+    embedded = time.perf_counter()
+    docs = vector_db.similarity_search_by_vector(query_vector, k=k)
+    searched = time.perf_counter()
+    return docs, {"embed_s": embedded - start, "search_s": searched - embedded}
+
+
+def build_context(docs, numbers=None):
+    """Numbered context sections [1]..[n] the LLM can cite (numbers: own numbering, e.g. per chat)."""
+    numbers = numbers or range(1, len(docs) + 1)
+    context = ""
+    for n, doc in zip(numbers, docs):
+        context += f"\n---\n[{n}] KAPITEL: {chunk_header(doc)}\n{doc.page_content}\n"
+    return context
+
+
+def build_image_lookup(docs, numbers=None):
+    """Chunk number (as in build_context) -> image paths of that chunk."""
+    numbers = numbers or range(1, len(docs) + 1)
+    return {n: chunk_images(doc) for n, doc in zip(numbers, docs)}
+
+
+def parse_cited_chunks(answer, chunk_count):
+    """
+    Splits the 'QUELLEN: 1, 3' line off the answer. Returns (clean answer, cited chunk numbers);
+    numbers outside 1..chunk_count are ignored (chunk_count may also be a set of valid numbers).
+    """
+    valid = chunk_count if isinstance(chunk_count, (set, frozenset, dict)) else range(1, chunk_count + 1)
+    match = None
+    for match in CITATION_PATTERN.finditer(answer):
+        pass
+    if match is None:
+        return answer.strip(), []
+    cited = []
+    for number in re.findall(r"\d+", match.group(1)):
+        n = int(number)
+        if n in valid and n not in cited:
+            cited.append(n)
+    return answer[:match.start()].rstrip(" *_\n").strip(), cited
+
+
+def resolve_images(image_lookup, cited):
+    """Images of the cited chunks in citation order, without duplicates."""
+    images = []
+    for n in cited:
+        for image in image_lookup.get(n, []):
+            if image not in images:
+                images.append(image)
+    return images
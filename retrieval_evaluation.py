@@ -0,0 +1,226 @@
+import re
+import json
+import math
+import time
+from pathlib import Path
+from retrieval import retrieve, chunk_header, chunk_images
+
+# Qualität vs. Latenz der Suche: ein Golden Set (Frage -> erwarteter Abschnitt/Bild) läuft über
+# denselben Suchpfad wie der Chatbot (retrieval.retrieve) für jede Kombination aus Chunking,
+# Indextyp und k. Ergebnis: recall@k, MRR und p50/p95/p99 der Suchlatenz in einer Tabelle.
+CHUNKING_CONFIGS = ("tokens", "chars")   # "chars:800" / "tokens:96" = Modus mit eigener Chunk-Größe
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+K_VALUES = (3, 5, 8)
+TARGET_RECALL = 0.9
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 8
+HEADING_PATTERN = re.compile(r"^(#{1,3})\s+(.*?)\s*#*\s*$")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0..100) of a list of numbers; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def load_golden_set(path):
+    """
+    JSON list or JSONL of {"question", "section"?, "image"?}. section is the heading text
+    (as in the chunk metadata), image the path as in the markdown link.
+    """
+    text = Path(path).read_text(encoding="utf-8")
+    if str(path).endswith(".jsonl"):
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        items = json.loads(text)
+    for n, item in enumerate(items, 1):
+        if not item.get("question") or not (item.get("section") or item.get("image")):
+            raise ValueError(f"Golden set entry {n} needs 'question' and 'section' or 'image'")
+    return items
+
+
+def golden_set_from_markdown(md_text, count=100, seed=0):
+    """
+    Self-retrieval golden set when no hand-made one exists: text lines of the document as
+    questions, the heading they stand under as expected section.
+    """
+    from vector_transformer import sample_probe_sentences
+    headings, section_of = {}, {}
+    for line in md_text.splitlines():
+        match = HEADING_PATTERN.match(line)
+        if match:
+            level = len(match.group(1))
+            headings = {lvl: title for lvl, title in headings.items() if lvl < level}
+            headings[level] = match.group(2)
+        elif headings:
+            section_of.setdefault(line.strip(), headings[max(headings)])
+    return [{"question": line, "section": section_of[line]}
+            for line in sample_probe_sentences(md_text, count=count, seed=seed) if line in section_of]
+
+
+def is_relevant(doc, item):
+    """A chunk counts as a hit if it holds the expected image or belongs to the expected section."""
+    if item.get("image") and item["image"] in chunk_images(doc):
+        return True
+    if item.get("section"):
+        section = item["section"].strip().lower()
+        return chunk_header(doc).strip().lower() == section or any(
+            (doc.metadata.get(name) or "").strip().lower() == section for name in ("Header 1", "Header 2", "Header 3"))
+    return False
+
+
+def parse_chunking(config):
+    mode, _, size = config.partition(":")
+    return mode, int(size) if size else None
+
+
+def build_index(index_type, vectors, texts, metadatas, embeddings):
+    """LangChain FAISS store over a prebuilt faiss index of the given type (flat|hnsw|ivf)."""
+    import faiss
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+
+    matrix = np.asarray(vectors, dtype="float32")
+    dim = matrix.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif index_type == "ivf":
+        # ca. sqrt(n) Listen; FAISS will mindestens ~39 Trainingspunkte pro Liste
+        nlist = max(1, min(int(math.sqrt(len(matrix))), len(matrix) // 39))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(matrix)
+        index.nprobe = min(IVF_NPROBE, nlist)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}' ({'|'.join(INDEX_TYPES)})")
+    index.add(matrix)
+
+    ids = [str(n) for n in range(len(texts))]
+    docstore = InMemoryDocstore({i: Document(page_content=t, metadata=m) for i, t, m in zip(ids, texts, metadatas)})
+    return FAISS(embeddings, index, docstore, dict(enumerate(ids)))
+
+
+def evaluate_store(vector_db, embeddings, golden, k, rounds=1):
+    """recall@k, MRR and latency percentiles of one store for one k."""
+    retrieve(vector_db, embeddings, golden[0]["question"], k=k) # Warm-up (erste Suche lädt Caches)
+    hits, reciprocal_ranks, embed_times, search_times = 0, [], [], []
+    for _ in range(rounds):
+        for item in golden:
+            docs, timings = retrieve(vector_db, embeddings, item["question"], k=k)
+            embed_times.append(timings["embed_s"])
+            search_times.append(timings["search_s"])
+            rank = next((n for n, doc in enumerate(docs, 1) if is_relevant(doc, item)), None)
+            hits += rank is not None
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+    total = len(golden) * rounds
+    return {
+        "recall": round(hits / total, 3),
+        "mrr": round(sum(reciprocal_ranks) / total, 3),
+        "search_p50_ms": round(percentile(search_times, 50) * 1000, 3),
+        "search_p95_ms": round(percentile(search_times, 95) * 1000, 3),
+        "search_p99_ms": round(percentile(search_times, 99) * 1000, 3),
+        "embed_p50_ms": round(percentile(embed_times, 50) * 1000, 2),
+        "queries": total,
+    }
+
+
+def evaluate(md_path, golden, chunking_configs=CHUNKING_CONFIGS, index_types=INDEX_TYPES, k_values=K_VALUES,
+             rounds=1, existing_index=None):
+    """
+    Runs the golden set over every chunking x index type x k combination of one document
+    (and optionally over an existing index folder). Returns a list of result rows.
+    """
+    from vector_transformer import load_embeddings, split_markdown
+    md_text = Path(md_path).read_text(encoding="utf-8")
+    embeddings = load_embeddings()
+    rows = []
+
+    for config in chunking_configs:
+        mode, chunk_size = parse_chunking(config)
+        start = time.perf_counter()
+        splits = split_markdown(md_text, mode, embeddings, chunk_size)
+        texts = [doc.page_content for doc in splits]
+        vectors = embeddings.embed_documents(texts)
+        build_s = time.perf_counter() - start
+        print(f"{config}: {len(splits)} Chunks, Split + Embedding {build_s:.1f} s")
+        for index_type in index_types:
+            vector_db = build_index(index_type, vectors, texts, [doc.metadata for doc in splits], embeddings)
+            for k in k_values:
+                row = {"chunking": config, "index": index_type, "k": k, "chunks": len(splits)}
+                row.update(evaluate_store(vector_db, embeddings, golden, k, rounds))
+                rows.append(row)
+
+    if existing_index:
+        from index_snapshots import load_index
+        vector_db = load_index(existing_index, embeddings)
+        for k in k_values:
+            row = {"chunking": f"index:{existing_index}", "index": type(vector_db.index).__name__, "k": k,
+                   "chunks": vector_db.index.ntotal}
+            row.update(evaluate_store(vector_db, embeddings, golden, k, rounds))
+            rows.append(row)
+    return rows
+
+
+def best_configuration(rows, target_recall=TARGET_RECALL):
+    """Fastest row (by p95 search latency) that reaches the recall target, or None."""
+    candidates = [row for row in rows if row["recall"] >= target_recall]
+    return min(candidates, key=lambda row: (row["search_p95_ms"], row["k"])) if candidates else None
+
+
+def format_table(rows):
+    header = f"{'Chunking':<14} {'Index':<8} {'k':>3} {'Chunks':>7} {'Recall':>7} {'MRR':>6} " \
+             f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(f"{row['chunking']:<14} {row['index']:<8} {row['k']:>3} {row['chunks']:>7} {row['recall']:>7.3f} "
+                     f"{row['mrr']:>6.3f} {row['search_p50_ms']:>8.3f} {row['search_p95_ms']:>8.3f} "
+                     f"{row['search_p99_ms']:>8.3f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Retrieval quality vs. latency per chunking/index/k configuration")
+    parser.add_argument("file", help="(enriched) markdown file the indexes are built from")
+    parser.add_argument("--golden", help="golden set (JSON/JSONL: question, section and/or image); "
+                                         "default: self-retrieval questions from the document")
+    parser.add_argument("--chunking", default=",".join(CHUNKING_CONFIGS),
+                        help="comma-separated split modes, optionally with size, e.g. tokens,chars,chars:800")
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--k", default=",".join(str(k) for k in K_VALUES))
+    parser.add_argument("--rounds", type=int, default=3, help="repetitions of the golden set for stable percentiles")
+    parser.add_argument("--existing-index", help="also evaluate an existing index folder, e.g. faiss_index")
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL)
+    parser.add_argument("--out", help="write all rows as JSON")
+    args = parser.parse_args()
+
+    if args.golden:
+        golden = load_golden_set(args.golden)
+    else:
+        golden = golden_set_from_markdown(Path(args.file).read_text(encoding="utf-8"))
+        print(f"Kein Golden Set angegeben: {len(golden)} Zeilen des Dokuments als Fragen")
+    if not golden:
+        raise SystemExit("Golden Set ist leer.")
+
+    rows = evaluate(args.file, golden,
+                    [c.strip() for c in args.chunking.split(",") if c.strip()],
+                    [t.strip() for t in args.index_types.split(",") if t.strip()],
+                    [int(k) for k in args.k.split(",")],
+                    args.rounds, args.existing_index)
+    print(format_table(rows))
+    best = best_configuration(rows, args.target_recall)
+    if best:
+        print(f"\nSchnellste Konfiguration mit Recall >= {args.target_recall}: "
+              f"{best['chunking']} / {best['index']} / k={best['k']} (p95 {best['search_p95_ms']} ms)")
+    else:
+        print(f"\nKeine Konfiguration erreicht Recall >= {args.target_recall}.")
+    if args.out:
+        Path(args.out).write_text(json.dumps({"golden_size": len(golden), "rows": rows}, indent=2), encoding="utf-8")
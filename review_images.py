@@ -0,0 +1,210 @@
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# Wie viele Bilder vor/nach dem aktuellen vorab dekodiert werden
+PREFETCH_RADIUS = 3
+# Obergrenze der fertig skalierten Bilder im Speicher (muss >= 2 * Radius + 1 sein)
+MAX_DECODED_IMAGES = 16
+
+
+def load_scaled_image(img_path, max_width, max_height):
+    """Opens an image and scales it to fit into max_width x max_height (never upscales beyond fit)."""
+    pil_img = Image.open(img_path)
+    ratio = min(max_width / pil_img.width, max_height / pil_img.height)
+    new_size = (max(1, int(pil_img.width * ratio)), max(1, int(pil_img.height * ratio)))
+    # reducing_gap: erst grob per Box-Filter verkleinern, dann LANCZOS -> deutlich schneller bei großen Screenshots
+    return pil_img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+class ImagePrefetcher:
+    """
+    Decodes and resizes the review images (bild_N.png) on a background thread.
+
+    The GUI calls request() whenever the current index changes; the neighbourhood
+    of that index is decoded nearest-first and kept in an LRU-bounded cache of PIL
+    images. PhotoImage objects must still be created on the Tk main thread, so the
+    GUI converts the returned PIL image itself.
+    on_ready(idx) is called from the worker thread after an image was decoded or
+    failed to decode; error(idx) then holds the message.
+    """
+
+    def __init__(self, image_dir, display_size=(1000, 600), radius=PREFETCH_RADIUS,
+                 max_cached=MAX_DECODED_IMAGES, on_ready=None):
+        self.image_dir = image_dir
+        self.display_size = display_size
+        self.radius = radius
+        self.max_cached = max(max_cached, 2 * radius + 1)
+        self.on_ready = on_ready
+
+        self._cache = OrderedDict()  # idx -> skaliertes PIL Image
+        self._errors = {}            # idx -> Fehlermeldung (wird nicht erneut versucht)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def request(self, idx, total):
+        """Schedules idx and its neighbours; replaces any older, now stale, schedule."""
+        order = [idx]
+        for dist in range(1, self.radius + 1):
+            # Vorwärts zuerst, weil meistens nach rechts geblättert wird
+            if idx + dist <= total:
+                order.append(idx + dist)
+            if idx - dist >= 1:
+                order.append(idx - dist)
+
+        with self._cond:
+            for i in order:
+                if i in self._cache:
+                    self._cache.move_to_end(i)
+            self._pending = [i for i in order if i not in self._cache and i not in self._errors]
+            self._cond.notify()
+
+    def get(self, idx):
+        """Returns the scaled PIL image if it is already decoded, else None."""
+        with self._cond:
+            img = self._cache.get(idx)
+            if img is not None:
+                self._cache.move_to_end(idx)
+            return img
+
+    def error(self, idx):
+        """Returns the error message if idx could not be decoded, else None."""
+        with self._cond:
+            return self._errors.get(idx)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._pending = []
+            self._cache.clear()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                idx = self._pending.pop(0)
+
+            try:
+                img = load_scaled_image(self.image_dir / f"bild_{idx}.png", *self.display_size)
+            except Exception as e:
+                print(f"Error loading image {idx}: {e}")
+                img = None
+                with self._cond:
+                    self._errors[idx] = str(e)
+
+            with self._cond:
+                if self._closed:
+                    return
+                if img is not None:
+                    self._cache[idx] = img
+                    self._cache.move_to_end(idx)
+                    while len(self._cache) > self.max_cached:
+                        self._cache.popitem(last=False)
+
+            if self.on_ready:
+                self.on_ready(idx)
+
+
+# Kantenlänge der Vorschaubilder im Raster
+THUMBNAIL_SIZE = 160
+# Obergrenze der Vorschaubilder im Speicher (sichtbare Zeilen + etwas Vorlauf)
+MAX_THUMBNAILS_IN_MEMORY = 400
+
+
+class ThumbnailLoader:
+    """
+    Lazily creates thumbnails for the grid review and caches them on disk
+    (<image_dir>/.thumbs), so every image is only scaled down once per run.
+
+    request(indices) replaces the queue with the cells that are currently
+    visible; already scrolled-away cells are never generated. on_ready(idx)
+    is called from the worker thread, also when a thumbnail failed (see error()).
+    """
+
+    def __init__(self, image_dir, size=THUMBNAIL_SIZE, max_cached=MAX_THUMBNAILS_IN_MEMORY, on_ready=None):
+        self.image_dir = image_dir
+        self.size = size
+        self.max_cached = max_cached
+        self.on_ready = on_ready
+        self.thumb_dir = image_dir / ".thumbs"
+        self.thumb_dir.mkdir(parents=True, exist_ok=True)
+
+        self._cache = OrderedDict()  # idx -> PIL Image (Thumbnail)
+        self._errors = {}            # idx -> Fehlermeldung (wird nicht erneut versucht)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def thumbnail_path(self, idx):
+        return self.thumb_dir / f"bild_{idx}_{self.size}.png"
+
+    def request(self, indices):
+        with self._cond:
+            self._pending = [i for i in indices if i not in self._cache and i not in self._errors]
+            self._cond.notify()
+
+    def get(self, idx):
+        with self._cond:
+            img = self._cache.get(idx)
+            if img is not None:
+                self._cache.move_to_end(idx)
+            return img
+
+    def error(self, idx):
+        with self._cond:
+            return self._errors.get(idx)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._pending = []
+            self._cache.clear()
+            self._cond.notify()
+
+    def _load(self, idx):
+        thumb_path = self.thumbnail_path(idx)
+        if thumb_path.exists():
+            img = Image.open(thumb_path)
+            img.load()
+            return img
+        img = Image.open(self.image_dir / f"bild_{idx}.png")
+        img.thumbnail((self.size, self.size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        img.save(thumb_path)
+        return img
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                idx = self._pending.pop(0)
+
+            try:
+                img = self._load(idx)
+            except Exception as e:
+                print(f"Error creating thumbnail {idx}: {e}")
+                img = None
+                with self._cond:
+                    self._errors[idx] = str(e)
+
+            with self._cond:
+                if self._closed:
+                    return
+                if img is not None:
+                    self._cache[idx] = img
+                    while len(self._cache) > self.max_cached:
+                        self._cache.popitem(last=False)
+
+            if self.on_ready:
+                self.on_ready(idx)
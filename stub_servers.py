@@ -0,0 +1,148 @@
+import re
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lokale Stub-Server für OpenAI- und Ollama-Endpunkte, damit sich Backends ohne Netz,
+# API-Key oder GPU durchspielen lassen. Antworten sind deterministisch und haben dasselbe
+# Format wie ein echtes Modell (inkl. '=== BILD <n> ===' bei Sammelanfragen).
+GROUP_PROMPT_PATTERN = re.compile(r"Du erhältst (\d+) Screenshots")
+STUB_DESCRIPTION = "Fenster: Stub\nWorkflow: Schritt 1 > Button > Klicken\nSoll-Konfiguration: Feld: Wert"
+
+
+STUB_CHAT_ANSWER = "Öffnen Sie Einstellungen > Drucker und klicken Sie auf Speichern.\nQUELLEN: 1"
+
+
+def stub_answer(image_count):
+    if image_count <= 1:
+        return STUB_DESCRIPTION
+    return "\n".join(f"=== BILD {n} ===\n{STUB_DESCRIPTION}" for n in range(1, image_count + 1))
+
+
+class StubServer:
+    """
+    Serves /v1/chat/completions (OpenAI format), /api/chat and /api/generate (Ollama format,
+    with streaming and a fake "context": one token per 4 prompt characters) on localhost.
+    delay: seconds per request; in_flight/max_in_flight show how many requests ran in parallel.
+    failures: list of (status, retry_after) answered to the first requests, e.g. [(503, None), (429, "1")];
+    ("hang", seconds) keeps the request open that long and closes it without an answer (client timeout).
+    Token-rate simulation for /api/generate (load tests): prefill_tps/decode_tps in tokens per second,
+    answer_tokens = length of the streamed answer, slots = parallel generations like OLLAMA_NUM_PARALLEL
+    (further requests wait), error_rate = share of requests answered with 503.
+    """
+
+    def __init__(self, delay=0.0, port=0, failures=None, prefill_tps=None, decode_tps=None, answer_tokens=None,
+                 slots=None, error_rate=0.0, seed=0):
+        self.delay = delay
+        self.failures = list(failures or [])
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self._slots = threading.Semaphore(slots) if slots else None
+        self._random = random.Random(seed)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with stub._lock:
+                    stub.requests.append((self.path, body))
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    failure = stub.failures.pop(0) if stub.failures else None
+                    if failure is None and stub.error_rate and stub._random.random() < stub.error_rate:
+                        failure = (503, None)
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    if failure and failure[0] == "hang":
+                        time.sleep(failure[1]) # Client läuft in seinen Read-Timeout
+                        self.close_connection = True
+                    elif failure:
+                        status, retry_after = failure
+                        headers = {"Retry-After": retry_after} if retry_after is not None else {}
+                        self._send(status, {"error": {"message": f"stub failure {status}"}}, headers)
+                    elif self.path.startswith("/v1/chat/completions"):
+                        content = body["messages"][-1]["content"]
+                        images = sum(1 for part in content if part.get("type") == "image_url")
+                        self._send(200, {"choices": [{"message": {"role": "assistant", "content": stub_answer(images)}}]})
+                    elif self.path.startswith("/api/chat"):
+                        message = body["messages"][-1]
+                        match = GROUP_PROMPT_PATTERN.search(message["content"])
+                        images = int(match.group(1)) if match else len(message.get("images", []))
+                        self._send(200, {"model": body.get("model"), "done": True,
+                                         "message": {"role": "assistant", "content": stub_answer(images)}})
+                    elif self.path.startswith("/api/generate"):
+                        if stub._slots:
+                            with stub._slots:
+                                self._generate(body)
+                        else:
+                            self._generate(body)
+                    else:
+                        self._send(404, {"error": f"unknown path {self.path}"})
+                finally:
+                    with stub._lock:
+                        stub.in_flight -= 1
+
+            def _generate(self, body):
+                # Nur der neue Prompt muss "vorverarbeitet" werden, der mitgeschickte context nicht
+                prompt_tokens = max(1, len(body.get("prompt", "")) // 4)
+                pieces = [word + " " for word in STUB_CHAT_ANSWER.split(" ")]
+                if stub.answer_tokens and stub.answer_tokens > len(pieces):
+                    filler = [word + " " for word in STUB_CHAT_ANSWER.split("\n")[0].split(" ")]
+                    extra = (filler * stub.answer_tokens)[:stub.answer_tokens - len(pieces)]
+                    pieces = extra[:-1] + [extra[-1].rstrip() + "\n"] + pieces
+                if stub.prefill_tps:
+                    time.sleep(prompt_tokens / stub.prefill_tps)
+                context = list(body.get("context") or []) + [1] * prompt_tokens + [2] * len(pieces)
+                final = {"model": body.get("model"), "done": True, "context": context,
+                         "prompt_eval_count": prompt_tokens, "eval_count": len(pieces)}
+                if not body.get("stream", True):
+                    if stub.decode_tps:
+                        time.sleep(len(pieces) / stub.decode_tps)
+                    self._send(200, dict(final, response="".join(pieces)))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for piece in pieces:
+                    if stub.decode_tps:
+                        time.sleep(1 / stub.decode_tps)
+                    self.wfile.write((json.dumps({"response": piece, "done": False}) + "\n").encode("utf-8"))
+                self.wfile.write((json.dumps(dict(final, response="")) + "\n").encode("utf-8"))
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
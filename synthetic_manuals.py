@@ -0,0 +1,261 @@
+import zlib
+import struct
+import random
+from pathlib import Path
+
+# Synthetische Handbücher für Benchmarks: PDF (reines Python, keine Abhängigkeiten) und
+# das passende _mapped.md mit Bildern. Inhalt ist deterministisch (seed), Größe konfigurierbar.
+PAGE_W, PAGE_H = 595, 842 # A4 in Punkt
+MARGIN = 56
+IMAGE_W, IMAGE_H = 480, 300 # Pixel der Screenshot-Attrappen
+
+WORDS = ("Drucker Einstellungen Benutzer Speichern Dialog Fenster Konfiguration Patient Abrechnung "
+         "Formular Schaltfläche Menü Auswahl Datei Export Import Server Verbindung Passwort Rechte "
+         "Vorlage Eintrag Liste Suche Filter Datum Feld Wert aktivieren klicken öffnen wählen prüfen "
+         "anschließend danach zuerst bestätigen Sie die den das mit im auf unter über").split()
+
+
+def _sentence(rng, min_words=8, max_words=18):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return " ".join(words).capitalize() + "."
+
+
+def manual_spec(pages=20, headings_per_page=2, paragraphs_per_heading=2, images_per_page=1, tables_every=5,
+                seed=0):
+    """
+    Content plan of one manual: a list of pages, each a list of blocks
+    ("heading", level, text) | ("paragraph", text) | ("image", n) | ("table", rows).
+    """
+    rng = random.Random(seed)
+    spec, chapter, image_no = [], 0, 0
+    for page_no in range(1, pages + 1):
+        blocks = []
+        for h in range(headings_per_page):
+            chapter += 1
+            level = 1 if h == 0 and page_no % 5 == 1 else 2
+            blocks.append(("heading", level, f"{chapter} {rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}"))
+            for _ in range(paragraphs_per_heading):
+                blocks.append(("paragraph", " ".join(_sentence(rng) for _ in range(3))))
+            if h < images_per_page:
+                image_no += 1
+                blocks.append(("image", image_no))
+        for _ in range(max(0, images_per_page - headings_per_page)):
+            image_no += 1
+            blocks.append(("image", image_no))
+        if tables_every and page_no % tables_every == 0:
+            rows = [["Feld", "Wert", "Beschreibung"]]
+            rows += [[rng.choice(WORDS), str(rng.randint(1, 999)), rng.choice(WORDS)] for _ in range(6)]
+            blocks.append(("table", rows))
+        spec.append(blocks)
+    return spec
+
+
+def screenshot_pixels(n, width=IMAGE_W, height=IMAGE_H):
+    """RGB bytes of a fake UI screenshot (title bar, fields, buttons); different per n."""
+    rng = random.Random(n)
+    accent = bytes((rng.randint(40, 200), rng.randint(40, 200), rng.randint(120, 255)))
+    background, white, border = b"\xec\xec\xec", b"\xff\xff\xff", b"\x78\x78\x78"
+    fields = [(rng.randint(20, 60), 50 + i * 40, rng.randint(200, 400), 24) for i in range(rng.randint(3, 5))]
+    button = (width - 130, height - 50, 100, 30)
+    # Zeilenweise über Bytes-Slices statt pixelweise, sonst dauert ein großes Korpus Minuten
+    rows = []
+    for y in range(height):
+        if y < 28:
+            rows.append(accent * width)
+            continue
+        row = bytearray(background * width)
+        for fx, fy, fw, fh in fields:
+            if fy <= y < fy + fh:
+                edge = y in (fy, fy + fh - 1)
+                row[fx * 3:(fx + fw) * 3] = (border if edge else white) * fw
+                row[fx * 3:fx * 3 + 3] = border
+                row[(fx + fw - 1) * 3:(fx + fw) * 3] = border
+        bx, by, bw, bh = button
+        if by <= y < by + bh:
+            row[bx * 3:(bx + bw) * 3] = accent * bw
+        rows.append(bytes(row))
+    return rows
+
+
+def write_png(path, rows, width, height):
+    """Minimal PNG encoder (8-bit RGB) so the generator needs no imaging library."""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+    raw = b"".join(b"\x00" + row for row in rows)
+    png = b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+    png += chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+    Path(path).write_bytes(png)
+
+
+def _pdf_text(text):
+    data = text.encode("cp1252", errors="replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _wrap(text, size, width):
+    # Helvetica: im Mittel ca. 0.5 * Schriftgröße pro Zeichen
+    max_chars = max(10, int(width / (size * 0.5)))
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > max_chars:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    if line:
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path, spec):
+    """Writes the spec as a real PDF (text, vector table rules, embedded images). Returns stats."""
+    objects = [] # Index i -> Objekt-Nr. i + 1
+
+    def add(data):
+        objects.append(data)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    font_bold = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+    page_ids, image_count, table_count = [], 0, 0
+
+    def block_height(block):
+        if block[0] == "heading":
+            return (18 if block[1] == 1 else 14) + 16
+        if block[0] == "paragraph":
+            return 13 * len(_wrap(block[1], 10, PAGE_W - 2 * MARGIN)) + 6
+        if block[0] == "image":
+            return 235
+        return 18 * len(block[1]) + 20
+
+    def finish_page(ops, xobjects):
+        content = b"\n".join(ops)
+        content_obj = add(b"<< /Length %d >>\nstream\n" % len(content) + content)
+        xobject_dict = b" ".join(b"/%s %d 0 R" % (name, obj) for name, obj in xobjects.items())
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << %s >> >> >>"
+            % (pages_obj, PAGE_W, PAGE_H, content_obj, font, font_bold, xobject_dict)))
+
+    for blocks in spec:
+        ops, xobjects = [], {}
+        y = PAGE_H - MARGIN
+        for block in blocks:
+            kind = block[0]
+            if ops and y - block_height(block) < MARGIN:
+                # Seite voll: Umbruch wie in einem echten Handbuch (PDF hat dann mehr Seiten als die Spec)
+                finish_page(ops, xobjects)
+                ops, xobjects = [], {}
+                y = PAGE_H - MARGIN
+            if kind == "heading":
+                size = 18 if block[1] == 1 else 14
+                y -= size + 10
+                ops.append(b"BT /F2 %d Tf %d %d Td (%s) Tj ET" % (size, MARGIN, y, _pdf_text(block[2])))
+                y -= 6
+            elif kind == "paragraph":
+                for line in _wrap(block[1], 10, PAGE_W - 2 * MARGIN):
+                    y -= 13
+                    ops.append(b"BT /F1 10 Tf %d %d Td (%s) Tj ET" % (MARGIN, y, _pdf_text(line)))
+                y -= 6
+            elif kind == "image":
+                draw_w, draw_h = 360, 225
+                y -= draw_h + 10
+                rows = screenshot_pixels(block[1])
+                image_obj = add(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                                b"/BitsPerComponent 8 /Filter /FlateDecode /Length %%d >>" % (IMAGE_W, IMAGE_H)
+                                + b"\nstream\n" + zlib.compress(b"".join(rows), 6))
+                name = f"Im{block[1]}".encode()
+                xobjects[name] = image_obj
+                ops.append(b"q %d 0 0 %d %d %d cm /%s Do Q" % (draw_w, draw_h, MARGIN, y, name))
+                image_count += 1
+            elif kind == "table":
+                rows = block[1]
+                col_w, row_h = (PAGE_W - 2 * MARGIN) / 3, 18
+                top = y - 10
+                height = row_h * len(rows)
+                for r in range(len(rows) + 1):
+                    ops.append(b"%d %.1f m %d %.1f l S" % (MARGIN, top - r * row_h, PAGE_W - MARGIN, top - r * row_h))
+                for c in range(4):
+                    x = MARGIN + c * col_w
+                    ops.append(b"%.1f %.1f m %.1f %.1f l S" % (x, top, x, top - height))
+                for r, row in enumerate(rows):
+                    for c, cell in enumerate(row):
+                        ops.append(b"BT /F1 9 Tf %.1f %.1f Td (%s) Tj ET"
+                                   % (MARGIN + c * col_w + 4, top - (r + 1) * row_h + 5, _pdf_text(cell)))
+                y = top - height - 10
+                table_count += 1
+        finish_page(ops, xobjects)
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % p for p in page_ids), len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, data in enumerate(objects, 1):
+        offsets.append(len(out))
+        if b"\nstream\n" in data:
+            head, stream = data.split(b"\nstream\n", 1)
+            if b"%d" in head:
+                head = head.replace(b"%d", str(len(stream)).encode(), 1)
+            data = head + b"\nstream\n" + stream + b"\nendstream"
+        out += b"%d 0 obj\n" % number + data + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%EOF\n" % (len(objects) + 1, catalog, xref)
+    Path(path).write_bytes(bytes(out))
+    return {"pages": len(page_ids), "images": image_count, "tables": table_count, "bytes": len(out)}
+
+
+def write_markdown(output_dir, name, spec):
+    """
+    Writes <output_dir>/<name>_mapped.md plus images/<name>/diagramm_n.png, i.e. what
+    process_phase_2 would produce for the same manual. Returns (md path, stats).
+    """
+    output_dir = Path(output_dir)
+    image_dir = output_dir / "images" / name
+    image_dir.mkdir(parents=True, exist_ok=True)
+    lines, images, chars = [], 0, 0
+    for blocks in spec:
+        for block in blocks:
+            kind = block[0]
+            if kind == "heading":
+                lines.append(f"{'#' * (block[1] + 1)} {block[2]}")
+            elif kind == "paragraph":
+                lines.append(block[1])
+            elif kind == "image":
+                write_png(image_dir / f"diagramm_{block[1]}.png", screenshot_pixels(block[1]), IMAGE_W, IMAGE_H)
+                lines.append(f"![Extrahiertes Bild](images/{name}/diagramm_{block[1]}.png)")
+                images += 1
+            elif kind == "table":
+                rows = block[1]
+                lines.append("| " + " | ".join(rows[0]) + " |")
+                lines.append("|" + "---|" * len(rows[0]))
+                lines.extend("| " + " | ".join(row) + " |" for row in rows[1:])
+            lines.append("")
+    md_text = "\n".join(lines)
+    chars = len(md_text)
+    md_path = output_dir / f"{name}_mapped.md"
+    md_path.write_text(md_text, encoding="utf-8")
+    return md_path, {"images": images, "chars": chars}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate a synthetic manual (PDF + mapped markdown)")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--headings-per-page", type=int, default=2)
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--tables-every", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--name", default="synthetic_manual")
+    parser.add_argument("--out", default=".")
+    args = parser.parse_args()
+
+    spec = manual_spec(args.pages, args.headings_per_page, 2, args.images_per_page, args.tables_every, args.seed)
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+    print(write_pdf(Path(args.out) / f"{args.name}.pdf", spec))
+    print(write_markdown(Path(args.out) / "extracted_data", args.name, spec))
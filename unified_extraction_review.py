@@ -1,13 +1,111 @@
 import time
-import re
 import shutil
 from pathlib import Path
 from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.datamodel.pipeline_options import PdfPipelineOptions
 from docling.datamodel.document import PictureItem
+from junk_classifier import image_features, junk_score, classify
+from document_manifest import build_manifest, write_document, replace_spans
+from pipeline_metrics import span
+
+# pypdfium2 kommt mit docling mit, wird aber nur für den schnellen Vor-Scan gebraucht
+try:
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+# Vor-Scan Schwellwerte
+MIN_TEXT_CHARS = 30       # weniger Zeichen im Textlayer -> Seite ist vermutlich gescannt (OCR nötig)
+MIN_TABLE_RULES = 4       # horizontale + vertikale Linien, ab denen ein Raster vermutet wird
+MIN_TABLE_ROWS = 3        # Zeilen mit >= 3 Textblöcken an gleichen x-Positionen
+MIN_FAST_RUN = 3          # kürzere "schnelle" Abschnitte zwischen teuren Seiten lohnen keinen eigenen Lauf
+
+
+def _page_has_table(page, textpage):
+    """Cheap table heuristic: ruled grid lines or column-aligned text rows."""
+    h_rules, v_rules = 0, 0
+    for obj in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_PATH], max_depth=2):
+        left, bottom, right, top = obj.get_pos()
+        w, h = right - left, top - bottom
+        if h < 2 and w > 20:
+            h_rules += 1
+        elif w < 2 and h > 8:
+            v_rules += 1
+    if h_rules >= MIN_TABLE_RULES // 2 and v_rules >= MIN_TABLE_RULES // 2:
+        return True
+
+    # Randlose Tabellen: mehrere Textblöcke pro Zeile, die spaltenweise fluchten
+    rows = {}
+    for i in range(textpage.count_rects()):
+        left, bottom, right, top = textpage.get_rect(i)
+        rows.setdefault(round(bottom / 3), []).append(round(left / 5))
+    multi_col_rows = [xs for xs in rows.values() if len(xs) >= 3]
+    if len(multi_col_rows) < MIN_TABLE_ROWS:
+        return False
+    column_hits = {}
+    for xs in multi_col_rows:
+        for x in set(xs):
+            column_hits[x] = column_hits.get(x, 0) + 1
+    aligned_columns = [x for x, hits in column_hits.items() if hits >= MIN_TABLE_ROWS]
+    return len(aligned_columns) >= 3
+
+
+def scan_pdf_pages(pdf_path):
+    """
+    Fast pre-scan (no ML models) over the PDF text layer and drawing operators.
+    Returns one dict per page: {"page", "chars", "needs_ocr", "has_table"}.
+    """
+    pdf = pdfium.PdfDocument(str(pdf_path))
+    pages = []
+    try:
+        for page_no in range(len(pdf)):
+            page = pdf[page_no]
+            textpage = page.get_textpage()
+            chars = textpage.count_chars()
+            pages.append({
+                "page": page_no + 1,
+                "chars": chars,
+                "needs_ocr": chars < MIN_TEXT_CHARS,
+                "has_table": _page_has_table(page, textpage),
+            })
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return pages
+
+
+def plan_page_segments(page_scan):
+    """
+    Groups consecutive pages into (start, end, full_pipeline) runs (1-based, inclusive).
+    Short fast runs between expensive pages are folded into the expensive run,
+    because every extra converter run costs its own PDF parsing overhead.
+    """
+    flags = [p["needs_ocr"] or p["has_table"] for p in page_scan]
+    segments = []
+    for page_no, full in enumerate(flags, 1):
+        if segments and segments[-1][2] == full:
+            segments[-1][1] = page_no
+        else:
+            segments.append([page_no, page_no, full])
+
+    merged = []
+    for i, seg in enumerate(segments):
+        start, end, full = seg
+        is_inner = 0 < i < len(segments) - 1
+        if not full and is_inner and (end - start + 1) < MIN_FAST_RUN:
+            full = True
+        if merged and merged[-1][2] == full:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end, full])
+    return [tuple(seg) for seg in merged]
+
 
 class PdfProcessor:
-    def __init__(self, pdf_filename):
+    def __init__(self, pdf_filename, force_full_pipeline=False, auto_classify=True):
         self.pdf_filename = pdf_filename
         self.pdf_path = Path(pdf_filename)
         self.output_dir = Path("extracted_data")
@@ -15,11 +113,20 @@ class PdfProcessor:
         self.temp_image_dir = self.output_dir / "temp_review"
         self.final_image_dir = self.output_dir / "images" / self.software_name
         self.md_content = ""
+        self.md_manifest = None # Struktur von md_content (Platzhalter-Offsets), einmalig in Phase 1 erstellt
         self.all_images = [] # Temporarily holds PILLOW image objects if kept in memory, 
                              # but for GUI we might just reload from disk or keep references.
                              # Actually, for step 2 we re-read or rely on indices. 
                              # Let's just track the count.
         self.image_count = 0
+        # Teure Modelle (Tabellenstruktur, OCR) auf allen Seiten erzwingen
+        self.force_full_pipeline = force_full_pipeline
+        self.pipeline_report = {}
+        # Junk-Vorklassifizierung (1-basierte Indizes wie in der Review)
+        self.auto_classify = auto_classify
+        self.junk_scores = {}
+        self.suggested_deletions = set()
+        self.uncertain_indices = []
 
     def prepare_directories(self):
         # Ordner bereinigen/erstellen
@@ -30,34 +137,34 @@ class PdfProcessor:
         if self.final_image_dir.exists(): shutil.rmtree(self.final_image_dir)
         self.final_image_dir.mkdir(parents=True, exist_ok=True)
 
-    def process_phase_1(self):
+    def process_phase_1(self, progress_callback=None):
         """
         Runs the conversion and extracts images to temp dir.
         Returns the path to the temp directory and the number of images found.
+        progress_callback(current, total, message) is called per converted page run and saved image.
         """
         self.prepare_directories()
 
-        pipeline_options = PdfPipelineOptions()
-        pipeline_options.do_table_structure = True
-        pipeline_options.generate_page_images = True
-        pipeline_options.images_scale = 2.0
-
-        converter = DocumentConverter(
-            format_options={"pdf": PdfFormatOption(pipeline_options=pipeline_options)}
-        )
+        if self.force_full_pipeline or not PDFIUM_AVAILABLE:
+            segments = None
+        else:
+            with span("prescan", unit="pages") as attrs:
+                page_scan = scan_pdf_pages(self.pdf_path)
+                attrs["items"] = len(page_scan)
+            segments = plan_page_segments(page_scan)
 
         print(f"--- Analyse läuft: {self.pdf_filename} ---")
-        result = converter.convert(self.pdf_path)
-        self.md_content = result.document.export_to_markdown()
+        if segments is None:
+            with span("docling.convert", unit="pages", full=True) as attrs:
+                result = self._build_converter(full=True).convert(self.pdf_path)
+                self.md_content = result.document.export_to_markdown()
+                images, locations = self._collect_images(result.document)
+                attrs["items"] = len(result.document.pages)
+            self.pipeline_report = {"mode": "full"}
+        else:
+            self.md_content, images, locations = self._convert_segments(segments, progress_callback)
 
-        # Bilder extrahieren
-        images = []
-        for item, _ in result.document.iterate_items():
-            if isinstance(item, PictureItem):
-                visual_crop = item.get_image(result.document)
-                if visual_crop:
-                    images.append(visual_crop)
-        
+        self.md_manifest = build_manifest(self.md_content)
         self.image_count = len(images)
         self.all_images = images # store references if needed later, though we save them now
 
@@ -65,16 +172,133 @@ class PdfProcessor:
             return self.temp_image_dir, 0
 
         # Bilder temporär speichern
-        for i, img in enumerate(images, 1):
-            img.save(self.temp_image_dir / f"bild_{i}.png")
+        with span("images.save", unit="images", items=len(images)):
+            for i, img in enumerate(images, 1):
+                img.save(self.temp_image_dir / f"bild_{i}.png")
+                if progress_callback:
+                    progress_callback(i, len(images), "images saved")
+
+        if self.auto_classify:
+            with span("images.classify", unit="images", items=len(images)):
+                self.classify_images(images, locations)
             
         return self.temp_image_dir, self.image_count
 
+    def classify_images(self, images, locations):
+        """
+        Scores every crop with cheap heuristics (size, aspect, entropy, bbox) and
+        pre-marks the obvious junk; the review only has to confirm the rest.
+        """
+        self.junk_scores = {}
+        self.suggested_deletions = set()
+        self.uncertain_indices = []
+        for i, (img, location) in enumerate(zip(images, locations), 1):
+            score = junk_score(image_features(img, location))
+            self.junk_scores[i] = score
+            verdict = classify(score)
+            if verdict == "junk":
+                self.suggested_deletions.add(i)
+            elif verdict == "uncertain":
+                self.uncertain_indices.append(i)
+
+        print(f"Vorklassifizierung: {len(self.suggested_deletions)} Bilder als Junk vorgemerkt, "
+              f"{len(self.uncertain_indices)} unsicher, "
+              f"{self.image_count - len(self.suggested_deletions) - len(self.uncertain_indices)} sicher relevant.")
+
+    def _build_converter(self, full):
+        pipeline_options = PdfPipelineOptions()
+        pipeline_options.do_table_structure = full
+        pipeline_options.do_ocr = full
+        pipeline_options.generate_page_images = True
+        pipeline_options.images_scale = 2.0
+
+        return DocumentConverter(
+            format_options={"pdf": PdfFormatOption(pipeline_options=pipeline_options)}
+        )
+
+    def _collect_images(self, document):
+        """Returns the picture crops and their page location (for the junk classifier)."""
+        images, locations = [], []
+        for item, _ in document.iterate_items():
+            if isinstance(item, PictureItem):
+                visual_crop = item.get_image(document)
+                if visual_crop:
+                    images.append(visual_crop)
+                    locations.append(self._picture_location(document, item))
+        return images, locations
+
+    def _picture_location(self, document, item):
+        if not item.prov:
+            return None
+        prov = item.prov[0]
+        page = document.pages.get(prov.page_no)
+        if page is None:
+            return None
+        bbox = prov.bbox.to_top_left_origin(page.size.height)
+        return {
+            "page_no": prov.page_no,
+            "bbox": (bbox.l, bbox.t, bbox.r, bbox.b),
+            "page_w": page.size.width,
+            "page_h": page.size.height,
+        }
+
+    def _convert_segments(self, segments, progress_callback=None):
+        """
+        Converts each page run with the cheapest pipeline that fits it and stitches
+        markdown and images back together in page order.
+        """
+        converters = {}
+        md_parts, images, locations = [], [], []
+        timings = {True: [0.0, 0], False: [0.0, 0]}  # full -> [Sekunden, Seiten]
+        total_pages = segments[-1][1] if segments else 0
+
+        for start, end, full in segments:
+            if full not in converters:
+                converters[full] = self._build_converter(full)
+            t0 = time.perf_counter()
+            with span("docling.convert", unit="pages", items=end - start + 1, full=full):
+                result = converters[full].convert(self.pdf_path, page_range=(start, end))
+                md_parts.append(result.document.export_to_markdown())
+                segment_images, segment_locations = self._collect_images(result.document)
+            images.extend(segment_images)
+            locations.extend(segment_locations)
+            timings[full][0] += time.perf_counter() - t0
+            timings[full][1] += end - start + 1
+            if progress_callback:
+                progress_callback(end, total_pages, "pages converted")
+
+        full_time, full_pages = timings[True]
+        fast_time, fast_pages = timings[False]
+        saved = None
+        if full_pages and fast_pages:
+            # Geschätzt: Schnelle Seiten hätten so lange gedauert wie die teuren im Schnitt
+            saved = max(0.0, fast_pages * (full_time / full_pages - fast_time / fast_pages))
+
+        self.pipeline_report = {
+            "mode": "adaptive",
+            "segments": segments,
+            "full_pages": full_pages,
+            "fast_pages": fast_pages,
+            "full_seconds": round(full_time, 2),
+            "fast_seconds": round(fast_time, 2),
+            "estimated_seconds_saved": round(saved, 2) if saved is not None else None,
+        }
+        print(f"Adaptive Pipeline: {full_pages} Seiten mit Tabellen/OCR ({full_time:.1f}s), "
+              f"{fast_pages} Seiten schnell ({fast_time:.1f}s).")
+        if saved is not None:
+            print(f"Geschätzte Zeitersparnis: {saved:.1f}s")
+
+        return "\n\n".join(part for part in md_parts if part.strip()), images, locations
+
     def process_phase_2(self, exclude_indices):
         """
         Moves kept images to final location and writes the Markdown file.
         exclude_indices: list of integers (1-based) to remove.
         """
+        with span("phase_2.finalize", unit="images", items=self.image_count):
+            return self._finalize(exclude_indices)
+
+    def _finalize(self, exclude_indices):
         final_mapping = {}
         current_final_id = 1
         
@@ -94,24 +318,18 @@ class PdfProcessor:
                     # Should not happen if flow is correct
                     final_mapping[i] = None
 
-        # Markdown anpassen
-        tag_counter = {"count": 0}
-
-        def replace_logic(match):
-            tag_counter["count"] += 1
-            idx = tag_counter["count"]
-            
-            path = final_mapping.get(idx)
-            if path:
-                return f"![Extrahiertes Bild]({path})"
-            else:
-                return "" 
+        # Markdown anpassen: die n-te "<!-- image -->"-Markierung gehört zum n-ten Bild.
+        # Die Positionen stehen schon im Manifest aus Phase 1, daher kein erneuter Regex-Lauf.
+        replacements = []
+        for placeholder in self.md_manifest["placeholders"]:
+            path = final_mapping.get(placeholder["id"])
+            link = f"![Extrahiertes Bild]({path})" if path else ""
+            replacements.append((placeholder["start"], placeholder["end"], link))
 
-        final_md = re.sub(r"<!-- image -->", replace_logic, self.md_content)
+        final_md = replace_spans(self.md_content.encode("utf-8"), replacements)
 
         output_file = self.output_dir / f"{self.pdf_path.stem}_mapped.md"
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(final_md)
+        write_document(output_file, final_md, build_manifest(final_md.decode("utf-8")))
         
         # Temp-Ordner aufräumen
         if self.temp_image_dir.exists():
@@ -121,7 +339,8 @@ class PdfProcessor:
 
 def run_cli():
     pdf_filename = input("Filename (e.g. pas.pdf): ") or "pas.pdf"
-    processor = PdfProcessor(pdf_filename)
+    force_full = input("Volle Pipeline (Tabellen + OCR) auf allen Seiten erzwingen? (j/N): ").strip().lower() == "j"
+    processor = PdfProcessor(pdf_filename, force_full_pipeline=force_full)
     
     # Phase 1
     temp_dir, count = processor.process_phase_1()
@@ -132,11 +351,19 @@ def run_cli():
     print(f"\n--- REVIEW BENÖTIGT ---")
     print(f"Ich habe {count} Bilder extrahiert.")
     print(f"Bitte öffne den Ordner: {temp_dir.absolute()}")
+
+    suggestion = ", ".join(str(i) for i in sorted(processor.suggested_deletions))
+    if suggestion:
+        print(f"Automatisch als Junk erkannt: {suggestion}")
+    if processor.uncertain_indices:
+        print(f"Bitte besonders prüfen (unsicher): {', '.join(str(i) for i in processor.uncertain_indices)}")
     
-    exclude_input = input("\nWelche Bild-Nummern sollen ENTFERNT werden? (z.B. '1, 4, 7'): ")
+    exclude_input = input("\nWelche Bild-Nummern sollen ENTFERNT werden? (z.B. '1, 4, 7', Enter = Vorschlag übernehmen, '-' = keine): ")
     
     exclude_indices = []
-    if exclude_input.strip():
+    if not exclude_input.strip():
+        exclude_indices = sorted(processor.suggested_deletions)
+    elif exclude_input.strip() != "-":
         exclude_indices = [int(x.strip()) for x in exclude_input.split(",") if x.strip().isdigit()]
 
     # Phase 2
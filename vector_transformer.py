@@ -1,57 +1,254 @@
-import os
-from langchain_huggingface import HuggingFaceEmbeddings
+import re
+import time
+import random
 from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+from document_manifest import IMAGE_PATTERN
+from pipeline_metrics import span
+from ingest_writer import submit_batch, drain, batch_status
+from index_snapshots import current_snapshot
+# Embedding-Modell und Backend ("torch" oder int8-"onnx") liegen in embedding_backends.py
+from embedding_backends import EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, load_embeddings
 
-def update_or_create_vector_index(md_file_path, index_path="faiss_index"):
+HEADERS_TO_SPLIT_ON = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]
+# "\n![" bleibt Trennstelle, damit ein Bildlink mit seiner Beschreibung zusammen am Chunk-Anfang steht
+SPLIT_SEPARATORS = ["\n## ", "\n### ", "\n![", "\n\n", "\n"]
+
+# "tokens": Chunks passen in das Eingabefenster des Embedding-Modells (Rest würde abgeschnitten)
+# "chars":  alter Modus mit 1500 Zeichen pro Chunk (zum Vergleich)
+SPLIT_MODE = "tokens"
+CHAR_CHUNK_SIZE = 1500
+CHAR_CHUNK_OVERLAP = 200 # Etwas mehr Overlap, damit Bildpfade nicht am Rand "abgeschnitten" werden
+TOKEN_CHUNK_OVERLAP = 24
+DEFAULT_MAX_SEQ_LENGTH = 128 # MiniLM-L12: alles nach 128 Word-Pieces wird beim Embedding ignoriert
+EMBED_BATCH_SIZE = 64 # Chunks pro Embedding-Aufruf (für Fortschritt/Rate, Ergebnis ist identisch)
+# Bildbeschreibungen stehen als "> [KI-ANALYSE: Fenster: ...\nWorkflow: ...]" hinter dem Bildlink;
+# nur die erste Zeile trägt das ">", die Klammer bleibt über mehrere Chunks offen
+ANALYSIS_BRACKETS = re.compile(r"\[KI-ANALYSE|[\[\]]")
+
+
+def embedding_tokenizer(embeddings):
+    """Returns (tokenizer, max_seq_length) of the model behind the embeddings (torch or ONNX backend)."""
+    client = getattr(embeddings, "_client", None) or getattr(embeddings, "client", None) or embeddings
+    tokenizer = getattr(client, "tokenizer", None)
+    max_len = getattr(client, "max_seq_length", None) or DEFAULT_MAX_SEQ_LENGTH
+    if tokenizer is None:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+    return tokenizer, max_len
+
+
+def build_text_splitter(split_mode=SPLIT_MODE, embeddings=None, chunk_size=None):
+    """chunk_size overrides the mode's default (characters resp. tokens, capped at the model limit)."""
+    if split_mode == "chars":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size or CHAR_CHUNK_SIZE,
+            chunk_overlap=min(CHAR_CHUNK_OVERLAP, (chunk_size or CHAR_CHUNK_SIZE) // 4),
+            separators=SPLIT_SEPARATORS
+        )
+    if split_mode != "tokens":
+        raise ValueError(f"Unknown split mode '{split_mode}' (tokens|chars)")
+
+    tokenizer, max_len = embedding_tokenizer(embeddings or load_embeddings())
+    size = min(chunk_size or max_len - 2, max_len - 2)
+    # [CLS]/[SEP] zählen mit; lange KI-Analysen in einer Zeile werden notfalls an Satz-/Wortgrenzen geteilt
+    return RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        tokenizer,
+        chunk_size=size,
+        chunk_overlap=min(TOKEN_CHUNK_OVERLAP, size // 4), # kleine Chunks (--chunking tokens:16) wie bei "chars"
+        separators=SPLIT_SEPARATORS + [". ", " "]
+    )
+
+
+def analysis_open_at_end(text, open_at_start=False):
+    """
+    True if a "> [KI-ANALYSE ...]" block is still unclosed at the end of text. Brackets inside the
+    description ("[Feldname]") are counted; a marker always starts a fresh block, so chunk overlap
+    that repeats the marker does not nest.
+    """
+    depth = 1 if open_at_start else 0
+    for m in ANALYSIS_BRACKETS.finditer(text):
+        if m.group() != "[" and m.group() != "]":
+            depth = 1
+        elif depth:
+            depth += 1 if m.group() == "[" else -1
+    return depth > 0
+
+
+def attach_image_metadata(splits):
+    """
+    Stores the image paths of every chunk in metadata["images"], so the chatbot can show
+    screenshots without the LLM repeating paths. A chunk that starts inside an image
+    description (an unclosed "> [KI-ANALYSE ..." block) also belongs to the image before it.
+    """
+    last_image, last_headers, in_analysis = None, None, False
+    for doc in splits:
+        headers = tuple(doc.metadata.get(name) for _, name in HEADERS_TO_SPLIT_ON)
+        if headers != last_headers:
+            last_image, last_headers, in_analysis = None, headers, False
+        images = [m.group(2) for m in IMAGE_PATTERN.finditer(doc.page_content)]
+        continuation = in_analysis or doc.page_content.lstrip().startswith((">", "KI-ANALYSE"))
+        if last_image and continuation and last_image not in images:
+            images = [last_image] + images
+        if images:
+            last_image = images[-1]
+        else:
+            last_image = None
+        in_analysis = analysis_open_at_end(doc.page_content, in_analysis)
+        doc.metadata["images"] = images
+    return splits
+
+
+def split_markdown(md_text, split_mode=SPLIT_MODE, embeddings=None, chunk_size=None):
+    """Header split (metadata "Header 1..3") followed by the size split of the chosen mode."""
+    markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS_TO_SPLIT_ON)
+    md_header_splits = markdown_splitter.split_text(md_text)
+    splits = build_text_splitter(split_mode, embeddings, chunk_size).split_documents(md_header_splits)
+    return attach_image_metadata(splits)
+
+
+def embed_chunks(splits, embeddings, progress_callback=None, batch_size=EMBED_BATCH_SIZE):
+    """Embeds the chunk texts batch by batch -> (texts, vectors); reports progress per batch."""
+    texts = [doc.page_content for doc in splits]
+    vectors = []
+    with span("embed", unit="chunks", items=len(texts)):
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+            if progress_callback:
+                progress_callback(len(vectors), len(texts), "chunks embedded")
+    return texts, vectors
+
+
+def update_or_create_vector_index(md_file_path, index_path="faiss_index", split_mode=SPLIT_MODE,
+                                  progress_callback=None, embedding_backend=EMBEDDING_BACKEND):
+    """
+    progress_callback(current, total, message) is called after every embedded batch.
+    embedding_backend: "torch" or "onnx" (see embedding_backends.py).
+    Returns the id of a published snapshot that contains the chunks, or None if another writer
+    (service or parallel ingest) still has to apply them. Raises RuntimeError if the batch was rejected.
+    """
     print(f"--- Verarbeite: {md_file_path} ---")
-    
+
     # 1. Datei einlesen
     with open(md_file_path, "r", encoding="utf-8") as f:
         md_text = f.read()
 
-    # 2. Splitting (dein bewährter Workflow)
-    headers_to_split_on = [("#", "Header 1"), ("##", "Header 2"), ("###", "Header 3")]
-    markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers_to_split_on)
-    md_header_splits = markdown_splitter.split_text(md_text)
+    # 2. Embeddings initialisieren (der Tokenizer bestimmt auch die Chunk-Größe)
+    with span("embeddings.load", backend=embedding_backend):
+        embeddings = load_embeddings(embedding_backend)
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1500, 
-        chunk_overlap=200, # Etwas mehr Overlap, damit Bildpfade nicht am Rand "abgeschnitten" werden
-        separators=["\n## ", "\n### ", "\n![", "\n\n", "\n"] 
-    )
-    splits = text_splitter.split_documents(md_header_splits)
-
-    # 3. Embeddings initialisieren
-    model_name = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    embeddings = HuggingFaceEmbeddings(model_name=model_name)
-
-    # 4. Logik: Erweitern oder Neu erstellen
-    if os.path.exists(index_path):
-        print(f"Bestehender Index gefunden. Füge {len(splits)} Chunks hinzu...")
-        # Index laden
-        # WICHTIG: allow_dangerous_deserialization=True ist bei lokalem FAISS Pflicht
-        vector_db = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-        # Neue Dokumente hinzufügen
-        vector_db.add_documents(splits)
-    else:
-        print(f"Kein Index unter '{index_path}' gefunden. Erstelle neuen Index...")
-        vector_db = FAISS.from_documents(splits, embeddings)
+    # 3. Splitting (dein bewährter Workflow, Chunk-Größe passend zum Embedding-Modell)
+    with span("split", unit="chunks") as attrs:
+        splits = split_markdown(md_text, split_mode, embeddings)
+        attrs["items"] = len(splits)
+    texts, vectors = embed_chunks(splits, embeddings, progress_callback)
+    metadatas = [doc.metadata for doc in splits]
+
+    # 4. Als Batch ins Ingest-Log; den Index ändert nur der eine Writer (ingest_writer.py), damit parallele
+    #    Ingests sich nicht gegenseitig überschreiben. Läuft kein Writer-Dienst, übernimmt dieser Prozess.
+    batch_id = submit_batch(index_path, texts, vectors, metadatas, source=md_file_path)
+    drain(index_path, embeddings)
+    # drain() meldet den Stand des Index, nicht ob gerade dieser Batch darin ist (abgelehnt, anderer Writer)
+    status = batch_status(index_path, batch_id)
+    if status == "published":
+        snapshot_id = current_snapshot(index_path)
+        print(f"--- Index erfolgreich aktualisiert unter '{index_path}' (Snapshot {snapshot_id}) ---")
+        return snapshot_id
+    if status == "pending":
+        print(f"--- Batch {batch_id[:12]} übergeben; der Writer, der den Index gerade hält, veröffentlicht ihn ---")
+        return None
+    raise RuntimeError(f"Batch {batch_id[:12]} wurde nicht in den Index übernommen "
+                       f"(siehe {index_path}/ingest/rejected/ und die Ausgabe des Writers)")
+
+
+def sample_probe_sentences(md_text, count=200, min_chars=40, seed=0):
+    """Text lines of the document used as self-retrieval queries (no golden set needed)."""
+    lines = [line.strip() for line in md_text.splitlines()
+             if len(line.strip()) >= min_chars and not line.lstrip().startswith(("#", "!["))]
+    random.Random(seed).shuffle(lines)
+    return lines[:count]
+
+
+def measure_split_modes(md_file_path, modes=("chars", "tokens"), k=5, queries=None,
+                        embedding_backend=EMBEDDING_BACKEND):
+    """
+    Compares split modes on one document: split/embedding throughput, share of text the model
+    never sees (beyond max_seq_length), and recall@k. queries: list of (query, expected text);
+    default are lines of the document itself, a hit is a retrieved chunk containing their start.
+    """
+    with open(md_file_path, "r", encoding="utf-8") as f:
+        md_text = f.read()
+    embeddings = load_embeddings(embedding_backend)
+    tokenizer, max_len = embedding_tokenizer(embeddings)
+    if queries is None:
+        queries = [(s, s[:60]) for s in sample_probe_sentences(md_text)]
+    query_vectors = embeddings.embed_documents([q for q, _ in queries]) if queries else []
+
+    results = {}
+    for mode in modes:
+        start = time.perf_counter()
+        splits = split_markdown(md_text, mode, embeddings)
+        split_s = time.perf_counter() - start
+
+        texts = [doc.page_content for doc in splits]
+        token_counts = [len(tokenizer.encode(t)) for t in texts]
+        start = time.perf_counter()
+        vectors = embeddings.embed_documents(texts)
+        embed_s = time.perf_counter() - start
+
+        vector_db = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings,
+                                          metadatas=[doc.metadata for doc in splits])
+        hits = 0
+        for (query, expected), vector in zip(queries, query_vectors):
+            docs = vector_db.similarity_search_by_vector(vector, k=k)
+            if any(expected in doc.page_content for doc in docs):
+                hits += 1
+
+        total_tokens = sum(token_counts)
+        results[mode] = {
+            "chunks": len(splits),
+            "split_s": round(split_s, 3),
+            "embed_s": round(embed_s, 3),
+            "chunks_per_s": round(len(splits) / embed_s, 1) if embed_s else None,
+            "chars_per_s": round(sum(len(t) for t in texts) / embed_s) if embed_s else None,
+            "avg_tokens": round(total_tokens / max(1, len(splits)), 1),
+            "truncated_token_share": round(sum(max(0, c - max_len) for c in token_counts) / max(1, total_tokens), 3),
+            f"recall@{k}": round(hits / len(queries), 3) if queries else None,
+            "queries": len(queries),
+        }
+        print(f"{mode:6s}: {results[mode]}")
+    return results
 
-    # 5. Speichern (überschreibt jetzt den Ordner mit dem aktualisierten Stand)
-    vector_db.save_local(index_path)
-    print(f"--- Index erfolgreich aktualisiert unter '{index_path}' ---")
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Update Vector Index with Markdown content")
     parser.add_argument("file", nargs="?", help="Path to the enriched Markdown file")
-    
+    parser.add_argument("--split-mode", choices=["tokens", "chars"], default=SPLIT_MODE,
+                        help="tokens = chunks sized to the embedding model, chars = old 1500-char chunks")
+    parser.add_argument("--measure", action="store_true",
+                        help="compare both split modes (throughput, truncation, recall) instead of indexing")
+    parser.add_argument("--memory-profile", metavar="REPORT",
+                        help="profile memory per stage (split, embed, FAISS) and write the report as JSON")
+    parser.add_argument("--embedding-backend", choices=["torch", "onnx"], default=EMBEDDING_BACKEND,
+                        help="onnx = int8-quantized model in onnxruntime (CPU servers)")
+
     args = parser.parse_args()
-    
-    if args.file:
-        update_or_create_vector_index(args.file)
+
+    if args.file and args.measure:
+        measure_split_modes(args.file, embedding_backend=args.embedding_backend)
+    elif args.file and args.memory_profile:
+        from memory_profiling import MemoryProfiler, format_report, write_report
+        with MemoryProfiler() as profiler:
+            update_or_create_vector_index(args.file, split_mode=args.split_mode,
+                                          embedding_backend=args.embedding_backend)
+        print(format_report(profiler.report()))
+        write_report(profiler.report(), args.memory_profile)
+    elif args.file:
+        update_or_create_vector_index(args.file, split_mode=args.split_mode,
+                                      embedding_backend=args.embedding_backend)
     else:
-        print("Usage: python vector_transformer.py <path_to_markdown>")
+        print("Usage: python vector_transformer.py <path_to_markdown> [--split-mode tokens|chars] [--measure] "
+              "[--embedding-backend torch|onnx]")
         # Fallback debug if needed, or just exit cleanly
-        # update_or_create_vector_index("extracted_data/charly_mapped_enriched.md")
\ No newline at end of file
+        # update_or_create_vector_index("extracted_data/charly_mapped_enriched.md")
@@ -0,0 +1,206 @@
+import time
+import requests
+from abc import ABC, abstractmethod
+from email.utils import parsedate_to_datetime
+from ollama_settings import OLLAMA_CHAT_URL, VISION_MODEL_NAME, OLLAMA_NUM_PARALLEL
+
+# Austauschbare Backends für die Bildanalyse. Prompt und Antwortformat sind für alle gleich,
+# die Requests kommen im OpenAI-Content-Format (Text-Teile + image_url-Teile mit Data-URL).
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_VISION_MODEL = "gpt-5-nano-2025-08-07" # Updated to a widely available vision model
+OPENAI_MAX_WORKERS = 4
+MAX_IMAGES_PER_REQUEST = 6 # Obergrenze für kapitelweise gebündelte Anfragen
+# (Verbindungsaufbau, Antwort) in Sekunden; ohne Timeout blockiert eine hängende Verbindung den ganzen Lauf
+OPENAI_TIMEOUT = (10, 120)
+OLLAMA_TIMEOUT = (10, 300) # lokale Vision-Modelle brauchen pro Bild gern eine Minute und mehr
+
+
+class VisionRequestError(Exception):
+    """HTTP error of a vision backend; status and Retry-After decide whether a retry makes sense."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class VisionBackend(ABC):
+    """Interface of a vision backend: describe(content) -> answer text."""
+    name = "base"
+    image_format = None            # None = Standardformat aus vision_payload
+    max_workers = 1                # parallele Requests, die das Backend sinnvoll verarbeitet
+    max_images_per_request = MAX_IMAGES_PER_REQUEST
+
+    @abstractmethod
+    def describe(self, content):
+        ...
+
+    @abstractmethod
+    def build_request_body(self, content):
+        ...
+
+
+class OpenAIVisionBackend(VisionBackend):
+    name = "openai"
+
+    def __init__(self, api_key=None, model=OPENAI_VISION_MODEL, url=OPENAI_CHAT_URL, max_workers=OPENAI_MAX_WORKERS,
+                 timeout=OPENAI_TIMEOUT):
+        self.api_key = api_key
+        self.model = model
+        self.url = url
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def build_request_body(self, content):
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ]
+        }
+
+    def describe(self, content):
+        if not self.api_key or self.api_key == "Your_API_KEY":
+            raise ValueError("Missing OpenAI API Key")
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        response = requests.post(self.url, headers=headers, json=self.build_request_body(content), timeout=self.timeout)
+        if response.status_code != 200:
+            raise http_error("API Error", response)
+        return answer_text(response.json())
+
+
+class OllamaVisionBackend(VisionBackend):
+    name = "ollama"
+    # Ollama dekodiert PNG/JPEG zuverlässig, WEBP nicht bei allen Modellen
+    image_format = "JPEG"
+    # Lokale VLMs verwechseln bei mehreren Bildern pro Request gern die Zuordnung
+    max_images_per_request = 1
+
+    def __init__(self, model=VISION_MODEL_NAME, url=OLLAMA_CHAT_URL, max_workers=OLLAMA_NUM_PARALLEL,
+                 timeout=OLLAMA_TIMEOUT):
+        self.model = model
+        self.url = url
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    def build_request_body(self, content):
+        # Ollama erwartet den Text als String und die Bilder als reine Base64-Liste (in Reihenfolge)
+        texts, images = [], []
+        for part in content:
+            if part["type"] == "text":
+                texts.append(part["text"])
+            elif part["type"] == "image_url":
+                images.append(part["image_url"]["url"].split(",", 1)[1])
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": "\n".join(texts), "images": images}],
+            "stream": False,
+        }
+
+    def describe(self, content):
+        response = requests.post(self.url, json=self.build_request_body(content), timeout=self.timeout)
+        if response.status_code != 200:
+            raise http_error("Ollama Error", response)
+        return response.json()["message"]["content"]
+
+
+VISION_BACKENDS = {
+    "openai": OpenAIVisionBackend,
+    "ollama": OllamaVisionBackend,
+}
+
+
+def parse_retry_after(headers):
+    """Seconds to wait from Retry-After / retry-after-ms headers, or None."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def http_error(prefix, response):
+    return VisionRequestError(f"{prefix}: {response.text}", status=response.status_code,
+                              retry_after=parse_retry_after(response.headers))
+
+
+def answer_text(completion):
+    """Answer text of an OpenAI chat completion response body."""
+    return completion['choices'][0]['message']['content']
+
+
+def make_backend(name="openai", api_key=None, **kwargs):
+    if name not in VISION_BACKENDS:
+        raise ValueError(f"Unknown vision backend '{name}' (available: {', '.join(VISION_BACKENDS)})")
+    if name == "openai":
+        return OpenAIVisionBackend(api_key=api_key, **kwargs)
+    return VISION_BACKENDS[name](**kwargs)
+
+
+def selfcheck(delay=0.2):
+    """
+    Runs enrich_file once per backend against local stub servers and checks that
+    both produce the same enriched markdown (backends are interchangeable) and that
+    requests really run in parallel. Returns True on success.
+    """
+    import tempfile
+    from pathlib import Path
+    from PIL import Image
+    from stub_servers import StubServer
+    from image_to_information import enrich_file
+
+    with tempfile.TemporaryDirectory() as tmp, StubServer(delay=delay) as stub:
+        tmp = Path(tmp)
+        (tmp / "images").mkdir()
+        lines = ["# Kapitel 1", "Klicken Sie auf Speichern."]
+        for n in range(1, 5):
+            Image.new("RGB", (320, 200), (255, 255, 255)).save(tmp / "images" / f"diagramm_{n}.png")
+            lines.append(f"![Bild](images/diagramm_{n}.png)")
+        (tmp / "selfcheck_mapped.md").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+        backends = [
+            OpenAIVisionBackend(api_key="stub", url=f"{stub.base_url}/v1/chat/completions", max_workers=2),
+            OllamaVisionBackend(url=f"{stub.base_url}/api/chat", max_workers=2),
+        ]
+        outputs = {}
+        for backend in backends:
+            stub.max_in_flight = 0
+            for group_by_chapter in (False, True):
+                out = enrich_file(tmp / "selfcheck_mapped.md", backend=backend, group_by_chapter=group_by_chapter)
+                outputs[(backend.name, group_by_chapter)] = Path(out).read_text(encoding="utf-8")
+            print(f"{backend.name}: max. {stub.max_in_flight} parallele Requests")
+            if stub.max_in_flight < 2:
+                print(f"FEHLER: {backend.name} hat nicht parallel angefragt")
+                return False
+
+    texts = set(outputs.values())
+    ok = len(texts) == 1 and all(text.count("KI-ANALYSE: ") == 4 for text in texts)
+    print("Selfcheck OK: Backends austauschbar" if ok else "FEHLER: Backends liefern unterschiedliche Ergebnisse")
+    return ok
+
+
+if __name__ == "__main__":
+    import sys
+    # Über den Modulnamen importieren, damit Klassen/Exceptions dieselben sind wie in image_to_information
+    from vision_backends import selfcheck as module_selfcheck
+    sys.exit(0 if module_selfcheck() else 1)
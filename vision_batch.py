@@ -0,0 +1,220 @@
+import sys
+import json
+import hashlib
+import argparse
+import requests
+from pathlib import Path
+from document_manifest import load_document, apply_insertions, write_document, CONTEXT_TOKEN_BUDGET
+from vision_payload import prepare_image_payload, PayloadStats
+from vision_backends import answer_text
+from image_to_information import (plan_image_jobs, build_single_content, build_vision_prompt,
+                                  build_request_body, OPENAI_API_KEY, VISION_MODEL)
+
+# Offline-Modus für die Bildanalyse über die OpenAI Batch API:
+# 1. export  -> <stem>.batch.jsonl (ein Request pro Bild, Bilder eingebettet)
+# 2. submit  -> Datei hochladen + Batch starten (oder JSONL anderweitig verarbeiten lassen)
+# 3. import  -> Ergebnis-JSONL in <stem>_enriched.md einfügen, ohne einen einzigen Live-Request
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+
+def batch_job_path(md_path):
+    md_path = Path(md_path)
+    return md_path.parent / f"{md_path.stem}.batch.jsonl"
+
+
+def job_custom_id(job):
+    """
+    Stable id of one image request: image number plus a hash over image path, image bytes
+    and prompt. An unchanged document gives the same ids on every export; results for
+    an image whose file or context changed in between are not matched.
+    """
+    digest = hashlib.sha1()
+    digest.update(job["image"]["path"].encode("utf-8"))
+    digest.update(Path(job["path"]).read_bytes())
+    digest.update(build_vision_prompt(job["heading"], job["context"]).encode("utf-8"))
+    digest.update(VISION_MODEL.encode("utf-8"))
+    return f"bild-{job['image']['id']:05d}-{digest.hexdigest()[:16]}"
+
+
+def plan_batch(md_path, context_tokens=CONTEXT_TOKEN_BUDGET):
+    """Returns (md_bytes, manifest, jobs, missing) with a "custom_id" on every job."""
+    md_path = Path(md_path)
+    md_bytes, manifest = load_document(md_path)
+    jobs, missing = plan_image_jobs(manifest, md_path.parent, context_tokens)
+    for job in jobs:
+        job["custom_id"] = job_custom_id(job)
+    return md_bytes, manifest, jobs, missing
+
+
+def export_batch_jobs(md_path, output_path=None, context_tokens=CONTEXT_TOKEN_BUDGET):
+    """Writes the batch job file (one chat completion per image). Returns (path, job count, PayloadStats)."""
+    output_path = Path(output_path) if output_path else batch_job_path(md_path)
+    _, _, jobs, missing = plan_batch(md_path, context_tokens)
+    for image in missing:
+        print(f"Überspringe fehlendes Bild: {image['path']}")
+
+    payload_stats = PayloadStats()
+    with open(output_path, "w", encoding="utf-8") as f:
+        for job in jobs:
+            image_payload = prepare_image_payload(job["path"])
+            payload_stats.add(image_payload)
+            line = {
+                "custom_id": job["custom_id"],
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": build_request_body(build_single_content(job, image_payload)),
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    print(f"--- {len(jobs)} Batch-Jobs geschrieben: {output_path} ({payload_stats.summary()}) ---")
+    return output_path, len(jobs), payload_stats
+
+
+def read_batch_results(results_path):
+    """
+    Parses a batch output file -> {custom_id: (ok, text)}.
+    Accepts the OpenAI batch output format ({"custom_id", "response": {"status_code", "body"}, "error"}).
+    """
+    results = {}
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                print(f"Zeile {line_no}: kein gültiges JSON, übersprungen")
+                continue
+            custom_id = entry.get("custom_id")
+            response = entry.get("response") or {}
+            error = entry.get("error")
+            if error or response.get("status_code", 200) != 200:
+                message = (error or {}).get("message") if isinstance(error, dict) else error
+                results[custom_id] = (False, message or f"HTTP {response.get('status_code')}: {response.get('body')}")
+                continue
+            try:
+                results[custom_id] = (True, answer_text(response["body"]))
+            except (KeyError, IndexError, TypeError):
+                results[custom_id] = (False, "Unerwartetes Antwortformat")
+    return results
+
+
+def import_batch_results(md_path, results_path, progress_callback=None, context_tokens=CONTEXT_TOKEN_BUDGET):
+    """
+    Merges a batch results file into <stem>_enriched.md, exactly like enrich_file would.
+    Returns (output path, {"applied", "failed", "missing"}).
+    """
+    input_path = Path(md_path)
+    md_bytes, manifest, jobs, _ = plan_batch(input_path, context_tokens)
+    results = read_batch_results(results_path)
+    known_ids = {job["custom_id"] for job in jobs}
+    unknown = [cid for cid in results if cid not in known_ids]
+    if unknown:
+        print(f"{len(unknown)} Ergebnisse passen zu keinem Bild (Dokument/Bild seit dem Export geändert?)")
+
+    counts = {"applied": 0, "failed": 0, "missing": 0}
+    insertions = []
+    for i, job in enumerate(jobs, 1):
+        ok, text = results.get(job["custom_id"], (False, "kein Batch-Ergebnis"))
+        if ok:
+            counts["applied"] += 1
+            description = f"KI-ANALYSE: {text.strip()}"
+        else:
+            counts["failed" if job["custom_id"] in results else "missing"] += 1
+            description = f"KI-ANALYSE fehlgeschlagen: {text}"
+        insertions.append((job["image"]["insert_at"], f"\n> [{description}]\n\n"))
+        if progress_callback:
+            progress_callback(i, len(jobs), f"Merged {job['image']['path']}")
+
+    enriched_bytes, enriched_manifest = apply_insertions(md_bytes, manifest, insertions)
+    output_path = input_path.parent / f"{input_path.stem}_enriched.md"
+    write_document(output_path, enriched_bytes, enriched_manifest)
+    print(f"--- Batch-Ergebnisse eingefügt: {output_path} ({counts}) ---")
+    return str(output_path), counts
+
+
+# --- OpenAI Batch API (optional, nur Upload/Status/Download) ---
+
+def _auth_headers(api_key=None):
+    key_to_use = api_key if api_key else OPENAI_API_KEY
+    if not key_to_use or key_to_use == "Your_API_KEY":
+        raise ValueError("Missing OpenAI API Key")
+    return {"Authorization": f"Bearer {key_to_use}"}
+
+
+def submit_batch(jobs_path, api_key=None):
+    """Uploads the job file and starts a batch. Returns the batch id."""
+    headers = _auth_headers(api_key)
+    with open(jobs_path, "rb") as f:
+        upload = requests.post(f"{OPENAI_BASE_URL}/files", headers=headers,
+                               files={"file": (Path(jobs_path).name, f)}, data={"purpose": "batch"}, timeout=300)
+    if upload.status_code != 200:
+        raise Exception(f"Upload Error: {upload.text}")
+
+    batch = requests.post(f"{OPENAI_BASE_URL}/batches", headers=headers, timeout=60, json={
+        "input_file_id": upload.json()["id"],
+        "endpoint": BATCH_ENDPOINT,
+        "completion_window": BATCH_COMPLETION_WINDOW,
+    })
+    if batch.status_code != 200:
+        raise Exception(f"Batch Error: {batch.text}")
+    return batch.json()["id"]
+
+
+def batch_status(batch_id, api_key=None):
+    response = requests.get(f"{OPENAI_BASE_URL}/batches/{batch_id}", headers=_auth_headers(api_key), timeout=60)
+    if response.status_code != 200:
+        raise Exception(f"Batch Error: {response.text}")
+    return response.json()
+
+
+def download_batch_results(batch_id, output_path, api_key=None):
+    """Saves the output file of a finished batch. Returns the path or None if not finished yet."""
+    status = batch_status(batch_id, api_key)
+    if status.get("status") != "completed" or not status.get("output_file_id"):
+        print(f"Batch {batch_id}: {status.get('status')} {status.get('request_counts')}")
+        return None
+    response = requests.get(f"{OPENAI_BASE_URL}/files/{status['output_file_id']}/content",
+                            headers=_auth_headers(api_key), timeout=300)
+    if response.status_code != 200:
+        raise Exception(f"Download Error: {response.text}")
+    Path(output_path).write_bytes(response.content)
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vision enrichment as an offline batch job")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="write the batch job JSONL for a _mapped.md file")
+    p_export.add_argument("md_file")
+    p_export.add_argument("--out")
+
+    p_submit = sub.add_parser("submit", help="upload a job file and start an OpenAI batch")
+    p_submit.add_argument("jobs_file")
+
+    p_fetch = sub.add_parser("fetch", help="download the results of a finished batch")
+    p_fetch.add_argument("batch_id")
+    p_fetch.add_argument("out")
+
+    p_import = sub.add_parser("import", help="merge a results JSONL into <stem>_enriched.md")
+    p_import.add_argument("md_file")
+    p_import.add_argument("results_file")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        export_batch_jobs(args.md_file, args.out)
+    elif args.command == "submit":
+        print(f"Batch gestartet: {submit_batch(args.jobs_file)}")
+    elif args.command == "fetch":
+        if download_batch_results(args.batch_id, args.out) is None:
+            return 1
+    elif args.command == "import":
+        import_batch_results(args.md_file, args.results_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import io
+import math
+import base64
+import threading
+from PIL import Image, features
+
+# Vorverarbeitung der Screenshots vor dem Upload an die Vision-API.
+# Die API skaliert "high"-Bilder ohnehin auf max. 2048x2048 und dann die kurze Seite auf 768 px,
+# alles darüber sind nur verschwendete Upload-Bytes. Die docling-Crops sind 2x skaliert, 1024 px
+# lange Kante entspricht bei ganzseitigen Screenshots etwa der Originalauflösung.
+MAX_LONG_EDGE = 1024
+MAX_SHORT_EDGE = 768
+LOW_DETAIL_MAX_EDGE = 512     # kleine Bilder verlieren mit detail="low" nichts, kosten aber nur 85 Tokens
+TILE_TALL_SCREENSHOTS = False # Kacheln verbessert die Lesbarkeit langer Screenshots, kostet aber mehr Tokens
+TILE_ASPECT = 2.5             # ab diesem Höhe/Breite-Verhältnis wird ein Screenshot gekachelt
+TILE_OVERLAP = 0.05           # Überlappung der Kacheln, damit keine Textzeile durchgeschnitten wird
+IMAGE_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+IMAGE_QUALITY = 85
+
+# Token-Schätzung nach dem OpenAI-Kachelmodell (512er Kacheln)
+BASE_IMAGE_TOKENS = 85
+TOKENS_PER_TILE = 170
+
+
+def estimate_image_tokens(width, height, detail="high"):
+    """Estimated vision tokens for one image as the API bills it (tile model)."""
+    if detail == "low":
+        return BASE_IMAGE_TOKENS
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, MAX_SHORT_EDGE / min(width, height))
+    width, height = width * scale, height * scale
+    return BASE_IMAGE_TOKENS + TOKENS_PER_TILE * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _fit(img, max_long_edge, max_short_edge):
+    scale = min(1.0, max_long_edge / max(img.width, img.height), max_short_edge / min(img.width, img.height))
+    if scale >= 1.0:
+        return img
+    new_size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _split_tall(img):
+    """Splits very tall screenshots into roughly square tiles (top to bottom)."""
+    if img.height / img.width < TILE_ASPECT:
+        return [img]
+    tile_h = img.width
+    step = int(tile_h * (1 - TILE_OVERLAP))
+    tiles, top = [], 0
+    while top < img.height:
+        bottom = min(img.height, top + tile_h)
+        tiles.append(img.crop((0, top, img.width, bottom)))
+        if bottom == img.height:
+            break
+        top += step
+    return tiles
+
+
+def estimate_payload_tokens(image_path, max_long_edge=MAX_LONG_EDGE, tile_tall=TILE_TALL_SCREENSHOTS):
+    """
+    Vision tokens prepare_image_payload would send for this image, without decoding or
+    encoding it (only the header is read). Used for dry-run estimates.
+    """
+    with Image.open(image_path) as img:
+        width, height = img.size
+    tiles = [(width, height)]
+    if tile_tall and height / width >= TILE_ASPECT:
+        # gleiche Aufteilung wie _split_tall, nur auf den Maßen
+        tiles, top, step = [], 0, int(width * (1 - TILE_OVERLAP))
+        while top < height:
+            bottom = min(height, top + width)
+            tiles.append((width, bottom - top))
+            if bottom == height:
+                break
+            top += step
+    tokens = 0
+    for tile_w, tile_h in tiles:
+        scale = min(1.0, max_long_edge / max(tile_w, tile_h), MAX_SHORT_EDGE / min(tile_w, tile_h))
+        tile_w, tile_h = max(1, round(tile_w * scale)), max(1, round(tile_h * scale))
+        detail = "low" if max(tile_w, tile_h) <= LOW_DETAIL_MAX_EDGE else "high"
+        tokens += estimate_image_tokens(tile_w, tile_h, detail)
+    return tokens
+
+
+def _encode(img, image_format, quality):
+    if image_format != "PNG" and img.mode not in ("RGB", "L"):
+        # Transparenz auf weißen Hintergrund legen (JPEG/WEBP ohne Alpha sind kleiner);
+        # PNG behält Palette/Alpha, sonst wird die Ausweichkodierung größer als das Original
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        rgba = img.convert("RGBA")
+        background.paste(rgba, mask=rgba.split()[-1])
+        img = background
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def prepare_image_payload(image_path, max_long_edge=MAX_LONG_EDGE, image_format=IMAGE_FORMAT,
+                          quality=IMAGE_QUALITY, tile_tall=TILE_TALL_SCREENSHOTS, detail="auto"):
+    """
+    Resizes, optionally tiles and re-encodes one image for a vision request.
+
+    Returns {"parts": [{"url", "detail"}], "raw_bytes", "sent_bytes", "raw_tokens", "sent_tokens"};
+    raw_* describe what sending the original PNG would have cost.
+    """
+    with open(image_path, "rb") as f:
+        raw = f.read()
+    img = Image.open(io.BytesIO(raw))
+    img.load()
+    raw_tokens = estimate_image_tokens(img.width, img.height)
+
+    tiles = _split_tall(img) if tile_tall else [img]
+    parts, sent_bytes, sent_tokens = [], 0, 0
+    for tile in tiles:
+        tile = _fit(tile, max_long_edge, MAX_SHORT_EDGE)
+        tile_detail = detail
+        if detail == "auto":
+            tile_detail = "low" if max(tile.width, tile.height) <= LOW_DETAIL_MAX_EDGE else "high"
+
+        data, mime = _encode(tile, image_format, quality), image_format.lower()
+        if len(tiles) == 1 and tile is img:
+            if len(data) >= len(raw):
+                # Bereits kompaktes Original (z.B. kleines Icon) -> unverändert schicken
+                data, mime = raw, "png"
+        elif image_format != "PNG":
+            # Flächige UI-Grafiken sind als PNG manchmal kleiner als verlustbehaftet kodiert
+            png_data = _encode(tile, "PNG", quality)
+            if len(png_data) < len(data):
+                data, mime = png_data, "png"
+
+        parts.append({
+            "url": f"data:image/{mime};base64,{base64.b64encode(data).decode('utf-8')}",
+            "detail": tile_detail,
+        })
+        sent_bytes += len(data)
+        sent_tokens += estimate_image_tokens(tile.width, tile.height, tile_detail)
+
+    return {
+        "parts": parts,
+        "raw_bytes": len(raw),
+        "sent_bytes": sent_bytes,
+        "raw_tokens": raw_tokens,
+        "sent_tokens": sent_tokens,
+    }
+
+
+class PayloadStats:
+    """Collects the per-image savings of one enrichment run (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.tiles = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.raw_tokens = 0
+        self.sent_tokens = 0
+
+    def add(self, payload):
+        with self._lock:
+            self.images += 1
+            self.tiles += len(payload["parts"])
+            self.raw_bytes += payload["raw_bytes"]
+            self.sent_bytes += payload["sent_bytes"]
+            self.raw_tokens += payload["raw_tokens"]
+            self.sent_tokens += payload["sent_tokens"]
+
+    def as_dict(self):
+        return {
+            "images": self.images,
+            "tiles": self.tiles,
+            "raw_bytes": self.raw_bytes,
+            "sent_bytes": self.sent_bytes,
+            "bytes_saved": self.raw_bytes - self.sent_bytes,
+            "raw_tokens_est": self.raw_tokens,
+            "sent_tokens_est": self.sent_tokens,
+            "tokens_saved_est": self.raw_tokens - self.sent_tokens,
+        }
+
+    def summary(self):
+        if not self.images:
+            return "Keine Bilder gesendet."
+        byte_pct = 100 * (1 - self.sent_bytes / max(1, self.raw_bytes))
+        return (f"{self.images} Bilder ({self.tiles} Teile): "
+                f"{self.raw_bytes / 1e6:.1f} MB -> {self.sent_bytes / 1e6:.1f} MB ({byte_pct:.0f}% gespart), "
+                f"ca. {self.raw_tokens} -> {self.sent_tokens} Bild-Tokens")
@@ -0,0 +1,249 @@
+import time
+import random
+import threading
+import requests
+from vision_backends import VisionBackend, VisionRequestError
+
+# Retries, Backoff und Circuit Breaker für die Vision-Requests.
+# Ein einzelner 429/5xx oder Timeout soll nicht mehr dauerhaft "KI-ANALYSE fehlgeschlagen"
+# ins Handbuch schreiben, und ein ausgefallenes Backend soll nicht mit Requests geflutet werden.
+MAX_ATTEMPTS = 4
+BASE_DELAY = 1.0             # Sekunden, verdoppelt sich pro Versuch
+MAX_DELAY = 30.0
+MAX_RETRY_AFTER = 120.0      # längere Retry-After-Angaben werden gekappt
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0 # so lange pausieren alle Worker, wenn der Breaker offen ist
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def classify_error(error):
+    """Returns (kind, retryable, retry_after) for an exception raised by a backend."""
+    if isinstance(error, VisionRequestError):
+        status = error.status
+        if status == 429:
+            kind = "http_429"
+        elif status is not None and status >= 500:
+            kind = "http_5xx"
+        else:
+            kind = f"http_{status}"
+        return kind, status in RETRYABLE_STATUS, error.retry_after
+    if isinstance(error, requests.Timeout):
+        return "timeout", True, None
+    if isinstance(error, requests.ConnectionError):
+        return "connection", True, None
+    return "other", False, None
+
+
+def is_retryable(error):
+    return classify_error(error)[1]
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY,
+                 max_retry_after=MAX_RETRY_AFTER):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt, retry_after=None):
+        """Wait before the next attempt: Retry-After if the server sent one, else full-jitter backoff."""
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class ResilienceMetrics:
+    """Failure/retry counters of one enrichment run (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.successes = 0
+        self.retries = 0
+        self.failures = {}        # kind -> count (jeder fehlgeschlagene Versuch)
+        self.backoff_seconds = 0.0
+        self.paused_seconds = 0.0 # Wartezeit durch offenen Circuit Breaker
+        self.breaker_opened = 0
+        self.deferred = 0         # Bilder in der Nachhol-Runde am Ende
+        self.recovered = 0        # davon erfolgreich nachgeholt
+        self.final_failures = 0
+
+    def add(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def record_failure(self, kind):
+        with self._lock:
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "successes": self.successes,
+                "retries": self.retries,
+                "failures": dict(self.failures),
+                "backoff_seconds": round(self.backoff_seconds, 2),
+                "paused_seconds": round(self.paused_seconds, 2),
+                "breaker_opened": self.breaker_opened,
+                "deferred": self.deferred,
+                "recovered": self.recovered,
+                "final_failures": self.final_failures,
+            }
+
+    def summary(self):
+        d = self.as_dict()
+        failures = ", ".join(f"{k}: {v}" for k, v in sorted(d["failures"].items())) or "keine"
+        return (f"{d['requests']} Versuche, {d['retries']} Retries, Fehler ({failures}), "
+                f"Breaker {d['breaker_opened']}x offen, nachgeholt {d['recovered']}/{d['deferred']}, "
+                f"endgültig fehlgeschlagen: {d['final_failures']}")
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive retryable failures. While open, every
+    worker waits in acquire(); after reset_timeout one probe request is let through (half-open).
+    Success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT,
+                 metrics=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.metrics = metrics
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_running = False
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                if self.state == "closed":
+                    break
+                if self.state == "open":
+                    remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.state = "half_open"
+                        continue
+                    self._cond.wait(remaining)
+                    continue
+                if not self._probe_running:
+                    self._probe_running = True
+                    break
+                self._cond.wait()
+        waited = time.monotonic() - started
+        if self.metrics is not None and waited > 0.01:
+            self.metrics.add("paused_seconds", waited)
+
+    def record_success(self):
+        with self._cond:
+            self._failures = 0
+            self.state = "closed"
+            self._probe_running = False
+            self._cond.notify_all()
+
+    def record_failure(self):
+        with self._cond:
+            self._failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self._failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                if self.metrics is not None:
+                    self.metrics.add("breaker_opened")
+            self._probe_running = False
+            self._cond.notify_all()
+
+
+class ResilientBackend(VisionBackend):
+    """Wraps a VisionBackend with retries, backoff and a shared circuit breaker."""
+
+    def __init__(self, backend, policy=None, breaker=None, metrics=None):
+        self.backend = backend
+        self.metrics = metrics or ResilienceMetrics()
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(metrics=self.metrics)
+        self.name = backend.name
+        self.image_format = backend.image_format
+        self.max_workers = backend.max_workers
+        self.max_images_per_request = backend.max_images_per_request
+
+    def build_request_body(self, content):
+        return self.backend.build_request_body(content)
+
+    def describe(self, content):
+        for attempt in range(1, self.policy.max_attempts + 1):
+            self.breaker.acquire()
+            self.metrics.add("requests")
+            try:
+                answer = self.backend.describe(content)
+            except Exception as e:
+                kind, retryable, retry_after = classify_error(e)
+                self.metrics.record_failure(kind)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # Server antwortet (z.B. 400/401) -> kein Grund, die anderen Worker zu pausieren
+                    self.breaker.record_success()
+                if not retryable or attempt == self.policy.max_attempts:
+                    raise
+                delay = self.policy.delay(attempt, retry_after)
+                self.metrics.add("retries")
+                self.metrics.add("backoff_seconds", delay)
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                self.metrics.add("successes")
+                return answer
+
+
+def selfcheck():
+    """
+    Runs enrich_file against a stub server that fails the first requests (503, 429 with
+    Retry-After, a hanging request) and checks that every image still gets its analysis.
+    """
+    import tempfile
+    from pathlib import Path
+    from PIL import Image
+    from stub_servers import StubServer
+    from vision_backends import OpenAIVisionBackend
+    from image_to_information import enrich_file
+
+    # "hang" antwortet erst nach dem Read-Timeout des Clients -> requests.Timeout -> Retry
+    failures = [(503, None), ("hang", 1.0), (429, "0"), (500, None), (503, None), (502, None), (503, None)]
+    with tempfile.TemporaryDirectory() as tmp, StubServer(failures=failures) as stub:
+        tmp = Path(tmp)
+        (tmp / "images").mkdir()
+        lines = ["# Kapitel 1", "Klicken Sie auf Speichern."]
+        for n in range(1, 5):
+            Image.new("RGB", (320, 200), (255, 255, 255)).save(tmp / "images" / f"diagramm_{n}.png")
+            lines.append(f"![Bild](images/diagramm_{n}.png)")
+        (tmp / "selfcheck_mapped.md").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+        metrics = ResilienceMetrics()
+        backend = ResilientBackend(
+            OpenAIVisionBackend(api_key="stub", url=f"{stub.base_url}/v1/chat/completions", max_workers=2,
+                                timeout=(2, 0.3)),
+            policy=RetryPolicy(max_attempts=3, base_delay=0.05, max_delay=0.2),
+            breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.2, metrics=metrics),
+            metrics=metrics,
+        )
+        out = enrich_file(tmp / "selfcheck_mapped.md", backend=backend)
+        text = Path(out).read_text(encoding="utf-8")
+
+    stats = metrics.as_dict()
+    print(stats)
+    ok = (text.count("KI-ANALYSE: ") == 4 and stats["retries"] > 0 and stats["final_failures"] == 0
+          and stats["failures"].get("timeout", 0) > 0)
+    print("Selfcheck OK: transiente Fehler wurden nachgeholt" if ok else "FEHLER: Bilder ohne Analyse")
+    return ok
+
+
+if __name__ == "__main__":
+    import sys
+    # Über den Modulnamen importieren, damit Klassen/Exceptions dieselben sind wie in image_to_information
+    from vision_resilience import selfcheck as module_selfcheck
+    sys.exit(0 if module_selfcheck() else 1)